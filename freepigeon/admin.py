@@ -11,4 +11,5 @@ admin.site.register(Pedido)
 admin.site.register(Carrinho)
 admin.site.register(CarrinhoProduto)
 admin.site.register(Endereco)
-admin.site.register(PedidoProduto)
\ No newline at end of file
+admin.site.register(PedidoProduto)
+admin.site.register(Tarefa)
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class FreepigeonConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'freepigeon'
+
+    def ready(self):
+        # registra os signals que mantêm o índice de busca
+        from . import busca  # noqa: F401
+        # e os que invalidam o cache do usuário logado e do catálogo
+        from . import sessao  # noqa: F401
+        from . import catalogo  # noqa: F401
+        # e os que mantêm a ficha técnica (Produto.ficha)
+        from . import atributos  # noqa: F401
@@ -0,0 +1,132 @@
+# freepigeon/atributos.py
+"""
+Ficha técnica do produto em JSON (Produto.ficha: {"Tensão": "220V", ...}).
+
+ProdutoAtributo continua sendo onde os atributos são editados; a ficha é
+uma cópia desnormalizada, mantida pelos signals abaixo, para:
+  - mostrar a ficha sem join em ProdutoAtributo/Atributo;
+  - filtrar por atributo numa consulta só: no PostgreSQL é jsonb com
+    índice GIN (jsonb_path_ops), e filtro_ficha() usa containment (@>),
+    que o índice atende. Em outros bancos cai para json_extract por chave.
+
+queryset.update()/bulk_create em ProdutoAtributo não disparam signals:
+depois de carga em massa, chame sincronizar_fichas().
+"""
+from functools import partial, reduce
+from operator import or_
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.lookups import In
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import buscar, invalidar
+from .models import Atributo, Produto, ProdutoAtributo
+
+LOTE_SINCRONIZACAO = 1000
+
+
+# ============================================================
+# FICHA
+# ============================================================
+
+def montar_fichas(produto_ids):
+    """{produto_id: {nome_atributo: valor}} a partir de ProdutoAtributo (uma consulta)."""
+    fichas = {produto_id: {} for produto_id in produto_ids}
+    linhas = (
+        ProdutoAtributo.objects
+        .filter(produto_id__in=produto_ids)
+        .values_list('produto_id', 'atributo__nome', 'valor')
+    )
+    for produto_id, nome, valor in linhas:
+        fichas[produto_id][nome] = valor
+    return fichas
+
+
+def sincronizar_fichas(produto_ids=None, lote=LOTE_SINCRONIZACAO):
+    """
+    Regrava Produto.ficha a partir de ProdutoAtributo (todos os produtos
+    se produto_ids for None), em lotes. Retorna quantos produtos mudaram.
+    """
+    produtos = Produto.objects.order_by('id')
+    if produto_ids is not None:
+        produtos = produtos.filter(id__in=produto_ids)
+
+    alterados = 0
+    ultimo_id = 0
+    while True:
+        atuais = dict(produtos.filter(id__gt=ultimo_id).values_list('id', 'ficha')[:lote])
+        if not atuais:
+            return alterados
+        ultimo_id = max(atuais)
+
+        mudaram = [
+            Produto(id=produto_id, ficha=ficha)
+            for produto_id, ficha in montar_fichas(list(atuais)).items()
+            if ficha != atuais[produto_id]
+        ]
+        Produto.objects.bulk_update(mudaram, ['ficha'])
+        alterados += len(mudaram)
+
+
+# ============================================================
+# CONSULTAS
+# ============================================================
+
+def filtro_ficha(condicoes):
+    """
+    Q para produtos cuja ficha tem, para cada atributo, um dos valores.
+    condicoes: {nome_atributo: [valores]} (OU entre valores, E entre atributos).
+    Ex: filtro_ficha({'Tensão': ['220V'], 'Cor': ['Preto', 'Branco']})
+    """
+    filtro = Q()
+    for nome, valores in condicoes.items():
+        if connection.vendor == 'postgresql':
+            # ficha @> '{"Tensão": "220V"}': atendido pelo índice GIN
+            filtro &= reduce(or_, (Q(ficha__contains={nome: valor}) for valor in valores))
+        else:
+            filtro &= Q(In(KeyTextTransform(nome, 'ficha'), list(valores)))
+    return filtro
+
+
+def nomes_atributos():
+    """{atributo_id: nome} de todos os atributos (em cache; são poucos)."""
+    return buscar(
+        'atributos', ('nomes',),
+        lambda: dict(Atributo.objects.values_list('id', 'nome')),
+        60 * 60,
+    )
+
+
+# ============================================================
+# SIGNALS: ficha em sincronia com ProdutoAtributo
+# ============================================================
+
+def _agendar(produto_ids):
+    transaction.on_commit(partial(sincronizar_fichas, produto_ids))
+
+
+@receiver(post_save, sender=ProdutoAtributo)
+@receiver(post_delete, sender=ProdutoAtributo)
+def _produto_atributo_alterado(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    _agendar([instance.produto_id])
+
+
+@receiver(post_save, sender=Atributo)
+def _atributo_salvo(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    transaction.on_commit(partial(invalidar, 'atributos'))
+    if not created:
+        # renomeado: a chave muda na ficha de quem tem o atributo
+        _agendar(list(instance.produtoatributo_set.values_list('produto_id', flat=True)))
+
+
+@receiver(post_delete, sender=Atributo)
+def _atributo_excluido(sender, instance, **kwargs):
+    # as linhas de ProdutoAtributo saem em cascata (e sincronizam pelo signal acima)
+    transaction.on_commit(partial(invalidar, 'atributos'))
@@ -0,0 +1,209 @@
+# freepigeon/benchmark.py
+"""
+Benchmark das páginas mais acessadas (vitrine, carrinho, checkout, admin).
+
+Para cada rota mede, com o test Client do Django:
+  - latência (ms): mínimo, mediana, p95 e máximo das repetições;
+  - queries por requisição (ver consultas.py);
+  - pico de memória Python alocada durante a requisição (tracemalloc).
+
+Stripe e Correios são trocados por fakes locais (servicos_falsos), então
+nenhuma rota sai para a rede. O resultado é um dict serializável em JSON,
+para comparar execuções entre versões (comando 'benchmark').
+"""
+import platform
+import statistics
+import time
+import tracemalloc
+from contextlib import ExitStack
+from types import SimpleNamespace
+from unittest import mock
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .consultas import RegistroConsultas
+from .models import (
+    AdminUser, Carrinho, CarrinhoProduto, Categoria, Pedido, PedidoProduto,
+    Produto, Usuario,
+)
+
+EMAIL_BENCHMARK = 'benchmark@freepigeon.local'
+
+# (nome, url, método, cliente, dados). 'cliente': 'usuario' ou 'admin'.
+ROTAS = [
+    ('home_view', 'home', 'get', 'usuario', None),
+    ('categoria_view', 'categoria', 'get', 'usuario', None),
+    ('buscar_produtos', 'buscar', 'get', 'usuario', {'q': 'fone'}),
+    ('ver_carrinho', 'ver_carrinho', 'get', 'usuario', None),
+    ('checkout_view', 'checkout', 'get', 'usuario', None),
+    ('calcular_frete', 'calcular_frete', 'post', 'usuario', {'cep': '04567000'}),
+    ('admin_dashboard', 'admin_dashboard', 'get', 'admin', None),
+    ('admin_transacoes', 'admin_transacoes', 'get', 'admin', None),
+]
+
+
+# ============================================================
+# FAKES: Stripe e Correios
+# ============================================================
+
+async def _acorreios_falso(url, params, nome_servico, timeout):
+    return {
+        'codigo': nome_servico,
+        'nome': f"{nome_servico} - Correios",
+        'valor': 25.90 if nome_servico == 'PAC' else 39.90,
+        'prazo_dias': 7 if nome_servico == 'PAC' else 2,
+    }
+
+
+def _sessao_stripe_falsa(*args, **kwargs):
+    return SimpleNamespace(id='cs_benchmark', url='https://checkout.stripe.test/cs_benchmark',
+                           payment_status='unpaid', metadata=kwargs.get('metadata', {}))
+
+
+def servicos_falsos():
+    """Context manager: Stripe e Correios respondem localmente."""
+    pilha = ExitStack()
+    pilha.enter_context(mock.patch('freepigeon.utils_frete._aconsultar_servico', _acorreios_falso))
+    pilha.enter_context(mock.patch('stripe.checkout.Session.create', _sessao_stripe_falsa))
+    pilha.enter_context(mock.patch('stripe.checkout.Session.retrieve', _sessao_stripe_falsa))
+    return pilha
+
+
+# ============================================================
+# CENÁRIO
+# ============================================================
+
+def preparar_cenario(itens_no_carrinho=5):
+    """
+    Usuário do benchmark com carrinho cheio e admin para as páginas do
+    painel. Usa dados já existentes (produtos/categorias); reaproveita o
+    usuário entre execuções. Retorna dict com os ids usados nas URLs.
+    """
+    produtos = list(Produto.objects.filter(ativo=True).order_by('id').values_list('id', flat=True)[:itens_no_carrinho])
+    if not produtos:
+        raise ValueError('Nenhum produto ativo no banco. Rode com --produtos N para gerar dados.')
+
+    usuario, _ = Usuario.objects.get_or_create(
+        email=EMAIL_BENCHMARK,
+        defaults={'nome': 'Benchmark', 'senha': make_password(None)},
+    )
+    carrinho, _ = Carrinho.objects.get_or_create(usuario=usuario)
+    carrinho.itens.all().delete()
+    CarrinhoProduto.objects.bulk_create([
+        CarrinhoProduto(carrinho=carrinho, produto_id=produto_id, quantidade=1)
+        for produto_id in produtos
+    ])
+
+    admin = AdminUser.objects.filter(username='admin').first()
+    if not admin:
+        admin = AdminUser.objects.create(username='admin', password=make_password(None))
+
+    # categoria com mais produtos: o pior caso da listagem
+    categoria = (
+        Categoria.objects.filter(produto__ativo=True)
+        .values('id').annotate(n=Count('produto')).order_by('-n').first()
+    )
+    return {
+        'usuario_id': usuario.id,
+        'admin_id': admin.id,
+        'categoria_id': categoria['id'],
+    }
+
+
+def _clientes(cenario):
+    usuario, admin = Client(), Client()
+    sessao = usuario.session
+    sessao['usuario_id'] = cenario['usuario_id']
+    sessao['usuario_nome'] = 'Benchmark'
+    sessao.save()
+    sessao = admin.session
+    sessao['admin_id'] = cenario['admin_id']
+    sessao.save()
+    return {'usuario': usuario, 'admin': admin}
+
+
+# ============================================================
+# MEDIÇÃO
+# ============================================================
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, round(p / 100 * (len(ordenados) - 1)))
+    return ordenados[indice]
+
+
+def medir(cliente, metodo, url, dados=None, repeticoes=10, aquecimento=1):
+    """Mede uma rota. A primeira chamada (aquecimento) não entra na conta."""
+    chamar = getattr(cliente, metodo)
+    for _ in range(aquecimento):
+        chamar(url, dados or {})
+
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        chamar(url, dados or {})
+        tempos.append((time.perf_counter() - inicio) * 1000)
+
+    # queries e memória numa passada à parte: tracemalloc deixa tudo mais lento
+    tracemalloc.start()
+    try:
+        with RegistroConsultas() as registro:
+            response = chamar(url, dados or {})
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'status': response.status_code,
+        'latencia_ms': {
+            'min': round(min(tempos), 2),
+            'mediana': round(statistics.median(tempos), 2),
+            'p95': round(_percentil(tempos, 95), 2),
+            'max': round(max(tempos), 2),
+        },
+        'consultas': registro.total,
+        'consultas_repetidas': len(registro.repetidas()),
+        'pico_memoria_kb': round(pico / 1024, 1),
+    }
+
+
+def contagem_de_linhas():
+    modelos = [Produto, Categoria, Usuario, Pedido, PedidoProduto, CarrinhoProduto]
+    return {modelo.__name__: modelo.objects.count() for modelo in modelos}
+
+
+def executar(repeticoes=10, rotas=None, log=print):
+    """Roda o benchmark e devolve o relatório (dict pronto para json.dumps)."""
+    cenario = preparar_cenario()
+    clientes = _clientes(cenario)
+    escolhidas = [rota for rota in ROTAS if not rotas or rota[0] in rotas]
+
+    resultados = {}
+    # DEBUG desligado e sem o log do ConsultasMiddleware, como em produção
+    with servicos_falsos(), override_settings(DEBUG=False, CONSULTAS_INSTRUMENTAR=False, ALLOWED_HOSTS=['*']):
+        for nome, url_nome, metodo, cliente, dados in escolhidas:
+            kwargs = {'categoria_id': cenario['categoria_id']} if url_nome == 'categoria' else None
+            resultados[nome] = medir(
+                clientes[cliente], metodo, reverse(url_nome, kwargs=kwargs), dados, repeticoes
+            )
+            log(f"[BENCHMARK] {nome}: {resultados[nome]['latencia_ms']['mediana']}ms, "
+                f"{resultados[nome]['consultas']} consultas")
+
+    return {
+        'data': timezone.now().isoformat(),
+        'ambiente': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'banco': connection.vendor,
+        },
+        'repeticoes': repeticoes,
+        'linhas': contagem_de_linhas(),
+        'resultados': resultados,
+    }
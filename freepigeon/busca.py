@@ -0,0 +1,356 @@
+# freepigeon/busca.py
+"""
+Busca full-text de produtos.
+
+O texto pesquisável de cada Produto (nome, categoria, atributos e descrição)
+fica na tabela ProdutoBusca, atualizada pelos signals deste módulo sempre que
+Produto, ProdutoAtributo ou Categoria mudam.
+
+Backends:
+  - PostgresBuscaBackend: tsvector (config 'portuguese') com índice GIN.
+  - MemoriaBuscaBackend: índice invertido em memória, para dev com SQLite.
+
+O backend é escolhido pelo vendor do banco, ou pelo setting BUSCA_BACKEND
+(caminho pontilhado de uma classe).
+"""
+import bisect
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+from functools import partial
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection, transaction
+from django.db.models import Case, DecimalField, F, FloatField, Value, When
+from django.db.models.functions import Cast
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import Categoria, Produto, ProdutoAtributo, ProdutoBusca
+
+
+# Pesos por campo (mesma ordem A, B, C, D do ts_rank)
+PESOS = {
+    'nome': ('A', 1.0),
+    'categoria': ('B', 0.4),
+    'atributos': ('C', 0.2),
+    'descricao': ('D', 0.1),
+}
+
+
+def normalizar(texto):
+    """
+    Deixa o texto minúsculo e sem acentos.
+    Ex: 'Tensão 220V' -> 'tensao 220v'
+    """
+    texto = unicodedata.normalize('NFKD', str(texto or ''))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return texto.lower()
+
+
+def tokenizar(texto):
+    """Quebra o texto normalizado em termos alfanuméricos."""
+    return re.findall(r'[a-z0-9]+', normalizar(texto))
+
+
+def montar_documento(produto):
+    """
+    Monta os campos de ProdutoBusca de um produto.
+    Espera 'categoria' e 'atributos__atributo' já carregados para não gerar N+1.
+    """
+    atributos = ' '.join(
+        f"{pa.atributo.nome} {pa.valor}" for pa in produto.atributos.all()
+    )
+    return {
+        'nome': normalizar(produto.nome),
+        'categoria': normalizar(produto.categoria.nome if produto.categoria_id else ''),
+        'atributos': normalizar(atributos),
+        'descricao': normalizar(produto.descricao),
+    }
+
+
+# ============================================================
+# BACKENDS
+# ============================================================
+
+class BuscaBackend:
+    """Interface comum dos backends de busca."""
+
+    def atualizar(self, registros):
+        """Reindexa um queryset de ProdutoBusca com os textos já atualizados."""
+        raise NotImplementedError
+
+    def remover(self, produto_ids):
+        raise NotImplementedError
+
+    def buscar(self, queryset, termos):
+        """
+        Filtra um queryset de Produto pelos termos e devolve ordenado por
+        relevância (anotação 'relevancia'), desempatando por -id.
+        """
+        raise NotImplementedError
+
+
+class PostgresBuscaBackend(BuscaBackend):
+    config = 'portuguese'
+
+    def _vetor(self):
+        vetor = None
+        for campo, (peso, _) in PESOS.items():
+            parte = SearchVector(campo, weight=peso, config=self.config)
+            vetor = parte if vetor is None else vetor + parte
+        return vetor
+
+    def atualizar(self, registros):
+        registros.update(vetor=self._vetor())
+
+    def remover(self, produto_ids):
+        # A linha de ProdutoBusca sai junto com o Produto (CASCADE)
+        pass
+
+    def buscar(self, queryset, termos):
+        # Busca por prefixo em todos os termos: 'cel sam' acha 'celular samsung'
+        consulta = SearchQuery(
+            ' & '.join(f"{termo}:*" for termo in termos),
+            config=self.config,
+            search_type='raw',
+        )
+        return (
+            queryset
+            .filter(busca__vetor=consulta)
+            # ts_rank é real (float4): o valor que volta ao Python não é igual
+            # ao do banco e o cursor da paginação (relevancia = v) pularia
+            # linhas. Em numeric a comparação é exata.
+            .annotate(relevancia=Cast(
+                SearchRank(F('busca__vetor'), consulta),
+                output_field=DecimalField(max_digits=12, decimal_places=6),
+            ))
+            .order_by('-relevancia', '-id')
+        )
+
+
+class MemoriaBuscaBackend(BuscaBackend):
+    """
+    Índice invertido simples em memória: termo -> {produto_id: peso}.
+    É carregado da tabela ProdutoBusca no primeiro uso e mantido pelos signals.
+    Cada processo tem o seu, então serve para dev/testes, não para produção.
+
+    Os termos também ficam numa lista ordenada: os que começam com um
+    prefixo são uma faixa contígua dela, achada com bisect.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indice = defaultdict(dict)
+        self._termos = []
+        self._termos_por_produto = {}
+        self._carregado = False
+
+    def _indexar_linha(self, produto_id, campos):
+        self._remover_um(produto_id)
+        pesos = {}
+        for campo, (_, peso) in PESOS.items():
+            for termo in tokenizar(campos[campo]):
+                pesos[termo] = pesos.get(termo, 0.0) + peso
+        for termo, peso in pesos.items():
+            if termo not in self._indice and self._carregado:
+                bisect.insort(self._termos, termo)
+            self._indice[termo][produto_id] = peso
+        self._termos_por_produto[produto_id] = set(pesos)
+
+    def _remover_um(self, produto_id):
+        for termo in self._termos_por_produto.pop(produto_id, ()):
+            postings = self._indice.get(termo)
+            if postings is not None:
+                postings.pop(produto_id, None)
+                if not postings:
+                    del self._indice[termo]
+                    if self._carregado:
+                        del self._termos[bisect.bisect_left(self._termos, termo)]
+
+    def _carregar(self):
+        if self._carregado:
+            return
+        campos = ['produto_id', *PESOS]
+        for linha in ProdutoBusca.objects.values(*campos).iterator(chunk_size=2000):
+            self._indexar_linha(linha['produto_id'], linha)
+        # na carga ordena uma vez só; depois cada termo novo entra no lugar
+        self._termos = sorted(self._indice)
+        self._carregado = True
+
+    def _com_prefixo(self, prefixo):
+        inicio = bisect.bisect_left(self._termos, prefixo)
+        fim = bisect.bisect_left(self._termos, prefixo + '\uffff', inicio)
+        return self._termos[inicio:fim]
+
+    def atualizar(self, registros):
+        with self._lock:
+            if not self._carregado:
+                self._carregar()
+                return
+            for linha in registros.values('produto_id', *PESOS):
+                self._indexar_linha(linha['produto_id'], linha)
+
+    def remover(self, produto_ids):
+        with self._lock:
+            for produto_id in produto_ids:
+                self._remover_um(produto_id)
+
+    def buscar(self, queryset, termos):
+        with self._lock:
+            self._carregar()
+            pontuacao = None
+            for termo in termos:
+                encontrados = defaultdict(float)
+                for token in self._com_prefixo(termo):
+                    for produto_id, peso in self._indice[token].items():
+                        encontrados[produto_id] += peso
+                if pontuacao is None:
+                    pontuacao = dict(encontrados)
+                else:
+                    pontuacao = {
+                        pid: pontuacao[pid] + encontrados[pid]
+                        for pid in pontuacao if pid in encontrados
+                    }
+                if not pontuacao:
+                    return sem_resultados(queryset)
+
+        relevancia = Case(
+            *[When(id=pid, then=Value(peso)) for pid, peso in pontuacao.items()],
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+        return (
+            queryset
+            .filter(id__in=list(pontuacao))
+            .annotate(relevancia=relevancia)
+            .order_by('-relevancia', '-id')
+        )
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        caminho = getattr(settings, 'BUSCA_BACKEND', None)
+        if caminho:
+            classe = import_string(caminho)
+        elif connection.vendor == 'postgresql':
+            classe = PostgresBuscaBackend
+        else:
+            classe = MemoriaBuscaBackend
+        _backend = classe()
+    return _backend
+
+
+# ============================================================
+# API
+# ============================================================
+
+def sem_resultados(queryset):
+    """Queryset vazio, mas com 'relevancia' para quem ordena/pagina por ela."""
+    return queryset.none().annotate(relevancia=Value(0.0, output_field=FloatField()))
+
+
+def buscar(queryset, texto):
+    """
+    Busca 'texto' dentro de um queryset de Produto.
+    Retorna o queryset ordenado por relevância (vazio se não houver termos).
+    """
+    termos = tokenizar(texto)
+    if not termos:
+        return sem_resultados(queryset)
+    return get_backend().buscar(queryset, termos)
+
+
+def reindexar_produtos(produto_ids):
+    """
+    Recalcula o documento de busca dos produtos informados.
+    Produtos que não existem mais são removidos do índice.
+    """
+    produto_ids = list(produto_ids)
+    produtos = (
+        Produto.objects
+        .filter(id__in=produto_ids)
+        .select_related('categoria')
+        .prefetch_related('atributos__atributo')
+    )
+
+    # um upsert por lote, em vez de um update_or_create por produto
+    documentos = [ProdutoBusca(produto_id=produto.id, **montar_documento(produto)) for produto in produtos]
+    ProdutoBusca.objects.bulk_create(
+        documentos,
+        update_conflicts=True,
+        unique_fields=['produto'],
+        update_fields=list(PESOS),
+    )
+    existentes = [documento.produto_id for documento in documentos]
+
+    backend = get_backend()
+    removidos = set(produto_ids) - set(existentes)
+    if removidos:
+        backend.remover(removidos)
+    if existentes:
+        backend.atualizar(ProdutoBusca.objects.filter(produto_id__in=existentes))
+
+
+def reconstruir_indice(lote=1000):
+    """Reindexa o catálogo inteiro em lotes. Retorna quantos produtos foram indexados."""
+    total = 0
+    ids = list(Produto.objects.order_by('id').values_list('id', flat=True))
+    for inicio in range(0, len(ids), lote):
+        parte = ids[inicio:inicio + lote]
+        with transaction.atomic():
+            reindexar_produtos(parte)
+        total += len(parte)
+    return total
+
+
+def _agendar_reindexacao(produto_id):
+    # on_commit: evita reindexar no meio de um delete em cascata e só indexa
+    # o que realmente foi gravado.
+    transaction.on_commit(partial(reindexar_produtos, [produto_id]))
+
+
+# ============================================================
+# SIGNALS: mantém ProdutoBusca em sincronia
+# ============================================================
+
+@receiver(post_save, sender=Produto)
+def _produto_salvo(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    _agendar_reindexacao(instance.pk)
+
+
+@receiver(post_delete, sender=Produto)
+def _produto_excluido(sender, instance, **kwargs):
+    transaction.on_commit(partial(get_backend().remover, [instance.pk]))
+
+
+@receiver(post_save, sender=ProdutoAtributo)
+@receiver(post_delete, sender=ProdutoAtributo)
+def _atributo_alterado(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    _agendar_reindexacao(instance.produto_id)
+
+
+@receiver(post_save, sender=Categoria)
+def _categoria_salva(sender, instance, created=False, raw=False, **kwargs):
+    if raw or created:
+        return
+
+    nome = normalizar(instance.nome)
+    registros = ProdutoBusca.objects.filter(produto__categoria=instance).exclude(categoria=nome)
+    ids = list(registros.values_list('produto_id', flat=True))
+    if not ids:
+        return
+
+    ProdutoBusca.objects.filter(produto_id__in=ids).update(categoria=nome)
+    get_backend().atualizar(ProdutoBusca.objects.filter(produto_id__in=ids))
@@ -0,0 +1,159 @@
+# freepigeon/cache.py
+"""
+Camada de cache da aplicação, sobre o cache 'default' do Django
+(configurado em CACHES: Redis/Memcached em produção, compartilhado entre
+os workers).
+
+  - chave(namespace, *partes): chaves com namespace ('fp:frete:...').
+  - versao(namespace) / invalidar(namespace): cada namespace tem uma versão
+    que entra nas chaves; invalidar() troca a versão e tudo o que foi
+    gravado antes deixa de ser lido (e expira sozinho). Não é preciso
+    saber quais chaves existem.
+  - buscar(namespace, partes, calcular, ttl): lê ou calcula e grava, com
+    proteção contra stampede:
+      * refresh antecipado probabilístico (XFetch): perto de vencer, uma
+        requisição ao acaso recalcula antes, proporcional ao custo do cálculo;
+      * trava: quando vence, só quem pega a trava recalcula; os demais
+        continuam servindo o valor antigo, que fica guardado além do ttl.
+        A trava é um cache.add(): entre processos, só funciona num backend
+        com add() atômico (Redis, Memcached). No LocMem (sem CACHE_URL)
+        ela e o invalidar() valem só dentro do processo.
+  - ler() / gravar() / liberar(): as mesmas peças separadas, para quem
+    calcula de forma assíncrona (ver utils_frete.acotar_frete).
+"""
+import hashlib
+import math
+import random
+import time
+from typing import Any, NamedTuple
+
+from django.core.cache import cache
+
+PREFIXO = 'fp'
+
+# O valor fica no cache por ttl * (1 + SOBREVIDA): depois de vencer ainda
+# serve de resposta enquanto um único processo recalcula.
+SOBREVIDA = 1.0
+# Quanto maior, mais cedo (e mais vezes) o refresh antecipado acontece.
+BETA = 1.0
+# Tempo máximo da trava de recálculo (segundos).
+TRAVA_TTL = 30
+# Sem valor nenhum no cache e sem a trava: espera o outro processo por até
+# ESPERA_MAX segundos antes de calcular por conta própria.
+ESPERA_MAX = 2.0
+ESPERA_PASSO = 0.05
+
+
+class Leitura(NamedTuple):
+    chave: str
+    valor: Any
+    encontrado: bool
+    recalcular: bool  # True: este processo deve calcular e chamar gravar() (ou liberar())
+
+
+def _parte(valor):
+    texto = str(valor)
+    return texto if len(texto) <= 64 and ' ' not in texto else hashlib.md5(texto.encode()).hexdigest()
+
+
+def chave(namespace, *partes):
+    """Chave com namespace. Partes longas ou com espaço viram hash (limite do memcached)."""
+    return ':'.join([PREFIXO, namespace, *(_parte(p) for p in partes)])
+
+
+# ============================================================
+# VERSÃO POR NAMESPACE
+# ============================================================
+
+def _versao_inicial():
+    # Começa do relógio (ms), não de 1: se a chave for despejada do cache,
+    # a versão nova não repete uma antiga que ainda tenha entradas salvas.
+    return int(time.time() * 1000)
+
+
+def versao(namespace):
+    chave_versao = chave(namespace, 'versao')
+    atual = cache.get(chave_versao)
+    if atual is None:
+        # add(): se dois processos chegarem juntos, só um grava
+        cache.add(chave_versao, _versao_inicial(), None)
+        atual = cache.get(chave_versao)
+    return atual
+
+
+def invalidar(namespace):
+    """Troca a versão do namespace: todas as entradas dele ficam velhas."""
+    chave_versao = chave(namespace, 'versao')
+    try:
+        cache.incr(chave_versao)
+    except ValueError:
+        # chave ainda não existe (ou foi despejada do cache)
+        cache.add(chave_versao, _versao_inicial(), None)
+
+
+def _chave_versionada(namespace, partes):
+    return chave(namespace, versao(namespace), *partes)
+
+
+# ============================================================
+# LEITURA COM PROTEÇÃO CONTRA STAMPEDE
+# ============================================================
+
+def _pegar_trava(chave_valor):
+    return cache.add(chave_valor + ':trava', 1, TRAVA_TTL)
+
+
+def ler(namespace, partes):
+    """
+    Lê a entrada e diz se este processo deve recalcular. Com recalcular=True
+    quem chamou fica com a trava e precisa chamar gravar() ou liberar().
+    """
+    chave_valor = _chave_versionada(namespace, partes)
+    envelope = cache.get(chave_valor)
+
+    if envelope is None:
+        if _pegar_trava(chave_valor):
+            return Leitura(chave_valor, None, False, True)
+        # outro processo está calculando: espera um pouco pelo resultado
+        limite = time.monotonic() + ESPERA_MAX
+        while time.monotonic() < limite:
+            time.sleep(ESPERA_PASSO)
+            envelope = cache.get(chave_valor)
+            if envelope is not None:
+                return Leitura(chave_valor, envelope[0], True, False)
+        return Leitura(chave_valor, None, False, True)
+
+    valor, vence_em, custo = envelope
+    # XFetch: -log(random) é exponencial; recalcula antes com chance maior
+    # quanto mais perto de vencer e quanto mais caro for o cálculo.
+    antecipar = custo * BETA * -math.log(random.random() or 1e-12)
+    if time.time() + antecipar >= vence_em and _pegar_trava(chave_valor):
+        return Leitura(chave_valor, valor, True, True)
+    return Leitura(chave_valor, valor, True, False)
+
+
+def gravar(leitura, valor, ttl, custo=0.0):
+    """Grava o valor na chave da leitura (válido por ttl segundos) e solta a trava."""
+    cache.set(leitura.chave, (valor, time.time() + ttl, custo), max(int(ttl * (1 + SOBREVIDA)), 1))
+    cache.delete(leitura.chave + ':trava')
+
+
+def liberar(leitura):
+    """Solta a trava sem gravar (o cálculo falhou)."""
+    cache.delete(leitura.chave + ':trava')
+
+
+def buscar(namespace, partes, calcular, ttl):
+    """Valor em cache de calcular(), recalculado por um único processo quando vence."""
+    leitura = ler(namespace, partes)
+    if not leitura.recalcular:
+        return leitura.valor
+
+    inicio = time.perf_counter()
+    try:
+        valor = calcular()
+    except Exception:
+        liberar(leitura)
+        raise
+    gravar(leitura, valor, ttl, custo=time.perf_counter() - inicio)
+    return valor
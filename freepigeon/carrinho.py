@@ -0,0 +1,39 @@
+# freepigeon/carrinho.py
+"""
+Preço do carrinho.
+
+resumo_carrinho(carrinho) devolve os itens (com produto e categoria), o
+subtotal de cada um, a quantidade de itens e o total numa única query,
+não importa quantas linhas o carrinho tenha: a conta (quantidade x
+Produto.preco_final, a coluna gerada com o desconto) e as somas são feitas
+no banco, ver CarrinhoProdutoQuerySet.com_subtotais(). aresumo_carrinho é a
+versão para as views assíncronas (Stripe).
+
+Nas telas use item.subtotal_valor, não item.subtotal().
+"""
+from decimal import Decimal
+from typing import NamedTuple
+
+
+class ResumoCarrinho(NamedTuple):
+    itens: list
+    total_itens: int
+    total: Decimal
+
+
+def _resumir(itens):
+    if not itens:
+        return ResumoCarrinho([], 0, Decimal('0.00'))
+    return ResumoCarrinho(itens, itens[0].qtd_itens, itens[0].total_valor)
+
+
+def resumo_carrinho(carrinho):
+    if carrinho is None:
+        return _resumir([])
+    return _resumir(list(carrinho.itens.com_subtotais()))
+
+
+async def aresumo_carrinho(carrinho):
+    if carrinho is None:
+        return _resumir([])
+    return _resumir([item async for item in carrinho.itens.com_subtotais()])
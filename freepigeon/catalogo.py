@@ -0,0 +1,89 @@
+# freepigeon/catalogo.py
+"""
+Catálogo e planos em cache (ver cache.py), compartilhados entre os workers.
+
+Versão do catálogo, para cache de fragmentos (ex: a home): os fragmentos
+cacheados entram na chave com versao_catalogo(). Qualquer alteração em
+Produto ou Categoria troca a versão (signals abaixo), e as entradas antigas
+simplesmente deixam de ser lidas e expiram sozinhas.
+
+No template:
+    {% load cache %}
+    {% cache cache_ttl home_produtos versao_catalogo %} ... {% endcache %}
+
+Planos: planos_ativos() e plano_padrao() leem do cache; Plano salvo ou
+excluído invalida o namespace 'planos'.
+
+Atenção: queryset.update() não dispara signals. Quem alterar pelo update()
+algo que aparece na vitrine (nome, preço, imagem, ativo...) deve chamar
+invalidar_catalogo() (ou invalidar_planos()). Estoque/reserva não aparecem
+na home.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import buscar, invalidar, versao
+from .models import Categoria, Plano, Produto
+
+
+def ttl_catalogo():
+    return getattr(settings, 'CATALOGO_CACHE_TTL', 60 * 60)
+
+
+def versao_catalogo():
+    return versao('catalogo')
+
+
+def invalidar_catalogo():
+    invalidar('catalogo')
+
+
+# ============================================================
+# PLANOS
+# ============================================================
+
+def planos_ativos():
+    """Planos ativos, do mais barato ao mais caro (lista em cache)."""
+    return buscar(
+        'planos', ('ativos',),
+        lambda: list(Plano.objects.filter(ativo=True).order_by('preco_mensal')),
+        ttl_catalogo(),
+    )
+
+
+def plano_padrao():
+    """
+    Plano default (is_default=True) entre os ativos. Se não tiver, o mais
+    barato ativo. Se não tiver nada, None.
+    """
+    planos = planos_ativos()
+    return next((plano for plano in planos if plano.is_default), planos[0] if planos else None)
+
+
+def invalidar_planos():
+    invalidar('planos')
+
+
+# ============================================================
+# SIGNALS: nova versão quando o catálogo ou os planos mudam
+# ============================================================
+
+@receiver(post_save, sender=Produto)
+@receiver(post_delete, sender=Produto)
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+def _catalogo_alterado(sender, raw=False, **kwargs):
+    if raw:
+        return
+    # on_commit: quem ler a versão nova já enxerga o dado gravado
+    transaction.on_commit(invalidar_catalogo)
+
+
+@receiver(post_save, sender=Plano)
+@receiver(post_delete, sender=Plano)
+def _planos_alterados(sender, raw=False, **kwargs):
+    if raw:
+        return
+    transaction.on_commit(invalidar_planos)
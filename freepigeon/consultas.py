@@ -0,0 +1,90 @@
+# freepigeon/consultas.py
+"""
+Contagem de queries por requisição e detector de N+1.
+
+RegistroConsultas é um context manager que anota toda query executada
+(em todas as conexões) com o tempo gasto. Queries com o mesmo "formato"
+(o SQL sem os valores) repetidas várias vezes na mesma requisição são a
+assinatura de um N+1: um loop que faz uma query por item.
+
+Usado por:
+  - ConsultasMiddleware (middleware.py): headers X-Consultas-* e log
+    [CONSULTAS] em dev/staging;
+  - tests.py: assertMaxQueries, orçamento de queries por URL.
+"""
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+
+# Mesma query repetida a partir de quantas vezes conta como N+1
+REPETICOES_N_MAIS_1 = 3
+
+_LITERAIS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),               # strings
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),            # números
+    (re.compile(r'%s'), '?'),                           # parâmetros
+    (re.compile(r'\bIN \((?:\?(?:, )?)+\)'), 'IN (...)'),  # listas de tamanho variável
+]
+
+
+def formato(sql):
+    """SQL sem os valores: duas queries que só mudam o id têm o mesmo formato."""
+    for padrao, troca in _LITERAIS:
+        sql = padrao.sub(troca, sql)
+    return ' '.join(sql.split())
+
+
+def repeticoes_minimas():
+    return getattr(settings, 'CONSULTAS_N_MAIS_1', REPETICOES_N_MAIS_1)
+
+
+class RegistroConsultas:
+    """
+    Uso:
+        with RegistroConsultas() as registro:
+            ...
+        registro.total, registro.tempo_ms, registro.repetidas()
+    """
+
+    def __init__(self):
+        self.consultas = []  # [(sql, segundos), ...]
+        self._pilha = None
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.consultas.append((sql, time.perf_counter() - inicio))
+
+    def __enter__(self):
+        self._pilha = ExitStack()
+        for conexao in connections.all():
+            self._pilha.enter_context(conexao.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc):
+        self._pilha.close()
+        return False
+
+    @property
+    def total(self):
+        return len(self.consultas)
+
+    @property
+    def tempo_ms(self):
+        return sum(segundos for _, segundos in self.consultas) * 1000
+
+    def repetidas(self, minimo=None):
+        """[(formato, vezes), ...] das queries repetidas (N+1), mais repetida primeiro."""
+        minimo = minimo or repeticoes_minimas()
+        contagem = Counter(formato(sql) for sql, _ in self.consultas)
+        return [(sql, vezes) for sql, vezes in contagem.most_common() if vezes >= minimo]
+
+    def resumo(self):
+        return f"{self.total} consultas em {self.tempo_ms:.1f}ms"
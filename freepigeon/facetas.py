@@ -0,0 +1,216 @@
+# freepigeon/facetas.py
+"""
+Navegação facetada do catálogo (Produto + Categoria + ProdutoAtributo).
+
+- ler_filtros(params): filtros a partir do GET (?preco_min=, ?preco_max=,
+  ?desconto=1, ?em_estoque=1, ?categoria=, ?loja=, ?atributo_<id>=valor).
+  categoria, loja e cada atributo aceitam vários valores (OU entre eles);
+  grupos diferentes se combinam com E.
+- filtrar(queryset, filtros): aplica os filtros.
+- facetas(queryset, filtros): contagem por valor de cada faceta.
+
+As contagens de uma faceta usam todos os filtros menos o dela mesma, como
+nas lojas grandes: marcar "Loja A" não zera a contagem das outras lojas.
+Cada grupo é um GROUP BY (uma consulta por grupo, não uma por valor):
+  - preço (faixas), desconto e em estoque: uma consulta com COUNT(FILTER);
+  - categorias e lojas: uma consulta cada;
+  - atributos: uma para todos os não selecionados, mais uma por atributo
+    selecionado.
+O filtro por atributo usa a ficha do produto (containment no jsonb com
+índice GIN, ver atributos.py); a contagem por valor usa o índice
+(atributo, valor, produto) de ProdutoAtributo. Demais índices em Produto
+(categoria/loja/preco_final, ver models.py).
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Count, F, Q
+
+from .atributos import filtro_ficha, nomes_atributos
+from .models import ProdutoAtributo
+
+# Faixas de preço da faceta (limite inferior incluso, superior não).
+FAIXAS_PRECO = [
+    (Decimal('0'), Decimal('50')),
+    (Decimal('50'), Decimal('100')),
+    (Decimal('100'), Decimal('250')),
+    (Decimal('250'), Decimal('500')),
+    (Decimal('500'), Decimal('1000')),
+    (Decimal('1000'), None),
+]
+
+# Valores por atributo na resposta (os mais frequentes)
+MAX_VALORES_ATRIBUTO = 20
+
+_PREFIXO_ATRIBUTO = 'atributo_'
+
+
+# ============================================================
+# FILTROS
+# ============================================================
+
+def _decimal(texto):
+    try:
+        valor = Decimal((texto or '').replace(',', '.'))
+    except InvalidOperation:
+        return None
+    return valor if valor.is_finite() and valor >= 0 else None
+
+
+def _ids(valores):
+    return sorted({int(v) for v in valores if v.isdigit()})
+
+
+def ler_filtros(params):
+    """dict de filtros a partir de um QueryDict (request.GET). Valores inválidos são ignorados."""
+    atributos = {}
+    for nome in params:
+        if nome.startswith(_PREFIXO_ATRIBUTO) and nome[len(_PREFIXO_ATRIBUTO):].isdigit():
+            valores = [v.strip() for v in params.getlist(nome) if v.strip()]
+            if valores:
+                atributos[int(nome[len(_PREFIXO_ATRIBUTO):])] = sorted(set(valores))
+
+    return {
+        'preco_min': _decimal(params.get('preco_min')),
+        'preco_max': _decimal(params.get('preco_max')),
+        'desconto': params.get('desconto') == '1',
+        'em_estoque': params.get('em_estoque') == '1',
+        'categorias': _ids(params.getlist('categoria')),
+        'lojas': _ids(params.getlist('loja')),
+        'atributos': atributos,
+    }
+
+
+def _sem(filtros, grupo):
+    """Cópia dos filtros sem um grupo ('preco', 'categorias', 'lojas' ou o id de um atributo)."""
+    copia = dict(filtros, atributos=dict(filtros['atributos']))
+    if isinstance(grupo, int):
+        copia['atributos'].pop(grupo, None)
+    elif grupo == 'preco':
+        copia.update(preco_min=None, preco_max=None, desconto=False, em_estoque=False)
+    else:
+        copia[grupo] = []
+    return copia
+
+
+def filtrar(queryset, filtros):
+    condicoes = Q()
+    if filtros['preco_min'] is not None:
+        condicoes &= Q(preco_final__gte=filtros['preco_min'])
+    if filtros['preco_max'] is not None:
+        condicoes &= Q(preco_final__lte=filtros['preco_max'])
+    if filtros['desconto']:
+        condicoes &= Q(desconto__gt=0)
+    if filtros['em_estoque']:
+        condicoes &= Q(q_estoque__gt=F('q_reservado'))
+    if filtros['categorias']:
+        condicoes &= Q(categoria_id__in=filtros['categorias'])
+    if filtros['lojas']:
+        condicoes &= Q(loja_id__in=filtros['lojas'])
+    if filtros['atributos']:
+        nomes = nomes_atributos()
+        if not set(filtros['atributos']) <= set(nomes):
+            return queryset.none()  # atributo que não existe
+        condicoes &= filtro_ficha({
+            nomes[atributo_id]: valores for atributo_id, valores in filtros['atributos'].items()
+        })
+    return queryset.filter(condicoes)
+
+
+# ============================================================
+# CONTAGENS
+# ============================================================
+
+def _nome_faixa(minimo, maximo):
+    return f"{minimo}-{maximo}" if maximo is not None else f"{minimo}+"
+
+
+def _facetas_preco(queryset, filtros):
+    """Faixas de preço, 'com desconto' e 'em estoque' numa consulta só."""
+    contagens = {}
+    for minimo, maximo in FAIXAS_PRECO:
+        faixa = Q(preco_final__gte=minimo)
+        if maximo is not None:
+            faixa &= Q(preco_final__lt=maximo)
+        contagens[_nome_faixa(minimo, maximo)] = Count('id', filter=faixa)
+    contagens['_desconto'] = Count('id', filter=Q(desconto__gt=0))
+    contagens['_em_estoque'] = Count('id', filter=Q(q_estoque__gt=F('q_reservado')))
+
+    totais = filtrar(queryset, _sem(filtros, 'preco')).order_by().aggregate(**contagens)
+    return {
+        'precos': [
+            {'min': minimo, 'max': maximo, 'total': totais[_nome_faixa(minimo, maximo)]}
+            for minimo, maximo in FAIXAS_PRECO
+        ],
+        'desconto': totais['_desconto'],
+        'em_estoque': totais['_em_estoque'],
+    }
+
+
+def _contar_por(queryset, campo_id, campo_nome, selecionados):
+    linhas = (
+        queryset.order_by()
+        .values(campo_id, campo_nome)
+        .annotate(total=Count('id'))
+        .filter(**{f'{campo_id}__isnull': False})
+        .order_by('-total', campo_nome)
+    )
+    return [
+        {
+            'id': linha[campo_id],
+            'nome': linha[campo_nome],
+            'total': linha['total'],
+            'selecionado': linha[campo_id] in selecionados,
+        }
+        for linha in linhas
+    ]
+
+
+def _contar_atributos(produtos, atributo_ids=None, exceto=()):
+    """[(atributo_id, nome, valor, total)] dos produtos, agrupado por (atributo, valor)."""
+    itens = ProdutoAtributo.objects.filter(produto__in=produtos.order_by().values('id'))
+    if atributo_ids is not None:
+        itens = itens.filter(atributo_id__in=atributo_ids)
+    if exceto:
+        itens = itens.exclude(atributo_id__in=exceto)
+    return (
+        itens.order_by()
+        .values_list('atributo_id', 'atributo__nome', 'valor')
+        .annotate(total=Count('produto_id'))
+        .order_by('atributo__nome', '-total', 'valor')
+    )
+
+
+def _facetas_atributos(queryset, filtros):
+    selecionados = list(filtros['atributos'])
+    linhas = list(_contar_atributos(filtrar(queryset, filtros), exceto=selecionados))
+    for atributo_id in selecionados:
+        sem_ele = filtrar(queryset, _sem(filtros, atributo_id))
+        linhas.extend(_contar_atributos(sem_ele, atributo_ids=[atributo_id]))
+
+    atributos = {}
+    for atributo_id, nome, valor, total in linhas:
+        atributo = atributos.setdefault(atributo_id, {'id': atributo_id, 'nome': nome, 'valores': []})
+        if len(atributo['valores']) < MAX_VALORES_ATRIBUTO:
+            atributo['valores'].append({
+                'valor': valor,
+                'total': total,
+                'selecionado': valor in filtros['atributos'].get(atributo_id, ()),
+            })
+    return sorted(atributos.values(), key=lambda atributo: atributo['nome'])
+
+
+def facetas(queryset, filtros):
+    """
+    Contagens das facetas para 'queryset' (ex: produtos ativos) com 'filtros'
+    (ver ler_filtros). Retorna dict pronto para JSON/template.
+    """
+    resultado = _facetas_preco(queryset, filtros)
+    resultado['categorias'] = _contar_por(
+        filtrar(queryset, _sem(filtros, 'categorias')), 'categoria_id', 'categoria__nome',
+        filtros['categorias'],
+    )
+    resultado['lojas'] = _contar_por(
+        filtrar(queryset, _sem(filtros, 'lojas')), 'loja_id', 'loja__nome', filtros['lojas']
+    )
+    resultado['atributos'] = _facetas_atributos(queryset, filtros)
+    return resultado
@@ -0,0 +1,139 @@
+# freepigeon/imagens.py
+"""
+Miniaturas das imagens de Produto e Categoria (srcset).
+
+No upload, gerar_miniaturas(obj) grava ao lado do original uma versão
+WebP e uma JPEG de cada largura em LARGURAS (só as menores que o
+original, mais uma do tamanho do original limitada à maior largura):
+
+    produtos/fone.jpg -> produtos/fone.320w.webp, produtos/fone.320w.jpg, ...
+
+As miniaturas saem sem metadados (EXIF/GPS, ICC, comentários) e com a
+rotação do EXIF já aplicada. As larguras geradas ficam em obj.miniaturas;
+a tag {% imagem_responsiva %} (templatetags/imagens_extras.py) monta o
+srcset só com elas, sem tocar no storage na hora de renderizar. Sem
+miniaturas (imagem antiga, arquivo inválido), a tag usa o original.
+
+As views de upload não esperam a geração: agendar_miniaturas(obj) põe a
+tarefa na fila (ver tarefas.py) e, até o worker rodar, a tag usa o original.
+Imagens enviadas antes disso: comando gerar_miniaturas.
+"""
+import io
+import os
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .tarefas import enfileirar, tarefa
+
+LARGURAS = (160, 320, 640, 1280)
+
+# extensão -> (formato do Pillow, opções de gravação)
+FORMATOS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 6}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def nome_miniatura(nome, largura, extensao):
+    raiz, _ = os.path.splitext(nome)
+    return f"{raiz}.{largura}w.{extensao}"
+
+
+def larguras_para(largura_original):
+    larguras = [largura for largura in LARGURAS if largura < largura_original]
+    larguras.append(min(largura_original, LARGURAS[-1]))
+    return sorted(set(larguras))
+
+
+def _abrir(arquivo):
+    arquivo.open('rb')
+    try:
+        imagem = Image.open(arquivo)
+        imagem.load()
+    finally:
+        arquivo.close()
+    imagem = ImageOps.exif_transpose(imagem)
+    tem_alfa = imagem.mode in ('RGBA', 'LA') or (imagem.mode == 'P' and 'transparency' in imagem.info)
+    return imagem.convert('RGBA' if tem_alfa else 'RGB')
+
+
+def _codificar(imagem, formato, opcoes):
+    if formato == 'JPEG' and imagem.mode == 'RGBA':
+        # JPEG não tem transparência: fundo branco
+        fundo = Image.new('RGB', imagem.size, (255, 255, 255))
+        fundo.paste(imagem, mask=imagem.getchannel('A'))
+        imagem = fundo
+    saida = io.BytesIO()
+    # sem exif=/icc_profile=: o Pillow não copia metadados para o arquivo novo
+    imagem.save(saida, formato, **opcoes)
+    return saida.getvalue()
+
+
+def _gravar(storage, nome, conteudo):
+    if storage.exists(nome):
+        storage.delete(nome)
+    storage.save(nome, ContentFile(conteudo))
+
+
+def remover_miniaturas(obj, campo='imagem'):
+    """Apaga as miniaturas da imagem atual de obj (antes de trocar a imagem)."""
+    arquivo = getattr(obj, campo)
+    if not arquivo or not obj.miniaturas:
+        return
+    for largura in obj.miniaturas:
+        for extensao in FORMATOS:
+            arquivo.storage.delete(nome_miniatura(arquivo.name, largura, extensao))
+
+
+def gerar_miniaturas(obj, campo='imagem'):
+    """
+    Gera as miniaturas da imagem de obj e grava as larguras em obj.miniaturas.
+    Retorna as larguras ([] se não tiver imagem ou o arquivo não for imagem).
+    """
+    arquivo = getattr(obj, campo)
+    larguras = []
+    if arquivo:
+        try:
+            original = _abrir(arquivo)
+        except (UnidentifiedImageError, OSError) as e:
+            print(f"[IMAGENS] Não deu para abrir {arquivo.name}: {e}")
+        else:
+            larguras = larguras_para(original.width)
+            for largura in larguras:
+                altura = max(1, round(original.height * largura / original.width))
+                reduzida = original.resize((largura, altura), Image.LANCZOS)
+                for extensao, (formato, opcoes) in FORMATOS.items():
+                    _gravar(arquivo.storage, nome_miniatura(arquivo.name, largura, extensao),
+                            _codificar(reduzida, formato, opcoes))
+
+    obj.miniaturas = larguras
+    obj.save(update_fields=['miniaturas'])
+    return larguras
+
+
+@tarefa(max_tentativas=3)
+def tarefa_miniaturas(modelo, pk, campo='imagem'):
+    """gerar_miniaturas() no worker. 'modelo' é o label do model ('freepigeon.produto')."""
+    obj = apps.get_model(modelo).objects.filter(pk=pk).first()
+    if obj is not None:
+        gerar_miniaturas(obj, campo)
+
+
+def agendar_miniaturas(obj, campo='imagem'):
+    """Para as views de upload, depois do save(): gera as miniaturas em segundo plano."""
+    if not getattr(obj, campo):
+        return
+    modelo = obj._meta.label_lower
+    enfileirar(tarefa_miniaturas, chave=f"miniaturas:{modelo}:{obj.pk}", modelo=modelo, pk=obj.pk, campo=campo)
+
+
+def trocar_imagem(obj, arquivo, campo='imagem'):
+    """
+    Para as views de upload, antes do save(): apaga as miniaturas da imagem
+    atual e põe o upload no campo. Depois do save(), chame agendar_miniaturas(obj).
+    """
+    remover_miniaturas(obj, campo)
+    setattr(obj, campo, arquivo)
+    obj.miniaturas = []
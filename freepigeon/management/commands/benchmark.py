@@ -0,0 +1,53 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from freepigeon.benchmark import ROTAS, executar
+from freepigeon.sintetico import semear
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede latência, queries e memória das páginas principais (vitrine, '
+        'carrinho, checkout, admin) e grava o resultado em JSON. Stripe e '
+        'Correios são simulados. Use um banco de teste: --produtos/--usuarios/'
+        '--pedidos geram dados sintéticos nele antes de medir.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--produtos', type=int, default=0, help='Produtos sintéticos a gerar antes (ex: 100000).')
+        parser.add_argument('--usuarios', type=int, default=0, help='Usuários sintéticos a gerar antes (ex: 50000).')
+        parser.add_argument('--pedidos', type=int, default=0, help='Pedidos sintéticos a gerar antes (ex: 250000).')
+        parser.add_argument('--itens-por-pedido', type=int, default=4, help='Itens por pedido gerado.')
+        parser.add_argument('--semente', type=int, default=42, help='Semente dos dados gerados.')
+        parser.add_argument('--repeticoes', type=int, default=10, help='Requisições medidas por rota.')
+        parser.add_argument(
+            '--rota', action='append', dest='rotas',
+            choices=[rota[0] for rota in ROTAS],
+            help='Mede só esta rota (pode repetir). Padrão: todas.',
+        )
+        parser.add_argument('--saida', help='Arquivo JSON de saída. Sem isso, imprime na tela.')
+
+    def handle(self, *args, **options):
+        if options['produtos'] or options['usuarios'] or options['pedidos']:
+            criados = semear(
+                produtos=options['produtos'],
+                usuarios=max(options['usuarios'], 1),
+                pedidos=options['pedidos'],
+                itens_por_pedido=options['itens_por_pedido'],
+                semente=options['semente'],
+            )
+            self.stdout.write(self.style.SUCCESS(f'✔ Dados gerados: {criados}'))
+
+        try:
+            relatorio = executar(repeticoes=options['repeticoes'], rotas=options['rotas'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        texto = json.dumps(relatorio, indent=2, ensure_ascii=False)
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+                arquivo.write(texto)
+            self.stdout.write(self.style.SUCCESS(f"✔ Resultado gravado em {options['saida']}"))
+        else:
+            self.stdout.write(texto)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from freepigeon.reservas import expirar_reservas
+
+
+class Command(BaseCommand):
+    help = (
+        'Libera as reservas de estoque vencidas (checkouts abandonados). '
+        'Rode periodicamente, ex: a cada minuto via cron.'
+    )
+
+    def handle(self, *args, **options):
+        unidades = expirar_reservas()
+        self.stdout.write(self.style.SUCCESS(f'✔ {unidades} unidade(s) devolvida(s) ao estoque livre.'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from freepigeon.imagens import gerar_miniaturas
+from freepigeon.models import Categoria, Produto
+
+
+class Command(BaseCommand):
+    help = 'Gera as miniaturas (srcset) das imagens de Produto e Categoria enviadas antes do pipeline.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todas', action='store_true',
+                            help='Regera também as imagens que já têm miniaturas.')
+
+    def handle(self, *args, **options):
+        total = 0
+        for modelo in (Categoria, Produto):
+            objetos = modelo.objects.exclude(imagem='').exclude(imagem__isnull=True).order_by('id')
+            if not options['todas']:
+                objetos = objetos.filter(miniaturas=[])
+            for obj in objetos.iterator(chunk_size=200):
+                if gerar_miniaturas(obj):
+                    total += 1
+        self.stdout.write(self.style.SUCCESS(f'✔ {total} imagem(ns) processada(s).'))
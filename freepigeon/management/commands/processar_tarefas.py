@@ -0,0 +1,56 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from freepigeon.tarefas import limpar_concluidas, processar, recuperar_travadas
+
+# segundos entre as rodadas de manutenção (travadas e limpeza)
+MANUTENCAO_INTERVALO = 60
+
+
+class Command(BaseCommand):
+    help = (
+        'Worker da fila de tarefas em segundo plano (freepigeon/tarefas.py). '
+        'Em produção, deixe um ou mais rodando ao lado do gunicorn.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=10, help='Tarefas reservadas por vez.')
+        parser.add_argument('--intervalo', type=float, default=2,
+                            help='Segundos de espera quando a fila está vazia.')
+        parser.add_argument('--uma-vez', action='store_true',
+                            help='Processa o que estiver pronto e sai (cron, testes).')
+
+    def handle(self, *args, **options):
+        parar = []
+        # SIGTERM (deploy) / Ctrl+C: termina a tarefa atual e sai
+        for sinal in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sinal, lambda *_: parar.append(True))
+
+        total = 0
+        proxima_manutencao = 0
+        while not parar:
+            close_old_connections()
+            try:
+                if time.monotonic() >= proxima_manutencao:
+                    recuperar_travadas()
+                    limpar_concluidas()
+                    proxima_manutencao = time.monotonic() + MANUTENCAO_INTERVALO
+                executadas = processar(options['lote'])
+            except Exception as e:
+                # banco fora do ar etc.: não derruba o worker
+                print(f"[TAREFAS] Erro no worker: {e}")
+                close_old_connections()
+                executadas = 0
+                if options['uma_vez']:
+                    raise
+
+            total += executadas
+            if not executadas:
+                if options['uma_vez']:
+                    break
+                time.sleep(options['intervalo'])
+
+        self.stdout.write(self.style.SUCCESS(f'✔ {total} tarefa(s) processada(s).'))
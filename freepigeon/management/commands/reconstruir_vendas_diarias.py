@@ -0,0 +1,27 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from freepigeon.vendas import reconstruir_vendas_diarias
+
+
+class Command(BaseCommand):
+    help = 'Recalcula o consolidado diário de vendas (VendaDiaria) a partir dos pedidos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--desde',
+            help='Recalcula só a partir desta data (AAAA-MM-DD). Sem isso, recalcula tudo.'
+        )
+        parser.add_argument('--lote', type=int, default=2000, help='Linhas por bulk_create.')
+
+    def handle(self, *args, **options):
+        desde = None
+        if options['desde']:
+            try:
+                desde = date.fromisoformat(options['desde'])
+            except ValueError:
+                raise CommandError('Data inválida em --desde. Use AAAA-MM-DD.')
+
+        total = reconstruir_vendas_diarias(desde=desde, lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'✔ {total} linha(s) de venda diária gravada(s).'))
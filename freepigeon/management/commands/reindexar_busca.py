@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from freepigeon.busca import reconstruir_indice
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói o índice de busca (ProdutoBusca) de todos os produtos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Produtos por transação.')
+
+    def handle(self, *args, **options):
+        total = reconstruir_indice(lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'✔ {total} produto(s) indexado(s).'))
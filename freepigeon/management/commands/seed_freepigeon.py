@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from freepigeon.sintetico import semear
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera dados sintéticos para teste de carga (lojas, planos, usuários, '
+        'endereços, categorias, produtos, atributos, carrinhos e pedidos). '
+        'No Postgres usa COPY. Cada opção é o total de linhas do model; as '
+        'não informadas são derivadas das outras.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=1000)
+        parser.add_argument('--produtos', type=int, default=5000)
+        parser.add_argument('--pedidos', type=int, default=10000)
+        parser.add_argument('--itens', type=int, help='Itens de pedido (PedidoProduto). Padrão: 3 por pedido.')
+        parser.add_argument('--lojas', type=int, help='Padrão: 1 para cada 50 usuários.')
+        parser.add_argument('--planos', type=int, default=3, help='Planos pagos, além do padrão.')
+        parser.add_argument('--enderecos', type=int, help='Padrão: 1,5 por usuário.')
+        parser.add_argument('--categorias', type=int, default=20)
+        parser.add_argument('--atributos', type=int, help='Linhas de ProdutoAtributo. Padrão: 2 por produto.')
+        parser.add_argument('--carrinhos', type=int, help='Padrão: 1 para cada 5 usuários.')
+        parser.add_argument('--itens-carrinho', type=int, help='Padrão: 3 por carrinho.')
+        parser.add_argument(
+            '--assimetria', type=float, default=0.8,
+            help='Expoente Zipf da popularidade (0 = uniforme; maior = vendas mais concentradas).',
+        )
+        parser.add_argument('--dias', type=int, default=180, help='Pedidos espalhados pelos últimos N dias.')
+        parser.add_argument('--semente', type=int, default=42, help='Mesma semente, mesmos dados.')
+        parser.add_argument('--lote', type=int, default=10000, help='Linhas por COPY/INSERT.')
+        parser.add_argument(
+            '--sem-derivados', action='store_true',
+            help='Não reconstrói índice de busca nem consolidado de vendas (rode os comandos depois).',
+        )
+
+    def handle(self, *args, **options):
+        if min(options['usuarios'], options['produtos'], options['lote']) < 1 or options['pedidos'] < 0:
+            raise CommandError('--usuarios, --produtos e --lote precisam ser maiores que zero.')
+
+        criados = semear(
+            usuarios=options['usuarios'],
+            produtos=options['produtos'],
+            pedidos=options['pedidos'],
+            itens=options['itens'],
+            lojas=options['lojas'],
+            planos=options['planos'],
+            enderecos=options['enderecos'],
+            categorias=options['categorias'],
+            atributos=options['atributos'],
+            carrinhos=options['carrinhos'],
+            itens_carrinho=options['itens_carrinho'],
+            assimetria=options['assimetria'],
+            dias=options['dias'],
+            semente=options['semente'],
+            lote=options['lote'],
+            derivados=not options['sem_derivados'],
+            log=self.stdout.write,
+        )
+        for modelo, linhas in criados.items():
+            self.stdout.write(f'  {modelo}: {linhas}')
+        self.stdout.write(self.style.SUCCESS(f'✔ {sum(criados.values())} linha(s) gerada(s).'))
@@ -0,0 +1,84 @@
+# freepigeon/metricas.py
+"""
+Métricas do painel administrativo, calculadas no banco.
+
+Nada aqui itera pedidos em Python: os números saem de agregações do ORM e
+os cards do dashboard são lidos numa única consulta (uma subquery por
+tabela, ver agregado()).
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, F, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Pedido, Produto, Usuario, VendaDiaria
+
+
+# Valor dos itens de um pedido (quantidade x preço pago), visto a partir de Pedido
+VALOR_ITENS_PEDIDO = F('itens__quantidade') * F('itens__preco_unitario')
+
+
+def soma_dinheiro(expressao):
+    """Sum em reais, 0.00 quando não há linhas."""
+    return Coalesce(
+        Sum(expressao), Value(Decimal('0.00')),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+
+
+def sem_agrupar(queryset):
+    """
+    Agrupa por uma constante: o GROUP BY some e um .annotate() com
+    agregações devolve uma única linha com os totais da queryset inteira
+    (mesmo vazia), ao lado de outras colunas como as de agregado().
+    """
+    return queryset.order_by().annotate(grupo=Value(1)).values('grupo')
+
+
+def agregado(queryset, expressao):
+    """Subquery com 'expressao' (Count, Sum...) calculada sobre a queryset inteira."""
+    return Subquery(sem_agrupar(queryset).annotate(valor=expressao).values('valor'))
+
+
+def _inicio_do_dia(dia):
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+def metricas_dashboard(hoje=None):
+    """
+    Cards do dashboard:
+      - receita_total: soma de todos os itens vendidos
+      - pedidos_hoje: pedidos criados hoje
+      - usuarios_ativos: usuários com ativo=True
+      - produtos_cadastrados: total de produtos
+    """
+    hoje = hoje or timezone.localdate()
+    inicio = _inicio_do_dia(hoje)
+
+    return (
+        sem_agrupar(Produto.objects.all())
+        .annotate(
+            produtos_cadastrados=Count('id'),
+            # receita vem do consolidado diário (ver vendas.py)
+            receita_total=agregado(VendaDiaria.objects.all(), soma_dinheiro('faturamento')),
+            pedidos_hoje=agregado(
+                Pedido.objects.filter(data_efetuado__gte=inicio, data_efetuado__lt=inicio + timedelta(days=1)),
+                Count('id'),
+            ),
+            usuarios_ativos=agregado(Usuario.objects.filter(ativo=True), Count('id')),
+        )
+        .values('receita_total', 'pedidos_hoje', 'usuarios_ativos', 'produtos_cadastrados')
+        .get()
+    )
+
+
+def ultimos_pedidos(limite=5):
+    """Últimos pedidos com o total (total_valor) somado no banco; 0 se não tiver itens."""
+    return list(
+        Pedido.objects
+        .select_related('usuario')
+        .annotate(total_valor=soma_dinheiro(VALOR_ITENS_PEDIDO))
+        .order_by('-data_efetuado', '-id')[:limite]
+    )
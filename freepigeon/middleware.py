@@ -0,0 +1,51 @@
+# freepigeon/middleware.py
+from functools import partial
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
+
+from .consultas import RegistroConsultas
+from .sessao import aget_usuario, get_usuario
+
+
+class UsuarioMiddleware(MiddlewareMixin):
+    """
+    Disponibiliza o usuário logado (login próprio, via sessão) como
+    request.usuario / await request.ausuario(). Precisa vir depois do
+    SessionMiddleware. Nada é consultado se a view não usar o usuário.
+    """
+
+    def process_request(self, request):
+        request.usuario = SimpleLazyObject(partial(get_usuario, request))
+        request.ausuario = partial(aget_usuario, request)
+
+
+class ConsultasMiddleware:
+    """
+    Dev/staging: conta as queries de cada requisição (ver consultas.py).
+    Responde com os headers X-Consultas, X-Consultas-Tempo-Ms e
+    X-Consultas-Repetidas, e escreve uma linha [CONSULTAS] no log, com os
+    formatos repetidos (suspeita de N+1) quando houver.
+    Desligado se CONSULTAS_INSTRUMENTAR = False (padrão: DEBUG).
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'CONSULTAS_INSTRUMENTAR', settings.DEBUG):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with RegistroConsultas() as registro:
+            response = self.get_response(request)
+
+        repetidas = registro.repetidas()
+        response['X-Consultas'] = str(registro.total)
+        response['X-Consultas-Tempo-Ms'] = f"{registro.tempo_ms:.1f}"
+        response['X-Consultas-Repetidas'] = str(len(repetidas))
+
+        print(f"[CONSULTAS] {request.method} {request.path} -> {registro.resumo()}")
+        for sql, vezes in repetidas:
+            print(f"[CONSULTAS]   N+1? {vezes}x {sql[:200]}")
+        return response
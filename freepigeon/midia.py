@@ -0,0 +1,152 @@
+# freepigeon/midia.py
+"""
+Uploads (MEDIA): nome pelo conteúdo e entrega com cache longo.
+
+- NomePorConteudo('produtos'): upload_to dos ImageField. O arquivo vai para
+  produtos/<sha256 do conteúdo, 16 hex>.<ext>. Um nome nunca muda de
+  conteúdo (imagem nova = nome novo; as miniaturas herdam o nome, ver
+  imagens.py), então navegador e CDN podem guardar a imagem para sempre.
+- servir_midia: entrega os arquivos do storage local (MEDIA_STORAGE=local)
+  no lugar do static() do Django, que só funciona com DEBUG e não manda
+  cabeçalho de cache:
+    - Cache-Control immutable de 1 ano para nomes com hash; 1 hora, com
+      revalidação, para uploads antigos (nome escolhido pelo usuário);
+    - ETag / Last-Modified (304 em If-None-Match / If-Modified-Since);
+    - Range de um intervalo (206), com If-Range.
+  Com MEDIA_STORAGE=s3 quem entrega é o bucket/CDN (o Cache-Control vai
+  gravado em cada objeto, ver settings) e esta view sai das URLs.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.deconstruct import deconstructible
+from django.utils.http import http_date, parse_etags
+from django.views.decorators.http import require_safe
+
+TAMANHO_HASH = 16
+
+CACHE_IMUTAVEL = 'public, max-age=31536000, immutable'
+CACHE_CURTO = 'public, max-age=3600'
+
+# <hash>.<ext> ou miniatura <hash>.<largura>w.<ext>; o storage pode pôr
+# _xxxxxxx no fim se o mesmo conteúdo for enviado de novo
+_NOME_COM_HASH = re.compile(rf'(?:^|/)[0-9a-f]{{{TAMANHO_HASH}}}(?:_[0-9A-Za-z]{{7}})?(?:\.\d+w)?\.\w+$')
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+# ============================================================
+# NOMES
+# ============================================================
+
+def hash_conteudo(arquivo):
+    """sha256 (TAMANHO_HASH primeiros hex) do arquivo; deixa a leitura no início para o save."""
+    sha = hashlib.sha256()
+    for bloco in arquivo.chunks():  # chunks() volta ao início
+        sha.update(bloco)
+    arquivo.seek(0)
+    return sha.hexdigest()[:TAMANHO_HASH]
+
+
+@deconstructible
+class NomePorConteudo:
+    """
+    upload_to: '<pasta>/<hash><ext>'. Vale para upload atribuído ao campo
+    e salvo com o objeto (Produto.objects.create(imagem=...), obj.save()).
+    """
+
+    def __init__(self, pasta, campo='imagem'):
+        self.pasta = pasta
+        self.campo = campo
+
+    def __call__(self, instance, filename):
+        extensao = os.path.splitext(filename)[1].lower()
+        return f"{self.pasta}/{hash_conteudo(getattr(instance, self.campo))}{extensao}"
+
+
+def nome_imutavel(nome):
+    return bool(_NOME_COM_HASH.search(nome))
+
+
+# ============================================================
+# ENTREGA
+# ============================================================
+
+def _intervalo(cabecalho, tamanho):
+    """
+    (inicio, fim) do Range 'bytes=...' (fim incluso), None para ignorar o
+    cabeçalho (ausente, vários intervalos, outra unidade) ou False se não
+    dá para atender (416).
+    """
+    encontrado = _RANGE.match(cabecalho or '')
+    if not encontrado:
+        return None
+    inicio, fim = encontrado.groups()
+    if not inicio:
+        if not fim:
+            return None
+        # bytes=-500: os últimos 500
+        inicio, fim = max(tamanho - int(fim), 0), tamanho - 1
+    else:
+        inicio, fim = int(inicio), min(int(fim), tamanho - 1) if fim else tamanho - 1
+    if inicio >= tamanho or inicio > fim:
+        return False
+    return inicio, fim
+
+
+@require_safe
+def servir_midia(request, caminho):
+    storage = default_storage
+    try:
+        arquivo = storage.open(caminho, 'rb')
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError, SuspiciousFileOperation):
+        raise Http404('Arquivo não encontrado.')
+
+    tamanho = storage.size(caminho)
+    modificado = storage.get_modified_time(caminho).timestamp()
+    etag = f'"{int(modificado):x}-{tamanho:x}"'
+    cabecalhos = {
+        'Cache-Control': CACHE_IMUTAVEL if nome_imutavel(caminho) else CACHE_CURTO,
+        'ETag': etag,
+        'Last-Modified': http_date(modificado),
+        'Accept-Ranges': 'bytes',
+    }
+
+    resposta = get_conditional_response(request, etag=etag, last_modified=int(modificado))
+    intervalo = _intervalo(request.headers.get('Range'), tamanho)
+    if_range = request.headers.get('If-Range')
+    if intervalo and if_range and etag not in parse_etags(if_range) and if_range != cabecalhos['Last-Modified']:
+        intervalo = None  # o arquivo mudou desde a parte que o cliente tem: manda inteiro
+
+    if resposta is not None:
+        arquivo.close()
+    elif intervalo is False:
+        arquivo.close()
+        resposta = HttpResponse(status=416)
+        resposta['Content-Range'] = f'bytes */{tamanho}'
+    elif intervalo:
+        inicio, fim = intervalo
+        with arquivo:
+            arquivo.seek(inicio)
+            parte = arquivo.read(fim - inicio + 1) if request.method == 'GET' else b''
+        resposta = HttpResponse(parte, status=206)
+        resposta['Content-Range'] = f'bytes {inicio}-{fim}/{tamanho}'
+        resposta['Content-Length'] = fim - inicio + 1
+    elif request.method == 'HEAD':
+        arquivo.close()
+        resposta = HttpResponse()
+        resposta['Content-Length'] = tamanho
+    else:
+        resposta = FileResponse(arquivo)
+        resposta['Content-Length'] = tamanho
+
+    if resposta.status_code in (200, 206):
+        resposta['Content-Type'] = mimetypes.guess_type(caminho)[0] or 'application/octet-stream'
+    for nome, valor in cabecalhos.items():
+        resposta[nome] = valor
+    return resposta
@@ -0,0 +1,87 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:10
+
+import unicodedata
+
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+
+
+# Cópias de busca.PESOS (letra de cada campo) e busca.normalizar como eram
+# nesta migração: mudanças em busca.py não podem alterar o histórico.
+PESOS = {'nome': 'A', 'categoria': 'B', 'atributos': 'C', 'descricao': 'D'}
+
+
+def normalizar(texto):
+    texto = unicodedata.normalize('NFKD', str(texto or ''))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return texto.lower()
+
+
+def criar_indice_gin(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS freepigeon_produtobusca_vetor_gin '
+        'ON freepigeon_produtobusca USING GIN (vetor)'
+    )
+
+
+def remover_indice_gin(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS freepigeon_produtobusca_vetor_gin')
+
+
+def popular_indice(apps, schema_editor):
+    Produto = apps.get_model('freepigeon', 'Produto')
+    ProdutoBusca = apps.get_model('freepigeon', 'ProdutoBusca')
+
+    produtos = (
+        Produto.objects
+        .select_related('categoria')
+        .prefetch_related('atributos__atributo')
+        .order_by('id')
+    )
+    registros = []
+    for produto in produtos.iterator(chunk_size=1000):
+        atributos = ' '.join(f"{pa.atributo.nome} {pa.valor}" for pa in produto.atributos.all())
+        registros.append(ProdutoBusca(
+            produto_id=produto.id,
+            nome=normalizar(produto.nome),
+            categoria=normalizar(produto.categoria.nome),
+            atributos=normalizar(atributos),
+            descricao=normalizar(produto.descricao),
+        ))
+    ProdutoBusca.objects.bulk_create(registros, batch_size=1000)
+
+    if schema_editor.connection.vendor == 'postgresql':
+        vetor = None
+        for campo, peso in PESOS.items():
+            parte = SearchVector(campo, weight=peso, config='portuguese')
+            vetor = parte if vetor is None else vetor + parte
+        ProdutoBusca.objects.update(vetor=vetor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freepigeon', '0009_usuario_ativo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProdutoBusca',
+            fields=[
+                ('produto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='busca', serialize=False, to='freepigeon.produto')),
+                ('nome', models.TextField(blank=True, default='')),
+                ('categoria', models.TextField(blank=True, default='')),
+                ('atributos', models.TextField(blank=True, default='')),
+                ('descricao', models.TextField(blank=True, default='')),
+                ('vetor', django.contrib.postgres.search.SearchVectorField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(criar_indice_gin, remover_indice_gin),
+        migrations.RunPython(popular_indice, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freepigeon', '0010_produtobusca'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['-data_efetuado', '-id'], name='pedido_data_id_idx'),
+        ),
+    ]
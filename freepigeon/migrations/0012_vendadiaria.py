@@ -0,0 +1,68 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def popular_vendas_diarias(apps, schema_editor):
+    # Mesma conta de vendas.consolidar, copiada: a migração não pode mudar
+    # junto com o código do app.
+    PedidoProduto = apps.get_model('freepigeon', 'PedidoProduto')
+    VendaDiaria = apps.get_model('freepigeon', 'VendaDiaria')
+
+    linhas = (
+        PedidoProduto.objects
+        .annotate(dia=TruncDate('pedido__data_efetuado'))
+        .order_by()
+        .values('dia', 'produto_id', 'produto__vendedor_id', 'produto__loja_id')
+        .annotate(
+            qtd=Sum('quantidade'),
+            valor=Sum(F('quantidade') * F('preco_unitario')),
+            n_pedidos=Count('pedido', distinct=True),
+        )
+    )
+    VendaDiaria.objects.bulk_create(
+        (
+            VendaDiaria(
+                data=linha['dia'],
+                produto_id=linha['produto_id'],
+                vendedor_id=linha['produto__vendedor_id'],
+                loja_id=linha['produto__loja_id'],
+                quantidade=linha['qtd'],
+                faturamento=linha['valor'],
+                pedidos=linha['n_pedidos'],
+            )
+            for linha in linhas.iterator(chunk_size=2000)
+        ),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freepigeon', '0011_pedido_data_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VendaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('quantidade', models.PositiveIntegerField(default=0)),
+                ('faturamento', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('pedidos', models.PositiveIntegerField(default=0)),
+                ('loja', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='freepigeon.loja')),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vendas_diarias', to='freepigeon.produto')),
+                ('vendedor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='freepigeon.usuario')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['vendedor', 'data'], name='venda_diaria_vendedor_idx'), models.Index(fields=['loja', 'data'], name='venda_diaria_loja_idx')],
+                'unique_together': {('data', 'produto')},
+            },
+        ),
+        migrations.RunPython(popular_vendas_diarias, migrations.RunPython.noop),
+    ]
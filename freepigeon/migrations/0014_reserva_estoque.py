@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freepigeon', '0013_pedido_stripe_eventostripe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produto',
+            name='q_reservado',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='Reserva',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lote', models.CharField(db_index=True, max_length=32)),
+                ('quantidade', models.PositiveIntegerField()),
+                ('criada_em', models.DateTimeField(auto_now_add=True)),
+                ('expira_em', models.DateTimeField(db_index=True)),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='freepigeon.produto')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='freepigeon.usuario')),
+            ],
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:58
+
+import django.db.models.expressions
+import django.db.models.functions.math
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freepigeon', '0014_reserva_estoque'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produto',
+            name='preco_final',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(desconto__gt=0, then=django.db.models.functions.math.Round(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('valor'), '*', django.db.models.expressions.CombinedExpression(models.Value(100), '-', models.F('desconto'))), '*', models.Value(Decimal('0.01'))), 2)), default=models.F('valor')), output_field=models.DecimalField(decimal_places=2, max_digits=10)),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(condition=models.Q(('ativo', True)), fields=['categoria', 'preco_final', 'id'], name='produto_categoria_preco_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(condition=models.Q(('ativo', True)), fields=['preco_final', 'id'], name='produto_preco_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freepigeon', '0015_produto_preco_final'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='produtoatributo',
+            index=models.Index(fields=['atributo', 'valor', 'produto'], name='produto_atributo_valor_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:06
+
+from django.db import migrations, models
+
+
+def criar_indice_gin(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    # jsonb_path_ops: índice menor, atende o containment (@>) de atributos.filtro_ficha
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS freepigeon_produto_ficha_gin '
+        'ON freepigeon_produto USING GIN (ficha jsonb_path_ops)'
+    )
+
+
+def remover_indice_gin(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS freepigeon_produto_ficha_gin')
+
+
+def popular_fichas(apps, schema_editor):
+    Produto = apps.get_model('freepigeon', 'Produto')
+    ProdutoAtributo = apps.get_model('freepigeon', 'ProdutoAtributo')
+
+    linhas = (
+        ProdutoAtributo.objects
+        .order_by('produto_id')
+        .values_list('produto_id', 'atributo__nome', 'valor')
+    )
+    fichas = {}
+    for produto_id, nome, valor in linhas.iterator(chunk_size=5000):
+        fichas.setdefault(produto_id, {})[nome] = valor
+    Produto.objects.bulk_update(
+        [Produto(id=produto_id, ficha=ficha) for produto_id, ficha in fichas.items()],
+        ['ficha'],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freepigeon', '0016_produtoatributo_valor_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produto',
+            name='ficha',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(popular_fichas, migrations.RunPython.noop),
+        migrations.RunPython(criar_indice_gin, remover_indice_gin),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freepigeon', '0017_produto_ficha'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='categoria',
+            name='miniaturas',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='produto',
+            name='miniaturas',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+    ]
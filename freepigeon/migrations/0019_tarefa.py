@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:15
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freepigeon', '0018_miniaturas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tarefa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=200)),
+                ('argumentos', models.JSONField(blank=True, default=dict)),
+                ('prioridade', models.SmallIntegerField(default=0)),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('executando', 'Executando'), ('concluida', 'Concluída'), ('falhou', 'Falhou')], default='pendente', max_length=20)),
+                ('tentativas', models.PositiveSmallIntegerField(default=0)),
+                ('max_tentativas', models.PositiveSmallIntegerField(default=5)),
+                ('executar_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('chave', models.CharField(blank=True, max_length=200, null=True)),
+                ('erro', models.TextField(blank=True, default='')),
+                ('criada_em', models.DateTimeField(auto_now_add=True)),
+                ('iniciada_em', models.DateTimeField(blank=True, null=True)),
+                ('concluida_em', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('status', 'pendente')), fields=['-prioridade', 'executar_em', 'id'], name='tarefa_fila_idx'), models.Index(fields=['status', 'concluida_em'], name='tarefa_status_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'pendente')), fields=('chave',), name='tarefa_chave_pendente_unica')],
+            },
+        ),
+    ]
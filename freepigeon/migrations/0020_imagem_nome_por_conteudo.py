@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:19
+
+import freepigeon.midia
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freepigeon', '0019_tarefa'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='categoria',
+            name='imagem',
+            field=models.ImageField(blank=True, null=True, upload_to=freepigeon.midia.NomePorConteudo('categorias')),
+        ),
+        migrations.AlterField(
+            model_name='produto',
+            name='imagem',
+            field=models.ImageField(blank=True, null=True, upload_to=freepigeon.midia.NomePorConteudo('produtos')),
+        ),
+    ]
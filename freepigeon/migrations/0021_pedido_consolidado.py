@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:01
+
+from django.db import migrations, models
+
+
+def marcar_consolidados(apps, schema_editor):
+    # O que já está em VendaDiaria foi somado; ficam de fora só os pedidos
+    # cuja tarefa consolidar_pedido ainda não terminou (ela soma quando rodar).
+    Pedido = apps.get_model('freepigeon', 'Pedido')
+    Tarefa = apps.get_model('freepigeon', 'Tarefa')
+
+    na_fila = (
+        Tarefa.objects
+        .filter(nome='freepigeon.vendas.consolidar_pedido', status__in=['pendente', 'executando'])
+        .values_list('argumentos__pedido_id', flat=True)
+    )
+    Pedido.objects.exclude(id__in=list(na_fila)).update(consolidado=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freepigeon', '0020_imagem_nome_por_conteudo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='consolidado',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(marcar_consolidados, migrations.RunPython.noop),
+    ]
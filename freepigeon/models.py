@@ -1,8 +1,14 @@
 from django.db import models
-from decimal import Decimal
+from django.db.models import Case, ExpressionWrapper, F, Prefetch, Q, Sum, Value, When, Window
+from django.db.models.functions import Coalesce, Round
+from decimal import Decimal, ROUND_HALF_UP
 from django.contrib.auth.hashers import make_password, check_password
+from django.contrib.postgres.search import SearchVectorField
 from django.db.models.signals import post_migrate
 from django.dispatch import receiver
+from django.utils import timezone
+
+from .midia import NomePorConteudo
 
 
 # =========================
@@ -89,7 +95,9 @@ class Endereco(models.Model):
 # =========================
 class Categoria(models.Model):
     nome = models.CharField(max_length=255)
-    imagem = models.ImageField(upload_to='categorias/', blank=True, null=True)
+    imagem = models.ImageField(upload_to=NomePorConteudo('categorias'), blank=True, null=True)
+    # larguras das miniaturas geradas da imagem (ver imagens.py)
+    miniaturas = models.JSONField(default=list, blank=True, editable=False)
 
     def __str__(self):
         return self.nome
@@ -104,6 +112,8 @@ class Produto(models.Model):
     valor = models.DecimalField(max_digits=10, decimal_places=2)
     desconto = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
     q_estoque = models.IntegerField()
+    # Unidades presas em checkouts abertos (ver reservas.py)
+    q_reservado = models.PositiveIntegerField(default=0)
     categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE)
 
     loja = models.ForeignKey(Loja, on_delete=models.SET_NULL, null=True, blank=True)
@@ -115,17 +125,61 @@ class Produto(models.Model):
         blank=True
     )
 
-    imagem = models.ImageField(upload_to='produtos/', blank=True, null=True)
+    imagem = models.ImageField(upload_to=NomePorConteudo('produtos'), blank=True, null=True)
+    # larguras das miniaturas geradas da imagem (ver imagens.py)
+    miniaturas = models.JSONField(default=list, blank=True, editable=False)
 
     ativo = models.BooleanField(default=True)
 
+    # Ficha técnica {atributo: valor}: cópia de ProdutoAtributo, mantida por
+    # freepigeon/atributos.py (jsonb com índice GIN no PostgreSQL)
+    ficha = models.JSONField(default=dict, blank=True, editable=False)
+
+    # Preço com desconto, calculado pelo próprio banco (coluna gerada): dá
+    # para ordenar, filtrar faixa de preço e somar no SQL. Mesma conta de
+    # calcular_preco_final(), arredondada em centavos.
+    # Era o método preco_final(); o campo ocupa o nome, então agora é
+    # atributo (produto.preco_final, sem parênteses; nos templates não muda).
+    preco_final = models.GeneratedField(
+        expression=Case(
+            When(desconto__gt=0, then=Round(F('valor') * (100 - F('desconto')) * Decimal('0.01'), 2)),
+            default=F('valor'),
+        ),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            # vitrine ordenada por preço (paginação por cursor: preco_final, id)
+            models.Index(
+                fields=['categoria', 'preco_final', 'id'],
+                name='produto_categoria_preco_idx',
+                condition=Q(ativo=True),
+            ),
+            models.Index(fields=['preco_final', 'id'], name='produto_preco_idx', condition=Q(ativo=True)),
+        ]
+
     def __str__(self):
         return self.nome
 
-    def preco_final(self):
-        if self.desconto:
-            return self.valor * (1 - self.desconto / 100)
-        return self.valor
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # O UPDATE não devolve a coluna gerada: recalcula aqui em vez de
+        # reler do banco (o INSERT já devolve).
+        self.preco_final = self.calcular_preco_final()
+
+    def calcular_preco_final(self):
+        """preco_final a partir de valor/desconto em memória (antes de salvar, por exemplo)."""
+        valor = Decimal(str(self.valor))
+        if self.desconto and Decimal(str(self.desconto)) > 0:
+            valor = valor * (100 - Decimal(str(self.desconto))) / 100
+        return valor.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+    @property
+    def disponivel(self):
+        """Estoque livre para venda: estoque menos o que está reservado."""
+        return max(self.q_estoque - self.q_reservado, 0)
 
 # =========================
 # TABELAS DE ATRIBUTOS DINÂMICOS
@@ -144,11 +198,40 @@ class ProdutoAtributo(models.Model):
 
     class Meta:
         unique_together = ('produto', 'atributo')
+        indexes = [
+            # filtro e contagem por valor de atributo (facetas.py) só pelo índice
+            models.Index(fields=['atributo', 'valor', 'produto'], name='produto_atributo_valor_idx'),
+        ]
 
     def __str__(self):
         return f"{self.produto.nome} - {self.atributo.nome}: {self.valor}"
 
 
+# =========================
+# TABELA: ProdutoBusca (índice de busca)
+# =========================
+class ProdutoBusca(models.Model):
+    """
+    Documento de busca de um produto, mantido em sincronia por freepigeon/busca.py.
+    Os textos ficam normalizados (minúsculos e sem acento).
+    'vetor' só é preenchido no PostgreSQL (tsvector com índice GIN).
+    """
+    produto = models.OneToOneField(
+        Produto,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='busca'
+    )
+    nome = models.TextField(blank=True, default='')
+    categoria = models.TextField(blank=True, default='')
+    atributos = models.TextField(blank=True, default='')
+    descricao = models.TextField(blank=True, default='')
+    vetor = SearchVectorField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Busca: {self.nome}"
+
+
 # =========================
 # TABELA: Carrinho
 # =========================
@@ -157,40 +240,144 @@ class Carrinho(models.Model):
     data_criacao = models.DateTimeField(auto_now_add=True, null=True)
 
     def total(self):
-        total = sum(item.subtotal() for item in self.itens.all())
-        return total
+        """Soma dos subtotais, calculada no banco (uma query)."""
+        return self.itens.aggregate(
+            total=Coalesce(
+                Sum(SUBTOTAL_CARRINHO),
+                Value(Decimal('0.00')),
+                output_field=models.DecimalField(max_digits=14, decimal_places=2),
+            ),
+        )['total']
 
     def __str__(self):
         return f"Carrinho de {self.usuario.nome}"
 
 
+# quantidade x preço com desconto (coluna gerada Produto.preco_final)
+SUBTOTAL_CARRINHO = ExpressionWrapper(
+    F('quantidade') * F('produto__preco_final'),
+    output_field=models.DecimalField(max_digits=14, decimal_places=2),
+)
+
+
+class CarrinhoProdutoQuerySet(models.QuerySet):
+    def com_subtotais(self):
+        """
+        Anota no banco, junto com o produto (select_related):
+          - subtotal_valor: quantidade x preco_final do item
+          - total_valor / qtd_itens: soma do carrinho inteiro, repetida em
+            cada linha (janela), então os totais vêm na mesma query dos itens
+        """
+        return (
+            self.select_related('produto', 'produto__categoria')
+            .annotate(
+                subtotal_valor=SUBTOTAL_CARRINHO,
+                total_valor=Window(Sum(SUBTOTAL_CARRINHO)),
+                qtd_itens=Window(Sum('quantidade')),
+            )
+            .order_by('id')
+        )
+
+
 class CarrinhoProduto(models.Model):
     carrinho = models.ForeignKey(Carrinho, on_delete=models.CASCADE, related_name='itens')
     produto = models.ForeignKey(Produto, on_delete=models.CASCADE)
     quantidade = models.PositiveIntegerField(default=1)
 
+    objects = CarrinhoProdutoQuerySet.as_manager()
+
     class Meta:
         unique_together = ('carrinho', 'produto')
 
     def subtotal(self):
-        return self.produto.preco_final() * self.quantidade
+        return self.produto.preco_final * self.quantidade
 
     def __str__(self):
         return f"{self.produto.nome} (x{self.quantidade})"
 
 
+# =========================
+# TABELA: Reserva (estoque preso durante o checkout)
+# =========================
+class Reserva(models.Model):
+    # Um lote por Checkout Session; vai no metadata do Stripe
+    lote = models.CharField(max_length=32, db_index=True)
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='reservas')
+    produto = models.ForeignKey(Produto, on_delete=models.CASCADE, related_name='reservas')
+    quantidade = models.PositiveIntegerField()
+    criada_em = models.DateTimeField(auto_now_add=True)
+    expira_em = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.produto.nome} (x{self.quantidade}) até {self.expira_em:%d/%m %H:%M}"
+
+
 # =========================
 # TABELA: Pedido
 # =========================
+class PedidoQuerySet(models.QuerySet):
+    def com_totais(self):
+        """
+        Anota no banco:
+          - total_valor: soma de quantidade x preco_unitario dos itens
+          - qtd_itens: soma das quantidades
+        """
+        return self.annotate(
+            total_valor=Coalesce(
+                Sum(F('itens__quantidade') * F('itens__preco_unitario')),
+                Value(Decimal('0.00')),
+                output_field=models.DecimalField(max_digits=14, decimal_places=2),
+            ),
+            qtd_itens=Coalesce(Sum('itens__quantidade'), Value(0)),
+        )
+
+    def com_itens(self):
+        """
+        Pré-carrega os itens com o produto (só nome e imagem) e o subtotal
+        de cada item já calculado (subtotal_valor). Duas queries no total.
+        """
+        itens = (
+            PedidoProduto.objects
+            .select_related('produto')
+            .only('id', 'pedido_id', 'quantidade', 'preco_unitario',
+                  'produto__id', 'produto__nome', 'produto__imagem', 'produto__miniaturas')
+            .annotate(subtotal_valor=F('quantidade') * F('preco_unitario'))
+            .order_by('id')
+        )
+        return self.prefetch_related(Prefetch('itens', queryset=itens))
+
+
 class Pedido(models.Model):
     usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE)
     endereco = models.ForeignKey(Endereco, on_delete=models.SET_NULL, null=True)
     data_efetuado = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=50, default='Pendente')
+    # Checkout Session do Stripe que gerou o pedido (um pedido por sessão)
+    stripe_session_id = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    valor_pago = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    # já somado em VendaDiaria (pela fila ou pelo recálculo): soma uma vez só, ver vendas.py
+    consolidado = models.BooleanField(default=False, editable=False)
+
+    objects = PedidoQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # listagens "mais recentes primeiro" (dashboard, transações, meus pedidos)
+            models.Index(fields=['-data_efetuado', '-id'], name='pedido_data_id_idx'),
+        ]
 
     def total(self):
         return sum(item.subtotal() for item in self.itens.all())
 
+    def resumo_produtos(self):
+        """Ex: 'Fone (x1), Cabo (x2) + 3 itens'. Use com com_itens() para não gerar N+1."""
+        nomes = [f"{item.produto.nome} (x{item.quantidade})" for item in self.itens.all()]
+        if not nomes:
+            return "-"
+        if len(nomes) > 2:
+            return ", ".join(nomes[:2]) + f" + {len(nomes) - 2} itens"
+        return ", ".join(nomes)
+
     def __str__(self):
         return f"Pedido #{self.id} - {self.usuario.nome}"
 
@@ -208,6 +395,107 @@ class PedidoProduto(models.Model):
         return f"{self.produto.nome} (x{self.quantidade})"
 
 
+# =========================
+# TABELA: EventoStripe (webhooks processados)
+# =========================
+class EventoStripe(models.Model):
+    """Eventos de webhook já processados (o Stripe pode reenviar o mesmo evento)."""
+    id = models.CharField(max_length=255, primary_key=True)  # evt_...
+    tipo = models.CharField(max_length=100)
+    recebido_em = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.tipo} ({self.id})"
+
+
+# =========================
+# TABELA: VendaDiaria (consolidado de vendas)
+# =========================
+class VendaDiaria(models.Model):
+    """
+    Vendas consolidadas por dia x produto. Atualizada por freepigeon/vendas.py
+    a cada pedido pago e reconstruível com 'manage.py reconstruir_vendas_diarias'.
+    vendedor/loja são cópias dos do produto (para filtrar sem join), lidas
+    quando a linha é gravada: PedidoProduto não guarda quem vendeu, então se
+    o produto mudar de loja a reconstrução passa o histórico para a loja nova.
+    """
+    data = models.DateField()
+    produto = models.ForeignKey(Produto, on_delete=models.CASCADE, related_name='vendas_diarias')
+    vendedor = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True)
+    loja = models.ForeignKey(Loja, on_delete=models.SET_NULL, null=True, blank=True)
+    quantidade = models.PositiveIntegerField(default=0)
+    faturamento = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    pedidos = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('data', 'produto')
+        indexes = [
+            models.Index(fields=['vendedor', 'data'], name='venda_diaria_vendedor_idx'),
+            models.Index(fields=['loja', 'data'], name='venda_diaria_loja_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.data} - {self.produto_id}: {self.quantidade} un."
+
+
+# =========================
+# TABELA: Tarefa (fila de tarefas em segundo plano)
+# =========================
+class Tarefa(models.Model):
+    """
+    Trabalho adiado para o worker ('manage.py processar_tarefas').
+    Criada por freepigeon/tarefas.py; veja lá o ciclo de vida.
+    """
+    PENDENTE = 'pendente'
+    EXECUTANDO = 'executando'
+    CONCLUIDA = 'concluida'
+    FALHOU = 'falhou'
+    STATUS_CHOICES = [
+        (PENDENTE, 'Pendente'),
+        (EXECUTANDO, 'Executando'),
+        (CONCLUIDA, 'Concluída'),
+        (FALHOU, 'Falhou'),
+    ]
+
+    # caminho da função, ex: 'freepigeon.imagens.tarefa_miniaturas'
+    nome = models.CharField(max_length=200)
+    argumentos = models.JSONField(default=dict, blank=True)
+    # maior primeiro
+    prioridade = models.SmallIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDENTE)
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    max_tentativas = models.PositiveSmallIntegerField(default=5)
+    executar_em = models.DateTimeField(default=timezone.now)
+    # evita tarefas pendentes repetidas (ex: 'miniaturas:freepigeon.produto:42')
+    chave = models.CharField(max_length=200, null=True, blank=True)
+    erro = models.TextField(blank=True, default='')
+    criada_em = models.DateTimeField(auto_now_add=True)
+    iniciada_em = models.DateTimeField(null=True, blank=True)
+    concluida_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # a fila do worker: só as pendentes, na ordem em que são pegas
+            models.Index(
+                fields=['-prioridade', 'executar_em', 'id'],
+                name='tarefa_fila_idx',
+                condition=Q(status='pendente'),
+            ),
+            # travadas (executando há muito tempo) e limpeza das concluídas
+            models.Index(fields=['status', 'concluida_em'], name='tarefa_status_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['chave'],
+                condition=Q(status='pendente'),
+                name='tarefa_chave_pendente_unica',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.nome} #{self.id} ({self.status})"
+
+
 # =========================
 # TABELA: AdminUser (Admin do painel)
 # =========================
@@ -0,0 +1,223 @@
+# freepigeon/pagamentos.py
+"""
+Processamento dos webhooks do Stripe.
+
+O pedido nasce aqui, quando o Stripe avisa que a Checkout Session foi paga
+(checkout.session.completed, ou async_payment_succeeded no PIX), e não mais
+no redirect do usuário para /pagamento/sucesso/.
+
+Reservas: o checkout reserva os itens (ver reservas.py) e manda o lote no
+metadata ('reserva_lote'). No pagamento o lote vira o pedido; se a sessão
+expirar sem pagamento, o lote é liberado na hora.
+
+Idempotência:
+  - cada evento é gravado em EventoStripe; um evento repetido é ignorado;
+  - Pedido.stripe_session_id é único, então eventos diferentes da mesma
+    sessão também não duplicam o pedido.
+
+Conciliação: se o webhook se perder, agendar_conciliacao() (chamada ao
+criar a sessão) deixa na fila (ver tarefas.py) uma consulta da sessão ao
+Stripe para depois que ela vence, que cria o pedido ou libera a reserva.
+
+chave_secreta(): chave da API conforme STRIPE_LIVE_MODE, usada por quem
+cria e por quem consulta as sessões.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+import stripe
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Carrinho, Endereco, EventoStripe, Pedido, Plano, Usuario
+from .pedidos import EstoqueInsuficiente, fechar_pedido
+from .reservas import converter_lote, devolver, liberar_lote
+from .sessao import invalidar_usuarios
+from .tarefas import PRIORIDADE_ALTA, enfileirar, tarefa
+
+
+# Folga depois do vencimento da sessão antes de conciliar (webhook atrasado)
+CONCILIACAO_FOLGA = timedelta(minutes=5)
+
+# Eventos que indicam que a sessão pode ter sido paga
+EVENTOS_PAGAMENTO = {
+    'checkout.session.completed',
+    'checkout.session.async_payment_succeeded',
+}
+
+
+def chave_secreta():
+    if settings.STRIPE_LIVE_MODE:
+        return settings.STRIPE_LIVE_SECRET_KEY
+    return settings.STRIPE_TEST_SECRET_KEY
+
+
+def ler_evento(payload, assinatura):
+    """
+    Valida a assinatura do webhook e devolve o evento.
+    Levanta ValueError (payload inválido) ou SignatureVerificationError.
+    """
+    return stripe.Webhook.construct_event(
+        payload, assinatura, getattr(settings, 'STRIPE_WEBHOOK_SECRET', '')
+    )
+
+
+def processar_evento(evento):
+    """
+    Processa um evento do Stripe uma única vez.
+    Retorna False se o evento já tinha sido processado.
+    """
+    with transaction.atomic():
+        _, novo = EventoStripe.objects.get_or_create(
+            id=evento['id'],
+            defaults={'tipo': evento['type']},
+        )
+        if not novo:
+            return False
+
+        if evento['type'] in EVENTOS_PAGAMENTO:
+            sessao = evento['data']['object']
+            metadata = sessao.get('metadata') or {}
+            if metadata.get('plano_slug'):
+                ativar_plano_da_sessao(sessao)
+            else:
+                criar_pedido_da_sessao(sessao)
+        elif evento['type'] == 'checkout.session.expired':
+            metadata = evento['data']['object'].get('metadata') or {}
+            liberar_lote(metadata.get('reserva_lote'))
+    return True
+
+
+def ativar_plano_da_sessao(sessao):
+    """Checkout de plano pago: troca o plano do usuário."""
+    if sessao.get('payment_status') != 'paid':
+        return
+
+    metadata = sessao.get('metadata') or {}
+    plano = Plano.objects.filter(slug=metadata.get('plano_slug')).first()
+    if plano:
+        usuario_id = metadata.get('usuario_id')
+        Usuario.objects.filter(id=usuario_id).update(plano=plano)
+        # update() não dispara signals: tira o usuário do cache na mão
+        invalidar_usuarios([usuario_id])
+
+
+def criar_pedido_da_sessao(sessao):
+    """
+    Cria o Pedido (itens, baixa de estoque e consolidado de vendas) a partir
+    da reserva do checkout (ou do carrinho, se ela já venceu) e esvazia o
+    carrinho.
+    Roda dentro da transação de processar_evento. Retorna o pedido, ou None
+    se a sessão ainda não foi paga (PIX pendente) ou não há o que registrar.
+
+    Se faltar estoque, o pagamento já foi feito: registra um pedido sem itens
+    com status 'Estoque insuficiente' (para estorno) e mantém o carrinho.
+    """
+    if sessao.get('payment_status') != 'paid':
+        return None
+
+    existente = Pedido.objects.filter(stripe_session_id=sessao['id']).first()
+    if existente:
+        return existente
+
+    metadata = sessao.get('metadata') or {}
+    usuario_id = metadata.get('usuario_id') or sessao.get('client_reference_id')
+    usuario = Usuario.objects.filter(id=usuario_id).first()
+    if not usuario:
+        print(f"[STRIPE] Sessão {sessao['id']} sem usuário válido ({usuario_id}).")
+        return None
+
+    # trava o carrinho: dois eventos da mesma compra não leem os mesmos itens
+    carrinho = Carrinho.objects.select_for_update().filter(usuario=usuario).first()
+
+    # Itens cobrados = itens reservados no checkout. Sem reserva (venceu),
+    # usa o carrinho e disputa o estoque livre normalmente.
+    reservado = converter_lote(metadata.get('reserva_lote'))
+    if reservado:
+        itens = list(reservado.items())
+    else:
+        itens = list(carrinho.itens.values_list('produto_id', 'quantidade')) if carrinho else []
+    if not itens:
+        print(f"[STRIPE] Carrinho vazio para a sessão {sessao['id']}.")
+        return None
+
+    # Endereço usado no checkout; fallback: principal ou primeiro do usuário
+    endereco = None
+    endereco_id = metadata.get('endereco_id')
+    if endereco_id:
+        endereco = Endereco.objects.filter(id=endereco_id, usuario=usuario).first()
+    if not endereco:
+        endereco = (
+            Endereco.objects.filter(usuario=usuario, principal=True).first()
+            or Endereco.objects.filter(usuario=usuario).first()
+        )
+
+    valor_pago = None
+    if sessao.get('amount_total') is not None:
+        valor_pago = Decimal(sessao['amount_total']) / 100
+
+    try:
+        pedido = fechar_pedido(
+            usuario,
+            itens,
+            endereco=endereco,
+            reservado=reservado,
+            stripe_session_id=sessao['id'],
+            valor_pago=valor_pago,
+        )
+    except EstoqueInsuficiente as e:
+        print(f"[STRIPE] Sessão {sessao['id']} paga sem estoque: {e}")
+        devolver(reservado)
+        return Pedido.objects.create(
+            usuario=usuario,
+            endereco=endereco,
+            status='Estoque insuficiente',
+            stripe_session_id=sessao['id'],
+            valor_pago=valor_pago,
+        )
+
+    if carrinho:
+        carrinho.itens.all().delete()
+    return pedido
+
+
+# ============================================================
+# CONCILIAÇÃO (webhook perdido)
+# ============================================================
+
+class SessaoPendente(Exception):
+    """Sessão ainda aberta ou com pagamento pendente (PIX): a tarefa tenta de novo depois."""
+
+
+def agendar_conciliacao(session_id, expira_em):
+    """Confere a sessão no Stripe logo depois de ela vencer (ver conciliar_sessao)."""
+    atraso = (expira_em + CONCILIACAO_FOLGA - timezone.now()).total_seconds()
+    enfileirar(conciliar_sessao, chave=f"stripe:{session_id}", atraso=max(atraso, 0), session_id=session_id)
+
+
+@tarefa(prioridade=PRIORIDADE_ALTA, max_tentativas=8, espera=5 * 60, transacao=False)
+def conciliar_sessao(session_id):
+    """
+    Faz o que o webhook faria, consultando a sessão direto no Stripe: paga
+    vira pedido (ou plano), expirada libera a reserva. Se o webhook já
+    chegou, não muda nada (mesma idempotência de processar_evento).
+    A consulta ao Stripe fica fora da transação: nenhuma linha travada
+    esperando a rede.
+    """
+    sessao = stripe.checkout.Session.retrieve(session_id, api_key=chave_secreta())
+    metadata = sessao.get('metadata') or {}
+
+    if sessao.get('status') == 'expired':
+        liberar_lote(metadata.get('reserva_lote'))
+        return
+    if sessao.get('payment_status') != 'paid':
+        raise SessaoPendente(f"Sessão {session_id}: {sessao.get('status')}/{sessao.get('payment_status')}")
+
+    with transaction.atomic():
+        if metadata.get('plano_slug'):
+            ativar_plano_da_sessao(sessao)
+        elif not Pedido.objects.filter(stripe_session_id=session_id).exists():
+            pedido = criar_pedido_da_sessao(sessao)
+            if pedido:
+                print(f"[STRIPE] Sessão {session_id} sem webhook: pedido #{pedido.id} criado na conciliação.")
@@ -0,0 +1,185 @@
+# freepigeon/paginacao.py
+"""
+Paginação por cursor (keyset).
+
+Em vez de OFFSET, cada página guarda os valores da ordenação da última
+(ou primeira) linha num token opaco e assinado. A próxima página vira um
+WHERE sobre esses valores, então o custo não cresce com o tamanho da tabela.
+
+Uso na view:
+    pagina = paginar(request, queryset, ordenacao=('-data_efetuado', '-id'))
+    render(..., {'pedidos': pagina.itens, 'pagina': pagina})
+
+E no template:
+    {% include 'partials/paginacao.html' %}
+
+A ordenação precisa terminar num campo único (normalmente 'id'/'-id').
+"""
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from django.core import signing
+from django.db.models import Q
+
+POR_PAGINA_PADRAO = 24
+POR_PAGINA_MAX = 100
+
+_SALT = 'freepigeon.paginacao'
+
+
+def _campos(ordenacao):
+    return [(campo.lstrip('-'), campo.startswith('-')) for campo in ordenacao]
+
+
+# Valores do cursor vão com o tipo e na precisão total: o WHERE compara por
+# igualdade, então um datetime cortado em milissegundos (DjangoJSONEncoder)
+# pula as linhas empatadas naquele milissegundo.
+
+def _empacotar(valor):
+    if isinstance(valor, datetime):
+        return {'dt': valor.isoformat()}
+    if isinstance(valor, date):
+        return {'d': valor.isoformat()}
+    if isinstance(valor, Decimal):
+        return {'n': str(valor)}
+    return valor
+
+
+def _desempacotar(valor):
+    if isinstance(valor, dict):
+        if 'dt' in valor:
+            return datetime.fromisoformat(valor['dt'])
+        if 'd' in valor:
+            return date.fromisoformat(valor['d'])
+        if 'n' in valor:
+            return Decimal(valor['n'])
+        raise ValueError('valor de cursor desconhecido')
+    return valor
+
+
+def codificar_cursor(valores, direcao):
+    return signing.dumps(
+        {'v': [_empacotar(valor) for valor in valores], 'd': direcao},
+        salt=_SALT,
+        compress=True,
+    )
+
+
+def decodificar_cursor(token):
+    """Retorna (valores, direcao) ou (None, None) se o token for inválido."""
+    if not token:
+        return None, None
+    try:
+        dados = signing.loads(token, salt=_SALT)
+        return [_desempacotar(valor) for valor in dados['v']], dados['d']
+    except (signing.BadSignature, KeyError, TypeError, ValueError, InvalidOperation):
+        return None, None
+
+
+def _filtro_depois_de(campos, valores, invertido=False):
+    """
+    Monta o WHERE "linha vem depois de 'valores' na ordenação".
+    Ex: (-data, -id) -> data < v0 OR (data = v0 AND id < v1)
+    """
+    filtro = Q()
+    iguais = {}
+    for (campo, desc), valor in zip(campos, valores):
+        depois = desc != invertido
+        lookup = 'lt' if depois else 'gt'
+        filtro |= Q(**iguais, **{f"{campo}__{lookup}": valor})
+        iguais[campo] = valor
+    return filtro
+
+
+class Pagina:
+    def __init__(self, itens, cursor_proximo, cursor_anterior, por_pagina, params):
+        self.itens = itens
+        self.cursor_proximo = cursor_proximo
+        self.cursor_anterior = cursor_anterior
+        self.por_pagina = por_pagina
+        self._params = params
+
+    @property
+    def tem_proxima(self):
+        return self.cursor_proximo is not None
+
+    @property
+    def tem_anterior(self):
+        return self.cursor_anterior is not None
+
+    def _url(self, cursor):
+        params = self._params.copy()
+        params['cursor'] = cursor
+        return '?' + params.urlencode()
+
+    @property
+    def url_proxima(self):
+        return self._url(self.cursor_proximo) if self.tem_proxima else ''
+
+    @property
+    def url_anterior(self):
+        return self._url(self.cursor_anterior) if self.tem_anterior else ''
+
+    def __iter__(self):
+        return iter(self.itens)
+
+    def __len__(self):
+        return len(self.itens)
+
+
+def _por_pagina(request, padrao, maximo):
+    try:
+        valor = int(request.GET.get('por_pagina') or padrao)
+    except (TypeError, ValueError):
+        valor = padrao
+    return max(1, min(valor, maximo))
+
+
+def paginar(request, queryset, ordenacao, por_pagina=POR_PAGINA_PADRAO, max_por_pagina=POR_PAGINA_MAX):
+    """
+    Pagina 'queryset' por cursor conforme 'ordenacao' (lista de campos no
+    formato do order_by, podendo usar anotações). O cursor vem de ?cursor=
+    e o tamanho de ?por_pagina= (limitado a max_por_pagina).
+    """
+    campos = _campos(ordenacao)
+    nomes = [campo for campo, _ in campos]
+    tamanho = _por_pagina(request, por_pagina, max_por_pagina)
+
+    valores, direcao = decodificar_cursor(request.GET.get('cursor'))
+    if valores is not None and len(valores) != len(campos):
+        valores, direcao = None, None
+
+    voltando = direcao == 'p'
+    if voltando:
+        ordem_reversa = [c[1:] if c.startswith('-') else f'-{c}' for c in ordenacao]
+        qs = queryset.filter(_filtro_depois_de(campos, valores, invertido=True)).order_by(*ordem_reversa)
+    elif valores is not None:
+        qs = queryset.filter(_filtro_depois_de(campos, valores)).order_by(*ordenacao)
+    else:
+        qs = queryset.order_by(*ordenacao)
+
+    # busca um a mais para saber se existe página seguinte (na direção pedida)
+    itens = list(qs[:tamanho + 1])
+    tem_mais = len(itens) > tamanho
+    itens = itens[:tamanho]
+    if voltando:
+        itens.reverse()
+
+    def chave(obj):
+        return [getattr(obj, nome) for nome in nomes]
+
+    cursor_proximo = cursor_anterior = None
+    if itens:
+        if voltando:
+            cursor_proximo = codificar_cursor(chave(itens[-1]), 'n')
+            if tem_mais:
+                cursor_anterior = codificar_cursor(chave(itens[0]), 'p')
+        else:
+            if tem_mais:
+                cursor_proximo = codificar_cursor(chave(itens[-1]), 'n')
+            if valores is not None:
+                cursor_anterior = codificar_cursor(chave(itens[0]), 'p')
+
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    return Pagina(itens, cursor_proximo, cursor_anterior, tamanho, params)
@@ -0,0 +1,123 @@
+# freepigeon/pedidos.py
+"""
+Fechamento de pedidos.
+
+fechar_pedido() transforma uma lista de (produto_id, quantidade) em um
+Pedido dentro de uma transação, com número fixo de queries, não importa
+quantos itens o carrinho tenha:
+  1. SELECT ... FOR UPDATE dos produtos (em ordem de id, evita deadlock)
+  2. INSERT do pedido
+  3. INSERT em lote dos PedidoProduto
+  4. UPDATE único do estoque (CASE por produto)
+  5. INSERT da tarefa que soma o pedido no consolidado diário de vendas
+     (o worker roda vendas.registrar_pedido depois do commit)
+
+Se algum produto não tiver estoque suficiente nada é gravado e sobe
+EstoqueInsuficiente. Com os produtos travados, duas compras simultâneas do
+mesmo produto são serializadas e não vendem além do estoque. Unidades
+reservadas por outros checkouts (Produto.q_reservado) não contam como
+disponíveis.
+"""
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, When
+
+from .models import Pedido, PedidoProduto, Produto
+from .vendas import agendar_consolidacao
+
+
+class EstoqueInsuficiente(Exception):
+    def __init__(self, faltando):
+        # faltando: {produto_id: (quantidade pedida, quantidade disponível)}
+        self.faltando = faltando
+        detalhes = ', '.join(
+            f"produto {pid}: pedido {pedida}, disponível {disponivel}"
+            for pid, (pedida, disponivel) in faltando.items()
+        )
+        super().__init__(f"Estoque insuficiente ({detalhes})")
+
+
+def agrupar_itens(itens):
+    """Soma as quantidades por produto: [(produto_id, qtd), ...] -> {produto_id: qtd}."""
+    quantidades = {}
+    for produto_id, quantidade in itens:
+        quantidades[produto_id] = quantidades.get(produto_id, 0) + quantidade
+    return quantidades
+
+
+def decremento_por_produto(campo, quantidades):
+    """CASE que subtrai de 'campo' a quantidade de cada produto ({produto_id: qtd})."""
+    return Case(
+        *[When(id=pid, then=F(campo) - qtd) for pid, qtd in quantidades.items()],
+        default=F(campo),
+        output_field=IntegerField(),
+    )
+
+
+def baixar_estoque(quantidades, reservado=None):
+    """
+    Um único UPDATE: q_estoque = q_estoque - n para cada produto e, se o
+    pedido veio de uma reserva, q_reservado = q_reservado - reservado.
+    """
+    atualizacao = {'q_estoque': decremento_por_produto('q_estoque', quantidades)}
+    if reservado:
+        atualizacao['q_reservado'] = decremento_por_produto('q_reservado', reservado)
+    Produto.objects.filter(id__in=set(quantidades) | set(reservado or ())).update(**atualizacao)
+
+
+def fechar_pedido(usuario, itens, endereco=None, status='Pago', reservado=None, **campos):
+    """
+    Cria o pedido com os itens informados e baixa o estoque.
+    'itens' é uma lista de (produto_id, quantidade); 'reservado' é o
+    {produto_id: qtd} já reservado para este pedido (ver reservas.py), que
+    conta como disponível e sai de q_reservado. 'campos' vai para o Pedido
+    (ex: stripe_session_id, valor_pago). Retorna o pedido.
+    """
+    reservado = reservado or {}
+    quantidades = agrupar_itens(itens)
+    if not quantidades:
+        raise ValueError('Pedido sem itens.')
+
+    with transaction.atomic():
+        produtos = {
+            produto.id: produto
+            for produto in (
+                Produto.objects
+                .select_for_update()
+                .filter(id__in=quantidades)
+                .order_by('id')
+                .only('id', 'preco_final', 'q_estoque', 'q_reservado')
+            )
+        }
+
+        faltando = {}
+        for produto_id, qtd in quantidades.items():
+            produto = produtos.get(produto_id)
+            disponivel = produto.disponivel + reservado.get(produto_id, 0) if produto else 0
+            if disponivel < qtd:
+                faltando[produto_id] = (qtd, disponivel)
+        if faltando:
+            raise EstoqueInsuficiente(faltando)
+
+        pedido = Pedido.objects.create(
+            usuario=usuario,
+            endereco=endereco,
+            status=status,
+            **campos,
+        )
+
+        PedidoProduto.objects.bulk_create([
+            PedidoProduto(
+                pedido=pedido,
+                produto_id=produto_id,
+                quantidade=qtd,
+                preco_unitario=produtos[produto_id].preco_final,
+            )
+            for produto_id, qtd in quantidades.items()
+        ])
+
+        baixar_estoque(quantidades, reservado)
+
+        # Consolidado diário de vendas: em segundo plano, mas só se o pedido fizer commit
+        agendar_consolidacao(pedido)
+
+    return pedido
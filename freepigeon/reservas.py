@@ -0,0 +1,126 @@
+# freepigeon/reservas.py
+"""
+Reserva de estoque durante o checkout.
+
+Quando a Checkout Session do Stripe é aberta, os itens do carrinho ficam
+reservados (tabela Reserva) por RESERVA_MINUTOS. O contador
+Produto.q_reservado acompanha as reservas ativas, então o estoque livre
+(Produto.disponivel = q_estoque - q_reservado) é lido direto da linha do
+produto, sem somar pedidos nem reservas.
+
+Ciclo de vida de um lote:
+  - reservar_itens(): cria o lote (todos os itens ou nenhum);
+  - converter_lote(): no pagamento, as unidades saem de q_reservado junto
+    com a baixa de q_estoque (ver pedidos.fechar_pedido);
+  - liberar_lote() / expirar_reservas(): checkout abandonado ou vencido
+    devolve as unidades. expirar_reservas roda pelo comando de mesmo nome.
+"""
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Produto, Reserva
+from .pedidos import EstoqueInsuficiente, agrupar_itens, decremento_por_produto
+
+
+# A Checkout Session do Stripe expira junto com a reserva, e ele recusa
+# expires_at a menos de 30 min da chamada. O minuto a mais cobre o tempo
+# entre reservar e criar a sessão.
+MINUTOS_MINIMOS = 31
+
+
+def minutos_de_reserva():
+    return max(getattr(settings, 'RESERVA_MINUTOS', MINUTOS_MINIMOS), MINUTOS_MINIMOS)
+
+
+def devolver(quantidades):
+    """Um único UPDATE: q_reservado = q_reservado - n para cada produto."""
+    if not quantidades:
+        return
+    Produto.objects.filter(id__in=quantidades).update(
+        q_reservado=decremento_por_produto('q_reservado', quantidades)
+    )
+
+
+def _tirar_do_lote(reservas):
+    """Apaga as reservas (já travadas) e devolve as quantidades por produto."""
+    linhas = list(reservas.values_list('id', 'produto_id', 'quantidade'))
+    Reserva.objects.filter(id__in=[linha[0] for linha in linhas]).delete()
+    return agrupar_itens((produto_id, qtd) for _, produto_id, qtd in linhas)
+
+
+def reservar_itens(usuario, itens, minutos=None):
+    """
+    Reserva [(produto_id, quantidade), ...] para o usuário e retorna
+    (lote, expira_em). Reservas abertas anteriores do usuário são liberadas
+    antes (reabrir o checkout não reserva em dobro). Se algum produto não
+    tiver estoque livre, nada é reservado e sobe EstoqueInsuficiente.
+    """
+    quantidades = agrupar_itens(itens)
+    expira_em = timezone.now() + timedelta(minutes=minutos or minutos_de_reserva())
+    lote = uuid.uuid4().hex
+
+    with transaction.atomic():
+        liberar_do_usuario(usuario)
+
+        faltando = {}
+        # ordem de id: duas reservas concorrentes travam as linhas na mesma ordem
+        for produto_id in sorted(quantidades):
+            qtd = quantidades[produto_id]
+            # UPDATE condicional: só reserva se ainda houver estoque livre
+            reservou = Produto.objects.filter(
+                id=produto_id,
+                q_estoque__gte=F('q_reservado') + qtd,
+            ).update(q_reservado=F('q_reservado') + qtd)
+            if not reservou:
+                produto = Produto.objects.filter(id=produto_id).first()
+                faltando[produto_id] = (qtd, produto.disponivel if produto else 0)
+
+        if faltando:
+            # a exceção desfaz os UPDATEs acima junto com a transação
+            raise EstoqueInsuficiente(faltando)
+
+        Reserva.objects.bulk_create([
+            Reserva(lote=lote, usuario=usuario, produto_id=pid, quantidade=qtd, expira_em=expira_em)
+            for pid, qtd in quantidades.items()
+        ])
+    return lote, expira_em
+
+
+def converter_lote(lote):
+    """
+    Remove as reservas do lote no pagamento e retorna {produto_id: qtd}.
+    Quem chama passa o resultado para fechar_pedido(reservado=...), que
+    desconta essas quantidades de q_reservado ao baixar o estoque (ou usa
+    devolver() se o pedido não sair). Lote vencido/inexistente retorna {}.
+    """
+    if not lote:
+        return {}
+    return _tirar_do_lote(Reserva.objects.select_for_update().filter(lote=lote))
+
+
+def liberar_lote(lote):
+    """Devolve ao estoque livre as unidades de um lote (checkout cancelado/expirado)."""
+    if not lote:
+        return
+    with transaction.atomic():
+        devolver(_tirar_do_lote(Reserva.objects.select_for_update().filter(lote=lote)))
+
+
+def liberar_do_usuario(usuario):
+    with transaction.atomic():
+        devolver(_tirar_do_lote(Reserva.objects.select_for_update().filter(usuario=usuario)))
+
+
+def expirar_reservas(agora=None):
+    """Libera todas as reservas vencidas. Retorna quantas unidades voltaram ao estoque livre."""
+    agora = agora or timezone.now()
+    with transaction.atomic():
+        vencidas = Reserva.objects.select_for_update(skip_locked=True).filter(expira_em__lte=agora)
+        quantidades = _tirar_do_lote(vencidas)
+        devolver(quantidades)
+    return sum(quantidades.values())
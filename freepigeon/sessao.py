@@ -0,0 +1,83 @@
+# freepigeon/sessao.py
+"""
+Usuário logado da requisição.
+
+O UsuarioMiddleware (middleware.py) coloca em toda requisição:
+  - request.usuario: Usuario da sessão (com loja e plano já carregados),
+    carregado só no primeiro acesso; None se ninguém estiver logado;
+  - request.ausuario(): o mesmo, para views async (await request.ausuario()).
+
+O Usuario também fica num cache curto (USUARIO_CACHE_TTL segundos, 0 desliga),
+invalidado pelos signals abaixo quando Usuario, Plano ou Loja mudam.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Loja, Plano, Usuario
+
+
+def _chave(usuario_id):
+    return f"usuario:{usuario_id}"
+
+
+def _ttl():
+    return getattr(settings, 'USUARIO_CACHE_TTL', 60)
+
+
+def carregar_usuario(usuario_id):
+    """Usuario com loja e plano (cache -> banco). None se não existir."""
+    if not usuario_id:
+        return None
+
+    ttl = _ttl()
+    if ttl:
+        usuario = cache.get(_chave(usuario_id))
+        if usuario is not None:
+            return usuario
+
+    usuario = Usuario.objects.select_related('loja', 'plano').filter(id=usuario_id).first()
+    if usuario is not None and ttl:
+        cache.set(_chave(usuario_id), usuario, ttl)
+    return usuario
+
+
+def invalidar_usuarios(usuario_ids):
+    cache.delete_many([_chave(usuario_id) for usuario_id in usuario_ids])
+
+
+def get_usuario(request):
+    if not hasattr(request, '_usuario_cache'):
+        request._usuario_cache = carregar_usuario(request.session.get('usuario_id'))
+    return request._usuario_cache
+
+
+async def aget_usuario(request):
+    if not hasattr(request, '_usuario_cache'):
+        usuario_id = await request.session.aget('usuario_id')
+        request._usuario_cache = await sync_to_async(carregar_usuario)(usuario_id)
+    return request._usuario_cache
+
+
+# ============================================================
+# SIGNALS: invalida o cache
+# ============================================================
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def _usuario_alterado(sender, instance, **kwargs):
+    invalidar_usuarios([instance.pk])
+
+
+@receiver(post_save, sender=Plano)
+def _plano_alterado(sender, instance, created=False, **kwargs):
+    if not created:
+        invalidar_usuarios(Usuario.objects.filter(plano=instance).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Loja)
+def _loja_alterada(sender, instance, created=False, **kwargs):
+    if not created:
+        invalidar_usuarios(Usuario.objects.filter(loja=instance).values_list('id', flat=True))
@@ -0,0 +1,374 @@
+# freepigeon/sintetico.py
+"""
+Dados sintéticos para benchmark e teste de carga (comando seed_freepigeon).
+
+semear() gera lojas, planos, usuários, endereços, categorias, produtos,
+atributos, carrinhos e pedidos direto em tuplas, sem instanciar models nem
+disparar signals:
+  - Postgres: COPY ... FROM STDIN em lotes;
+  - outros bancos: INSERT com executemany em lotes.
+Os ids são atribuídos aqui (a partir do maior id existente) para ligar as
+FKs sem reler nada do banco; as sequences são acertadas no fim.
+
+Distribuições assimétricas (Zipf, expoente 'assimetria'): poucos produtos,
+vendedores, categorias e compradores concentram a maior parte das vendas,
+como numa loja de verdade. Mesma 'semente' -> mesmos dados (fora os ids).
+
+No fim reconstrói o que os signals/webhook manteriam: índice de busca e
+consolidado diário de vendas. Usuários sintéticos têm e-mail em DOMINIO.
+"""
+import io
+import json
+import random
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .busca import reconstruir_indice
+from .models import (
+    Atributo, Carrinho, CarrinhoProduto, Categoria, Endereco, Loja, Pedido,
+    PedidoProduto, Plano, Produto, ProdutoAtributo, Usuario,
+)
+from .vendas import reconstruir_vendas_diarias
+
+DOMINIO = 'sintetico.freepigeon'
+
+NOMES_CATEGORIAS = [
+    'Eletrônicos', 'Informática', 'Celulares', 'Games', 'Casa', 'Cozinha',
+    'Moda', 'Calçados', 'Esporte', 'Livros', 'Brinquedos', 'Beleza',
+    'Ferramentas', 'Automotivo', 'Pet Shop', 'Papelaria', 'Jardim',
+    'Instrumentos Musicais', 'Bebês', 'Saúde',
+]
+ADJETIVOS = ['Premium', 'Básico', 'Pro', 'Compacto', 'Turbo', 'Slim', 'Max', 'Eco', 'Plus', 'Mini']
+SUBSTANTIVOS = ['Fone', 'Cabo', 'Carregador', 'Mochila', 'Teclado', 'Mouse', 'Camiseta', 'Tênis',
+                'Panela', 'Luminária', 'Caderno', 'Bola', 'Furadeira', 'Perfume', 'Relógio']
+ATRIBUTOS = {
+    'Cor': ['Preto', 'Branco', 'Azul', 'Vermelho', 'Verde', 'Cinza', 'Rosa'],
+    'Tamanho': ['PP', 'P', 'M', 'G', 'GG'],
+    'Voltagem': ['110V', '220V', 'Bivolt'],
+    'Material': ['Algodão', 'Plástico', 'Metal', 'Madeira', 'Couro', 'Vidro'],
+    'Marca': ['Pigeon', 'Acme', 'Nimbus', 'Orion', 'Vega', 'Atlas'],
+    'Garantia': ['3 meses', '6 meses', '1 ano', '2 anos'],
+}
+CIDADES = [('São Paulo', 'SP', '01'), ('Rio de Janeiro', 'RJ', '20'), ('Belo Horizonte', 'MG', '30'),
+           ('Curitiba', 'PR', '80'), ('Porto Alegre', 'RS', '90'), ('Salvador', 'BA', '40'),
+           ('Recife', 'PE', '50'), ('Fortaleza', 'CE', '60'), ('Goiânia', 'GO', '74')]
+STATUS_PEDIDO = ['Pago'] * 9 + ['Pendente']
+
+
+# ============================================================
+# INSERÇÃO EM LOTE
+# ============================================================
+
+def _blocos(linhas, lote):
+    bloco = []
+    for linha in linhas:
+        bloco.append(linha)
+        if len(bloco) == lote:
+            yield bloco
+            bloco = []
+    if bloco:
+        yield bloco
+
+
+def _texto_copy(valor):
+    """Valor no formato texto do COPY do Postgres."""
+    if valor is None:
+        return '\\N'
+    if isinstance(valor, bool):
+        return 't' if valor else 'f'
+    texto = valor.isoformat() if hasattr(valor, 'isoformat') else str(valor)
+    return texto.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def _copiar(cursor, tabela, colunas, bloco):
+    buffer = io.StringIO()
+    for linha in bloco:
+        buffer.write('\t'.join(_texto_copy(valor) for valor in linha))
+        buffer.write('\n')
+    sql = f"COPY {tabela} ({', '.join(colunas)}) FROM STDIN"
+    if hasattr(cursor, 'copy_expert'):
+        # psycopg2
+        buffer.seek(0)
+        cursor.copy_expert(sql, buffer)
+    else:
+        # psycopg 3
+        with cursor.copy(sql) as copia:
+            copia.write(buffer.getvalue())
+
+
+def inserir(modelo, campos, linhas, lote=10000):
+    """
+    Insere 'linhas' (tuplas na ordem de 'campos', nomes dos campos do model)
+    em lotes e retorna quantas foram. Não chama save() nem signals.
+    """
+    conexao = connections[DEFAULT_DB_ALIAS]  # o objeto real: o proxy 'connection' é lento num loop
+    qn = conexao.ops.quote_name
+    fields = [modelo._meta.get_field(campo) for campo in campos]
+    tabela = qn(modelo._meta.db_table)
+    colunas = [qn(field.column) for field in fields]
+    copy = conexao.vendor == 'postgresql'
+    insert = f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ({', '.join(['%s'] * len(colunas))})"
+    # só datas e decimais precisam de conversão para o driver
+    converter = [
+        i for i, field in enumerate(fields)
+        if field.get_internal_type() in ('DateTimeField', 'DateField', 'DecimalField')
+    ]
+
+    total = 0
+    with conexao.cursor() as cursor:
+        for bloco in _blocos(linhas, lote):
+            if copy:
+                _copiar(cursor, tabela, colunas, bloco)
+            else:
+                if converter:
+                    bloco = [list(linha) for linha in bloco]
+                    for linha in bloco:
+                        for i in converter:
+                            linha[i] = fields[i].get_db_prep_save(linha[i], conexao)
+                cursor.executemany(insert, bloco)
+            total += len(bloco)
+    return total
+
+
+def _proximo_id(modelo):
+    return (modelo.objects.aggregate(maior=Max('id'))['maior'] or 0) + 1
+
+
+def _acertar_sequences(modelos):
+    """Depois de inserir ids explícitos, a sequence do Postgres precisa andar junto."""
+    conexao = connections[DEFAULT_DB_ALIAS]
+    with conexao.cursor() as cursor:
+        for sql in conexao.ops.sequence_reset_sql(no_style(), modelos):
+            cursor.execute(sql)
+
+
+# ============================================================
+# DISTRIBUIÇÕES
+# ============================================================
+
+class Popularidade:
+    """
+    Sorteio assimétrico (Zipf) de índices 0..n-1. A ordem de popularidade é
+    embaralhada, então os mais sorteados não são simplesmente os primeiros ids.
+    """
+
+    def __init__(self, rnd, n, assimetria):
+        self.rnd = rnd
+        self.n = n
+        self.ordem = list(range(n))
+        rnd.shuffle(self.ordem)
+        self.acumulado = []
+        soma = 0.0
+        for posicao in range(1, n + 1):
+            soma += 1 / posicao ** assimetria
+            self.acumulado.append(soma)
+
+    def sortear(self, k=1):
+        return self.rnd.choices(self.ordem, cum_weights=self.acumulado, k=k)
+
+    def distintos(self, k):
+        """k índices diferentes (para itens de um mesmo pedido/carrinho)."""
+        k = min(k, self.n)
+        if k > self.n // 2:
+            return self.rnd.sample(range(self.n), k)
+        escolhidos = set()
+        while len(escolhidos) < k:
+            escolhidos.update(self.sortear(k - len(escolhidos)))
+        return list(escolhidos)
+
+
+def _repartir(rnd, total, partes, minimo=0, maximo=None):
+    """Reparte 'total' entre 'partes' (cada uma entre minimo e maximo), ao acaso."""
+    if not partes:
+        return []
+    contagem = [minimo] * partes
+    restante = max(total - minimo * partes, 0)
+    if maximo is not None:
+        restante = min(restante, (maximo - minimo) * partes)
+    while restante:
+        for indice in rnd.choices(range(partes), k=restante):
+            if maximo is None or contagem[indice] < maximo:
+                contagem[indice] += 1
+                restante -= 1
+    return contagem
+
+
+# ============================================================
+# GERAÇÃO
+# ============================================================
+
+def semear(usuarios=1000, produtos=5000, pedidos=10000, itens=None, lojas=None, planos=3,
+           enderecos=None, categorias=len(NOMES_CATEGORIAS), atributos=None, carrinhos=None,
+           itens_carrinho=None, itens_por_pedido=3, assimetria=0.8, dias=180, semente=42,
+           lote=10000, derivados=True, log=print):
+    """
+    Gera os dados e retorna {model: linhas criadas}.
+
+    Cada argumento é o total de linhas do model; os vazios são derivados:
+    lojas = usuarios/50, enderecos = 1,5 por usuário, atributos = 2 por
+    produto, carrinhos = usuarios/5 (3 itens cada), itens de pedido =
+    pedidos x itens_por_pedido. derivados=False pula a reconstrução do
+    índice de busca e do consolidado de vendas.
+    """
+    rnd = random.Random(semente)
+    agora = timezone.now()
+    usuarios = max(usuarios, 1)
+    produtos = max(produtos, 1)
+    lojas = max(lojas if lojas is not None else usuarios // 50, 1)
+    enderecos = enderecos if enderecos is not None else usuarios * 3 // 2
+    atributos = atributos if atributos is not None else produtos * 2
+    carrinhos = min(carrinhos if carrinhos is not None else usuarios // 5, usuarios)
+    itens_carrinho = itens_carrinho if itens_carrinho is not None else carrinhos * 3
+    itens = itens if itens is not None else pedidos * itens_por_pedido
+    criados = {}
+
+    with transaction.atomic():
+        # ------ planos, lojas e categorias ------
+        plano_ids = list(Plano.objects.order_by('-is_default', 'id').values_list('id', flat=True)[:1])
+        id_plano = _proximo_id(Plano)
+        criados['Plano'] = inserir(Plano, ['id', 'nome', 'slug', 'preco_mensal', 'limite_anuncios', 'ativo', 'is_default'], (
+            (id_plano + i, f"Plano Sintético {id_plano + i}", f"sintetico-{id_plano + i}",
+             Decimal(rnd.choice([19, 29, 49, 99])) + Decimal('0.90'), rnd.choice([20, 50, None]), True, False)
+            for i in range(planos)
+        ), lote)
+        plano_ids += [id_plano + i for i in range(planos)]
+
+        id_loja = _proximo_id(Loja)
+        criados['Loja'] = inserir(Loja, ['id', 'nome'], (
+            (id_loja + i, f"Loja {id_loja + i}") for i in range(lojas)
+        ), lote)
+
+        id_categoria = _proximo_id(Categoria)
+        nomes = NOMES_CATEGORIAS
+        criados['Categoria'] = inserir(Categoria, ['id', 'nome', 'miniaturas'], (
+            (id_categoria + i, nomes[i] if i < len(nomes) else f"{nomes[i % len(nomes)]} {i // len(nomes) + 1}", '[]')
+            for i in range(categorias)
+        ), lote)
+        log(f"[SINTETICO] {planos} planos, {lojas} lojas, {categorias} categorias")
+
+        # ------ usuários: os primeiros 'lojas' são os vendedores, um por loja ------
+        senha = make_password('sintetico')  # um hash só: make_password é lento de propósito
+        id_usuario = _proximo_id(Usuario)
+        pesos_plano = [8] + [1] * (len(plano_ids) - 1)
+        criados['Usuario'] = inserir(Usuario, ['id', 'nome', 'email', 'senha', 'loja', 'plano', 'ativo'], (
+            (id_usuario + i, f"Usuário {id_usuario + i}", f"u{id_usuario + i}@{DOMINIO}", senha,
+             id_loja + i if i < lojas else None,
+             rnd.choices(plano_ids, weights=pesos_plano)[0] if plano_ids else None, True)
+            for i in range(usuarios)
+        ), lote)
+        log(f"[SINTETICO] {usuarios} usuários")
+
+        # ------ endereços: todo usuário tem pelo menos um (o principal) ------
+        por_usuario = _repartir(rnd, enderecos, usuarios, minimo=1 if enderecos >= usuarios else 0)
+        id_endereco = _proximo_id(Endereco)
+        endereco_principal = {}
+
+        def linhas_enderecos():
+            atual = id_endereco
+            for i, quantos in enumerate(por_usuario):
+                for n in range(quantos):
+                    cidade, estado, prefixo = rnd.choice(CIDADES)
+                    if n == 0:
+                        endereco_principal[i] = atual
+                    yield (atual, id_usuario + i, 'Casa' if n == 0 else 'Trabalho', f"Rua {rnd.randint(1, 999)}",
+                           rnd.randint(1, 9999), 'Centro', cidade, estado, f"{prefixo}{rnd.randint(0, 999999):06d}", n == 0)
+                    atual += 1
+        criados['Endereco'] = inserir(Endereco, ['id', 'usuario', 'apelido', 'rua', 'numero', 'bairro', 'cidade',
+                                                 'estado', 'cep', 'principal'], linhas_enderecos(), lote)
+        log(f"[SINTETICO] {criados['Endereco']} endereços")
+
+        # ------ produtos: vendedores e categorias com popularidade assimétrica ------
+        vendedores = Popularidade(rnd, lojas, assimetria)
+        categorias_pop = Popularidade(rnd, categorias, assimetria)
+        id_produto = _proximo_id(Produto)
+        precos = []
+        # a ficha (Produto.ficha) já sai com os atributos sorteados para o produto
+        atributo_ids = {}
+        for nome in ATRIBUTOS:
+            atributo_ids[nome] = Atributo.objects.get_or_create(nome=nome)[0].id
+        nomes_atributos = list(ATRIBUTOS)
+        por_produto = _repartir(rnd, atributos, produtos, maximo=len(nomes_atributos))
+        fichas = []
+
+        def linhas_produtos():
+            for i in range(produtos):
+                loja = vendedores.sortear()[0]
+                valor = Decimal(rnd.randint(500, 500000)) / 100
+                desconto = Decimal(rnd.choice([0, 0, 0, 5, 10, 15, 20]))
+                # mesma conta da coluna gerada Produto.preco_final
+                precos.append((valor * (100 - desconto) / 100).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
+                ficha = {nome: rnd.choice(ATRIBUTOS[nome]) for nome in rnd.sample(nomes_atributos, por_produto[i])}
+                fichas.append(ficha)
+                yield (id_produto + i, f"{rnd.choice(SUBSTANTIVOS)} {rnd.choice(ADJETIVOS)} {id_produto + i}",
+                       f"Produto sintético {id_produto + i}", valor, desconto, rnd.randint(0, 500), 0,
+                       id_categoria + categorias_pop.sortear()[0], id_loja + loja, id_usuario + loja,
+                       'produtos/sintetico.jpg', '[]', rnd.random() > 0.03, json.dumps(ficha, ensure_ascii=False))
+        criados['Produto'] = inserir(Produto, ['id', 'nome', 'descricao', 'valor', 'desconto', 'q_estoque', 'q_reservado',
+                                               'categoria', 'loja', 'vendedor', 'imagem', 'miniaturas', 'ativo', 'ficha'],
+                                     linhas_produtos(), lote)
+        log(f"[SINTETICO] {produtos} produtos")
+
+        # ------ atributos (as mesmas linhas da ficha) ------
+        def linhas_atributos():
+            for i, ficha in enumerate(fichas):
+                for nome, valor in ficha.items():
+                    yield (id_produto + i, atributo_ids[nome], valor)
+        criados['ProdutoAtributo'] = inserir(ProdutoAtributo, ['produto', 'atributo', 'valor'], linhas_atributos(), lote)
+        log(f"[SINTETICO] {criados['ProdutoAtributo']} atributos de produto")
+
+        # ------ carrinhos ------
+        populares = Popularidade(rnd, produtos, assimetria)
+        id_carrinho = _proximo_id(Carrinho)
+        donos = rnd.sample(range(usuarios), carrinhos)
+        criados['Carrinho'] = inserir(Carrinho, ['id', 'usuario', 'data_criacao'], (
+            (id_carrinho + i, id_usuario + dono, agora - timedelta(seconds=rnd.randrange(dias * 86400)))
+            for i, dono in enumerate(donos)
+        ), lote)
+        por_carrinho = _repartir(rnd, itens_carrinho, carrinhos, maximo=produtos)
+        criados['CarrinhoProduto'] = inserir(CarrinhoProduto, ['carrinho', 'produto', 'quantidade'], (
+            (id_carrinho + i, id_produto + produto, rnd.randint(1, 3))
+            for i, quantos in enumerate(por_carrinho)
+            for produto in populares.distintos(quantos)
+        ), lote)
+        log(f"[SINTETICO] {carrinhos} carrinhos")
+
+        # ------ pedidos: poucos compradores fazem muitos pedidos ------
+        compradores = Popularidade(rnd, usuarios, assimetria)
+        id_pedido = _proximo_id(Pedido)
+        por_pedido = _repartir(rnd, itens, pedidos, minimo=1 if itens >= pedidos else 0, maximo=produtos)
+        criados['Pedido'] = criados['PedidoProduto'] = 0
+        for inicio in range(0, pedidos, lote):
+            linhas_pedido, linhas_itens = [], []
+            for i in range(inicio, min(inicio + lote, pedidos)):
+                comprador = compradores.sortear()[0]
+                total = Decimal('0')
+                for produto in populares.distintos(por_pedido[i]):
+                    quantidade = rnd.choices([1, 2, 3, 4], weights=[70, 20, 7, 3])[0]
+                    total += precos[produto] * quantidade
+                    linhas_itens.append((id_pedido + i, id_produto + produto, quantidade, precos[produto]))
+                linhas_pedido.append((
+                    id_pedido + i, id_usuario + comprador, endereco_principal.get(comprador),
+                    agora - timedelta(seconds=rnd.randrange(dias * 86400)), rnd.choice(STATUS_PEDIDO), total,
+                    False,  # reconstruir_vendas_diarias marca e soma
+                ))
+            criados['Pedido'] += inserir(Pedido, ['id', 'usuario', 'endereco', 'data_efetuado', 'status', 'valor_pago',
+                                                  'consolidado'], linhas_pedido, lote)
+            criados['PedidoProduto'] += inserir(PedidoProduto, ['pedido', 'produto', 'quantidade', 'preco_unitario'],
+                                                linhas_itens, lote)
+            log(f"[SINTETICO] {criados['Pedido']}/{pedidos} pedidos, {criados['PedidoProduto']} itens")
+
+        _acertar_sequences([Plano, Loja, Categoria, Usuario, Endereco, Produto, ProdutoAtributo,
+                            Carrinho, CarrinhoProduto, Pedido, PedidoProduto])
+
+    # ------ o que os signals/webhook manteriam ------
+    if derivados:
+        log("[SINTETICO] Reconstruindo índice de busca e consolidado de vendas...")
+        reconstruir_indice()
+        reconstruir_vendas_diarias()
+    return criados
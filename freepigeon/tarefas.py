@@ -0,0 +1,219 @@
+# freepigeon/tarefas.py
+"""
+Fila de tarefas em segundo plano, no próprio banco (tabela Tarefa).
+
+O que o usuário não espera na resposta (miniaturas, consolidado de vendas,
+conciliação com o Stripe) vira uma linha em Tarefa e roda no worker
+'manage.py processar_tarefas', sem broker externo.
+
+- @tarefa(prioridade=, max_tentativas=, espera=, transacao=): marca a
+  função como tarefa. Só funções marcadas rodam no worker; argumentos vão
+  em JSON (ids e textos, não objetos).
+- enfileirar(funcao, chave=None, atraso=0, **argumentos): grava a tarefa.
+  Dentro de uma transação, a tarefa só passa a existir no commit, junto com
+  o pedido/produto que a gerou. Com 'chave', não cria outra enquanto houver
+  uma pendente com a mesma chave.
+- processar(lote): reserva as próximas tarefas prontas (maior prioridade,
+  depois a mais antiga) com SELECT ... FOR UPDATE SKIP LOCKED, então vários
+  workers dividem a fila sem pegar a mesma tarefa, e executa.
+
+A função roda numa transação junto com a marcação de concluída: se falhar,
+nada do que gravou no banco fica. Com transacao=False (tarefa que chama um
+serviço externo antes de gravar) ela abre a própria transação depois da
+chamada, para não segurar travas esperando a rede. Na falha a tarefa volta
+para a fila com espera
+exponencial (espera, 2x, 4x... até ESPERA_MAXIMA) até max_tentativas; depois
+fica 'falhou', com o traceback em Tarefa.erro. Tarefa 'executando' há mais
+de TAREFAS_TIMEOUT segundos (worker morreu) volta para a fila.
+"""
+import random
+import traceback
+from contextlib import nullcontext
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Tarefa
+
+PRIORIDADE_ALTA = 10
+PRIORIDADE_NORMAL = 0
+PRIORIDADE_BAIXA = -10
+
+# teto da espera entre tentativas, em segundos
+ESPERA_MAXIMA = 60 * 60
+
+
+def _timeout():
+    return getattr(settings, 'TAREFAS_TIMEOUT', 15 * 60)
+
+
+def _sincronas():
+    return getattr(settings, 'TAREFAS_SINCRONAS', False)
+
+
+# ============================================================
+# REGISTRO E ENFILEIRAMENTO
+# ============================================================
+
+def tarefa(prioridade=PRIORIDADE_NORMAL, max_tentativas=5, espera=30, transacao=True):
+    """
+    Decorator: a função pode ser enfileirada (espera = segundos até a 2ª
+    tentativa; transacao=False: o worker não a envolve em transaction.atomic).
+    """
+    def marcar(funcao):
+        funcao.tarefa = {
+            'nome': f"{funcao.__module__}.{funcao.__qualname__}",
+            'prioridade': prioridade,
+            'max_tentativas': max_tentativas,
+            'espera': espera,
+            'transacao': transacao,
+        }
+        return funcao
+    return marcar
+
+
+def enfileirar(funcao, chave=None, atraso=0, **argumentos):
+    """
+    Grava uma tarefa para 'funcao' (marcada com @tarefa) rodar daqui a
+    'atraso' segundos. Retorna a Tarefa, ou None se já havia uma pendente
+    com a mesma chave.
+    """
+    config = funcao.tarefa
+    nova = Tarefa(
+        nome=config['nome'],
+        argumentos=argumentos,
+        prioridade=config['prioridade'],
+        max_tentativas=config['max_tentativas'],
+        executar_em=timezone.now() + timedelta(seconds=atraso),
+        chave=chave,
+    )
+    try:
+        # savepoint: a chave repetida não derruba a transação de quem chamou
+        with transaction.atomic():
+            nova.save(force_insert=True)
+    except IntegrityError:
+        return None
+
+    if _sincronas() and not atraso:
+        # desenvolvimento sem worker: roda logo depois do commit, no próprio processo
+        transaction.on_commit(partial(_executar_agora, nova.id))
+    return nova
+
+
+# ============================================================
+# WORKER
+# ============================================================
+
+def _reservar(limite, ids=None):
+    """Marca como 'executando' até 'limite' tarefas prontas e as retorna."""
+    agora = timezone.now()
+    with transaction.atomic():
+        fila = (
+            Tarefa.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=Tarefa.PENDENTE, executar_em__lte=agora)
+        )
+        if ids is not None:
+            fila = fila.filter(id__in=ids)
+        tarefas = list(fila.order_by('-prioridade', 'executar_em', 'id')[:limite])
+        if tarefas:
+            Tarefa.objects.filter(id__in=[t.id for t in tarefas]).update(
+                status=Tarefa.EXECUTANDO, iniciada_em=agora, tentativas=F('tentativas') + 1,
+            )
+    for t in tarefas:
+        t.status, t.iniciada_em, t.tentativas = Tarefa.EXECUTANDO, agora, t.tentativas + 1
+    return tarefas
+
+
+def _funcao(nome):
+    funcao = import_string(nome)
+    if not hasattr(funcao, 'tarefa'):
+        raise ImportError(f"{nome} não está marcada com @tarefa")
+    return funcao
+
+
+def _devolver(tarefa, erro, espera=30):
+    """Falhou: volta para a fila com espera exponencial, ou 'falhou' se acabaram as tentativas."""
+    agora = timezone.now()
+    if tarefa.tentativas >= tarefa.max_tentativas:
+        print(f"[TAREFAS] {tarefa.nome} #{tarefa.id} falhou {tarefa.tentativas}x, desistindo.")
+        Tarefa.objects.filter(id=tarefa.id).update(status=Tarefa.FALHOU, erro=erro, concluida_em=agora)
+        return
+
+    segundos = min(ESPERA_MAXIMA, espera * 2 ** (tarefa.tentativas - 1))
+    # +0-20%: tarefas que falharam juntas (ex: Stripe fora) não voltam todas juntas
+    segundos *= random.uniform(1, 1.2)
+    try:
+        with transaction.atomic():
+            Tarefa.objects.filter(id=tarefa.id).update(
+                status=Tarefa.PENDENTE, erro=erro, executar_em=agora + timedelta(seconds=segundos),
+            )
+    except IntegrityError:
+        # já entrou outra pendente com a mesma chave: ela faz o trabalho
+        Tarefa.objects.filter(id=tarefa.id).update(status=Tarefa.FALHOU, erro=erro, concluida_em=agora)
+
+
+def executar(tarefa):
+    """Roda uma tarefa já reservada. Retorna True se concluiu."""
+    try:
+        funcao = _funcao(tarefa.nome)
+    except ImportError:
+        Tarefa.objects.filter(id=tarefa.id).update(
+            status=Tarefa.FALHOU, erro=traceback.format_exc(), concluida_em=timezone.now(),
+        )
+        return False
+
+    try:
+        with transaction.atomic() if funcao.tarefa['transacao'] else nullcontext():
+            funcao(**tarefa.argumentos)
+            Tarefa.objects.filter(id=tarefa.id).update(
+                status=Tarefa.CONCLUIDA, erro='', concluida_em=timezone.now(),
+            )
+    except Exception as e:
+        print(f"[TAREFAS] {tarefa.nome} #{tarefa.id} (tentativa {tarefa.tentativas}): {e}")
+        _devolver(tarefa, traceback.format_exc(), funcao.tarefa['espera'])
+        return False
+    return True
+
+
+def _executar_agora(tarefa_id):
+    for t in _reservar(1, ids=[tarefa_id]):
+        executar(t)
+
+
+def processar(lote=10):
+    """Executa até 'lote' tarefas prontas. Retorna quantas foram executadas."""
+    tarefas = _reservar(lote)
+    for t in tarefas:
+        executar(t)
+    return len(tarefas)
+
+
+def recuperar_travadas(agora=None):
+    """Devolve à fila as tarefas 'executando' há mais de TAREFAS_TIMEOUT. Retorna quantas."""
+    agora = agora or timezone.now()
+    travadas = list(Tarefa.objects.filter(
+        status=Tarefa.EXECUTANDO, iniciada_em__lt=agora - timedelta(seconds=_timeout()),
+    ))
+    for t in travadas:
+        try:
+            espera = _funcao(t.nome).tarefa['espera']
+        except ImportError:
+            espera = 30
+        _devolver(t, f"Sem resposta do worker há mais de {_timeout()}s.", espera)
+    return len(travadas)
+
+
+def limpar_concluidas(dias=None, agora=None):
+    """Apaga as tarefas concluídas há mais de TAREFAS_MANTER_DIAS. Falhas ficam para análise."""
+    dias = dias if dias is not None else getattr(settings, 'TAREFAS_MANTER_DIAS', 7)
+    agora = agora or timezone.now()
+    apagadas, _ = Tarefa.objects.filter(
+        status=Tarefa.CONCLUIDA, concluida_em__lt=agora - timedelta(days=dias),
+    ).delete()
+    return apagadas
@@ -0,0 +1,52 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+from freepigeon.imagens import FORMATOS, nome_miniatura
+
+register = template.Library()
+
+# largura usada no src de quem não entende srcset
+LARGURA_SRC = 320
+
+
+def _srcset(arquivo, larguras, extensao):
+    return ', '.join(
+        f"{arquivo.storage.url(nome_miniatura(arquivo.name, largura, extensao))} {largura}w"
+        for largura in larguras
+    )
+
+
+@register.simple_tag
+def imagem_responsiva(obj, alt='', sizes='100vw', classe='', padrao='img/sem-imagem.png',
+                      carregamento='lazy'):
+    """
+    <picture> com srcset WebP + JPEG das miniaturas de obj.imagem (ver imagens.py).
+    Sem miniaturas usa o original; sem imagem, o arquivo estático 'padrao'.
+    carregamento="eager" para a imagem principal da página (acima da dobra).
+
+    Uso: {% imagem_responsiva produto alt=produto.nome sizes="(max-width: 600px) 50vw, 240px" %}
+    """
+    arquivo = obj.imagem
+    if not arquivo:
+        return format_html('<img src="{}" alt="{}" class="{}" loading="{}">', static(padrao), alt, classe,
+                           carregamento)
+
+    larguras = obj.miniaturas
+    if not larguras:
+        return format_html('<img src="{}" alt="{}" class="{}" loading="{}">', arquivo.url, alt, classe,
+                           carregamento)
+
+    src_largura = next((largura for largura in larguras if largura >= LARGURA_SRC), larguras[-1])
+    extensoes = list(FORMATOS)  # ['webp', 'jpg']
+    # display: contents: o <img> continua sendo o filho direto para o CSS (flex/grid) da página
+    return format_html(
+        '<picture style="display: contents">'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="{}" decoding="async">'
+        '</picture>',
+        _srcset(arquivo, larguras, extensoes[0]), sizes,
+        arquivo.storage.url(nome_miniatura(arquivo.name, src_largura, extensoes[1])),
+        _srcset(arquivo, larguras, extensoes[1]), sizes,
+        alt, classe, carregamento,
+    )
@@ -1,3 +1,1233 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.hashers import make_password
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.http import QueryDict
+from django.template import Context, Template
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import busca, cache as camada, tarefas, urls
+from .atributos import sincronizar_fichas
+from .benchmark import ROTAS, executar, servicos_falsos
+from .carrinho import resumo_carrinho
+from .catalogo import planos_ativos
+from .consultas import RegistroConsultas
+from .facetas import facetas, filtrar, ler_filtros
+from .imagens import gerar_miniaturas, nome_miniatura, trocar_imagem
+from .metricas import metricas_dashboard, ultimos_pedidos
+from .midia import CACHE_CURTO, CACHE_IMUTAVEL
+from .models import (
+    AdminUser, Atributo, Carrinho, CarrinhoProduto, Categoria, Endereco, Loja,
+    Pedido, PedidoProduto, Plano, Produto, ProdutoAtributo, Reserva, Tarefa, Usuario, VendaDiaria,
+)
+from .middleware import UsuarioMiddleware
+from .pagamentos import ativar_plano_da_sessao, conciliar_sessao, processar_evento
+from .paginacao import codificar_cursor, decodificar_cursor, paginar
+from .pedidos import EstoqueInsuficiente, fechar_pedido
+from .reservas import converter_lote, expirar_reservas, liberar_lote, reservar_itens
+from .sessao import carregar_usuario
+from .sintetico import semear
+from .tarefas import tarefa
+from .utils_frete import acotar_frete, circuito_aberto
+from .vendas import reconstruir_vendas_diarias
+
+
+# ============================================================
+# ORÇAMENTO DE QUERIES POR URL
+# ============================================================
+# URL de freepigeon/urls.py -> (máximo de queries, método, dados, status
+# esperado), com os dados de OrcamentoConsultasTests.setUpTestData (inclui
+# sessão e usuário). 'dados' é o corpo da requisição: dict (formulário), ou
+# função que recebe o caso de teste e devolve o dict (ou o JSON, em str).
+# As rotas só-POST rodam de verdade, com Stripe e Correios falsos
+# (benchmark.servicos_falsos). O status confere que o orçamento mede a
+# página, e não um 405, um redirect para o login ou um 500.
+# Uma URL nova precisa entrar aqui; se um número subir, é regressão (N+1?)
+# e o teste mostra as queries. Só diminua quando a página ficar mais barata.
+ORCAMENTOS = {
+    'home': (3, 'get', None, 200),
+
+    # autenticação
+    'cadastro': (1, 'get', None, 200),
+    'login': (0, 'get', None, 200),
+    'logout': (3, 'get', None, 302),
+    'auth': (0, 'get', None, 200),
+    'google_login_redirect': (1, 'get', None, 302),
+
+    # planos
+    'planos': (3, 'get', None, 200),
+    'planos_checkout': (2, 'post', {'plano_slug': 'pro-teste'}, 200),
+    'planos_sucesso': (0, 'get', {'session_id': 'cs_orcamento'}, 302),
+
+    # perfil do usuário
+    'perfil': (5, 'get', None, 200),
+    'editar_perfil': (1, 'get', None, 200),
+    'alterar_senha': (1, 'get', None, 200),
+    'enderecos': (2, 'get', None, 200),
+    'editar_endereco': (2, 'get', None, 200),
+    'excluir_endereco': (2, 'get', None, 200),
+    'definir_endereco_principal': (4, 'get', None, 302),
+    'vender': (1, 'get', None, 200),
+    'anuncios': (8, 'get', None, 200),
+    'editar_anuncio': (4, 'get', None, 200),
+    'excluir_anuncio': (2, 'get', None, 200),
+    'toggle_status_anuncio': (1, 'get', None, 302),
+    'resumo': (4, 'get', None, 200),
+    'criar_loja': (1, 'get', None, 200),
+    'cadastrar_produto': (2, 'get', None, 200),
+
+    # produtos e categorias
+    'produto': (4, 'get', None, 200),
+    'categoria': (3, 'get', None, 200),
+    'api_produtos': (5, 'get', None, 200),
+    'buscar': (1, 'get', None, 200),
+
+    # carrinho
+    'ver_carrinho': (3, 'get', None, 200),
+    'adicionar_ao_carrinho': (5, 'get', None, 302),
+    'remover_do_carrinho': (3, 'get', None, 302),
+
+    # checkout / pedidos / stripe / frete
+    'checkout': (5, 'get', None, 200),
+    'meus_pedidos': (3, 'get', None, 200),
+    'create_checkout_session': (19, 'post', lambda caso: {
+        'endereco_id': caso.endereco.id, 'cep': '01311923', 'rua': 'Rua A', 'numero': '1',
+        'bairro': 'Centro', 'cidade': 'São Paulo', 'estado': 'SP',
+        'pagamento': 'cartao', 'frete_codigo': 'PAC', 'frete_valor': '25.90',
+    }, 200),
+    'payment_success': (2, 'get', {'session_id': 'cs_orcamento'}, 200),
+    'stripe_webhook': (22, 'post', lambda caso: caso.evento_pagamento(), 200),
+    'calcular_frete': (3, 'post', {'cep': '04567000'}, 200),
+
+    # admin
+    'admin_login': (1, 'get', None, 302),
+    'admin_dashboard': (4, 'get', None, 200),
+    'admin_logout': (4, 'get', None, 302),
+    'admin_planos': (3, 'get', None, 200),
+    'admin_criar_plano': (2, 'get', None, 200),
+    'admin_editar_plano': (3, 'get', None, 200),
+    'admin_excluir_plano': (3, 'get', None, 200),
+    'admin_toggle_plano_ativo': (1, 'get', None, 302),
+    'admin_categorias': (3, 'get', None, 200),
+    'admin_criar_categoria': (2, 'get', None, 200),
+    'admin_editar_categoria': (3, 'get', None, 200),
+    'admin_excluir_categoria': (3, 'get', None, 200),
+    'admin_usuarios': (3, 'get', None, 200),
+    'admin_toggle_usuario_ativo': (1, 'get', None, 302),
+    'admin_usuario_detalhe': (7, 'get', None, 200),
+    'admin_produtos': (3, 'get', None, 200),
+    'admin_toggle_produto_ativo': (1, 'get', None, 302),
+    'admin_produto_detalhe': (6, 'get', None, 200),
+    'admin_transacoes': (6, 'get', None, 200),
+}
+
+
+SEGREDO_WEBHOOK = 'whsec_teste'
+
+
+def assinar_webhook(corpo):
+    """Cabeçalho Stripe-Signature de 'corpo', como o Stripe assina (ver stripe.WebhookSignature)."""
+    momento = int(time.time())
+    assinatura = hmac.new(SEGREDO_WEBHOOK.encode(), f'{momento}.{corpo}'.encode(), hashlib.sha256).hexdigest()
+    return f't={momento},v1={assinatura}'
+
+
+class ConsultasTestMixin:
+    """assertMaxQueries: falha se a requisição passar de n queries (ou não der o status)."""
+
+    def assertMaxQueries(self, view, n, cliente=None, metodo='get', dados=None, status=200, **kwargs):
+        """
+        'view' é o nome da URL (reverse) e kwargs os parâmetros dela. 'dados'
+        em str vai como corpo JSON. Retorna a resposta. Na falha lista as
+        queries e os formatos repetidos.
+        """
+        cliente = cliente or self.client
+        url = reverse(view, kwargs=kwargs or None)
+        extra = {'content_type': 'application/json'} if isinstance(dados, str) else {}
+        with RegistroConsultas() as registro:
+            response = getattr(cliente, metodo)(url, dados or {}, **extra)
+
+        self.assertEqual(
+            response.status_code, status,
+            f"{metodo.upper()} {url}: status {response.status_code} (esperado {status})",
+        )
+        if registro.total > n:
+            repetidas = ''.join(f"\n  N+1? {vezes}x {sql}" for sql, vezes in registro.repetidas())
+            consultas = ''.join(f"\n  {i}. {sql}" for i, (sql, _) in enumerate(registro.consultas, 1))
+            self.fail(
+                f"{metodo.upper()} {url}: {registro.total} queries (máximo {n})"
+                f"{repetidas}\nQueries:{consultas}"
+            )
+        return response
+
+
+@override_settings(CONSULTAS_INSTRUMENTAR=False, ALLOWED_HOSTS=['*'], STRIPE_WEBHOOK_SECRET=SEGREDO_WEBHOOK)
+class OrcamentoConsultasTests(ConsultasTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.plano = Plano.objects.create(nome='Pro', slug='pro-teste', preco_mensal=Decimal('29.90'))
+        cls.loja = Loja.objects.create(nome='Loja Teste')
+        cls.usuario = Usuario.objects.create(
+            nome='Comprador', email='comprador@teste.com', senha='x',
+            loja=cls.loja, plano=cls.plano,
+        )
+        cls.endereco = Endereco.objects.create(
+            usuario=cls.usuario, rua='Rua A', numero=1, bairro='Centro',
+            cidade='São Paulo', estado='SP', cep='01311923', principal=True,
+        )
+        cls.categoria = Categoria.objects.create(nome='Eletrônicos')
+
+        # vários produtos e itens: um N+1 aparece como query repetida
+        cls.produtos = [
+            Produto.objects.create(
+                nome=f'Produto {i}', valor=Decimal('100.00'), desconto=Decimal('10'),
+                q_estoque=50, categoria=cls.categoria, loja=cls.loja,
+                vendedor=cls.usuario, imagem='produtos/teste.jpg',
+            )
+            for i in range(5)
+        ]
+        cls.produto = cls.produtos[0]
+
+        carrinho = Carrinho.objects.create(usuario=cls.usuario)
+        CarrinhoProduto.objects.bulk_create([
+            CarrinhoProduto(carrinho=carrinho, produto=produto, quantidade=2)
+            for produto in cls.produtos
+        ])
+        for _ in range(3):
+            pedido = Pedido.objects.create(usuario=cls.usuario, endereco=cls.endereco, status='Pago')
+            PedidoProduto.objects.bulk_create([
+                PedidoProduto(pedido=pedido, produto=produto, quantidade=1, preco_unitario=produto.valor)
+                for produto in cls.produtos
+            ])
+
+        # o admin padrão é criado no post_migrate (models.py)
+        cls.admin, _ = AdminUser.objects.get_or_create(
+            username='admin', defaults={'password': make_password('admin')}
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def _cliente(self, nome_url, dados=None):
+        if nome_url == 'stripe_webhook':
+            # o Stripe não tem sessão: só a assinatura do corpo
+            return Client(headers={'Stripe-Signature': assinar_webhook(dados)})
+        cliente = Client()
+        sessao = cliente.session
+        if nome_url.startswith('admin_'):
+            sessao['admin_id'] = self.admin.id
+        else:
+            sessao['usuario_id'] = self.usuario.id
+            sessao['usuario_nome'] = self.usuario.nome
+        sessao.save()
+        return cliente
+
+    def _parametros(self):
+        return {
+            'produto_id': self.produto.id,
+            'categoria_id': self.categoria.id,
+            'endereco_id': self.endereco.id,
+            'plano_id': self.plano.id,
+            'usuario_id': self.usuario.id,
+        }
+
+    def _urls(self):
+        # includes (oauth, stripe) são de terceiros e ficam de fora
+        return [p for p in urls.urlpatterns if isinstance(p, URLPattern) and p.name]
+
+    def test_toda_url_tem_orcamento(self):
+        sem_orcamento = sorted(p.name for p in self._urls() if p.name not in ORCAMENTOS)
+        self.assertEqual(sem_orcamento, [], 'URLs sem entrada em ORCAMENTOS')
+
+    def evento_pagamento(self):
+        """Corpo do webhook checkout.session.completed de uma compra do carrinho, já reservada."""
+        itens = [(produto.id, 2) for produto in self.produtos]
+        lote, _ = reservar_itens(self.usuario, itens)
+        sessao = {
+            'id': 'cs_orcamento', 'object': 'checkout.session', 'status': 'complete',
+            'payment_status': 'paid', 'amount_total': 90000, 'client_reference_id': str(self.usuario.id),
+            'metadata': {'usuario_id': str(self.usuario.id), 'reserva_lote': lote,
+                         'endereco_id': str(self.endereco.id), 'frete_valor': '25.90'},
+        }
+        return json.dumps({
+            'id': 'evt_orcamento', 'object': 'event', 'type': 'checkout.session.completed',
+            'data': {'object': sessao},
+        })
+
+    def test_orcamento_de_queries(self):
+        parametros = self._parametros()
+        for padrao in self._urls():
+            if padrao.name not in ORCAMENTOS:
+                continue
+            n, metodo, dados, status = ORCAMENTOS[padrao.name]
+            kwargs = {nome: parametros[nome] for nome in padrao.pattern.converters}
+            with self.subTest(url=padrao.name), transaction.atomic(), servicos_falsos():
+                if callable(dados):
+                    dados = dados(self)
+                self.assertMaxQueries(
+                    padrao.name, n, cliente=self._cliente(padrao.name, dados),
+                    metodo=metodo, dados=dados, status=status, **kwargs
+                )
+                # views que alteram dados (excluir, toggle...) não afetam as próximas
+                transaction.set_rollback(True)
+
+
+@override_settings(CONSULTAS_INSTRUMENTAR=False, TAREFAS_SINCRONAS=False)
+class ConsultasPorVolumeTests(ConsultasTestMixin, TestCase):
+    """O número de queries das listagens não cresce com o número de pedidos."""
+
+    def setUp(self):
+        cache.clear()
+        self.loja = Loja.objects.create(nome='Loja')
+        self.comprador = Usuario.objects.create(nome='C', email='c@x.com', senha='x')
+        categoria = Categoria.objects.create(nome='Casa')
+        self.produtos = [
+            Produto.objects.create(nome=f'P{i}', valor=Decimal('10'), q_estoque=1000, categoria=categoria,
+                                   loja=self.loja, vendedor=self.comprador)
+            for i in range(3)
+        ]
+        self.admin, _ = AdminUser.objects.get_or_create(username='admin', defaults={'password': make_password('admin')})
+
+    def _cliente(self, **sessao_dados):
+        cliente = Client()
+        sessao = cliente.session
+        sessao.update(sessao_dados)
+        sessao.save()
+        return cliente
+
+    def _pedidos(self, n):
+        for i in range(n):
+            pedido = fechar_pedido(self.comprador, [(p.id, i % 3 + 1) for p in self.produtos])
+            Pedido.objects.filter(id=pedido.id).update(data_efetuado=F('data_efetuado') - timedelta(days=i % 4))
+        reconstruir_vendas_diarias()
+
+    def _contagens(self, view, cliente, **kwargs):
+        """Queries da view com 1 pedido e com 30, sempre dentro do orçamento de ORCAMENTOS."""
+        # os orçamentos contam o usuário logado já em cache (sessao.py): aquece antes
+        cliente.get(reverse(view, kwargs=kwargs or None))
+        contagens = []
+        for n in (1, 29):
+            self._pedidos(n)
+            self.assertMaxQueries(view, ORCAMENTOS[view][0], cliente=cliente, **kwargs)
+            with RegistroConsultas() as registro:
+                cliente.get(reverse(view, kwargs=kwargs or None))
+            contagens.append(registro.total)
+        return contagens
+
+    def test_admin_vendas_pelo_consolidado(self):
+        cliente = self._cliente(admin_id=self.admin.id)
+        for view, kwargs in [('admin_transacoes', {}), ('admin_produto_detalhe', {'produto_id': self.produtos[0].id})]:
+            with self.subTest(view=view):
+                com_um, com_muitos = self._contagens(view, cliente, **kwargs)
+                self.assertEqual(com_um, com_muitos)
+            Pedido.objects.all().delete()
+
+    def test_meus_pedidos_sem_n_mais_1(self):
+        Endereco.objects.create(usuario=self.comprador, rua='Rua A', numero=1, bairro='Centro',
+                                cidade='São Paulo', estado='SP', cep='01311923', principal=True)
+        cliente = self._cliente(usuario_id=self.comprador.id, usuario_nome=self.comprador.nome)
+        com_um, com_muitos = self._contagens('meus_pedidos', cliente)
+        self.assertEqual(com_um, com_muitos)
+
+        resposta = cliente.get(reverse('meus_pedidos'))
+        pedidos = resposta.context['pedidos']
+        self.assertEqual(len(pedidos), 20)  # por_pagina
+        for pedido in pedidos:
+            self.assertEqual(pedido.total_valor, sum(item.subtotal_valor for item in pedido.itens.all()))
+            self.assertEqual(pedido.qtd_itens, sum(item.quantidade for item in pedido.itens.all()))
+
+
+@override_settings(USUARIO_CACHE_TTL=60)
+class UsuarioSessaoTests(TestCase):
+    """sessao.py: request.usuario preguiçoso, em cache, e invalidado quando perfil/plano/loja mudam."""
+
+    def setUp(self):
+        cache.clear()
+        self.loja = Loja.objects.create(nome='Loja')
+        self.basico = Plano.objects.create(nome='Básico', slug='basico-teste', preco_mensal=Decimal('0'))
+        self.pro = Plano.objects.create(nome='Pro', slug='pro-teste', preco_mensal=Decimal('29.90'))
+        self.usuario = Usuario.objects.create(nome='U', email='u@x.com', senha='x', loja=self.loja, plano=self.basico)
+
+    def _request(self):
+        request = RequestFactory().get('/')
+        request.session = SessionStore()
+        request.session['usuario_id'] = self.usuario.id
+        UsuarioMiddleware(lambda r: None).process_request(request)
+        return request
+
+    def _carregar(self):
+        return carregar_usuario(self.usuario.id)
+
+    def test_preguicoso_e_em_cache(self):
+        with self.assertNumQueries(0):
+            request = self._request()
+        with self.assertNumQueries(1):
+            self.assertEqual(request.usuario.plano.slug, 'basico-teste')  # loja e plano no mesmo SELECT
+            self.assertEqual(request.usuario.loja.nome, 'Loja')
+        with self.assertNumQueries(0):
+            self.assertEqual(self._request().usuario.id, self.usuario.id)
+            self.assertEqual(async_to_sync(self._request().ausuario)().id, self.usuario.id)
+
+    def test_invalidado_ao_editar_perfil_plano_e_loja(self):
+        self._carregar()
+        self.usuario.nome = 'Novo nome'
+        self.usuario.save()
+        self.assertEqual(self._carregar().nome, 'Novo nome')
+
+        self.basico.limite_anuncios = 99
+        self.basico.save()
+        self.assertEqual(self._carregar().plano.limite_anuncios, 99)
+
+        self.loja.nome = 'Loja nova'
+        self.loja.save()
+        self.assertEqual(self._carregar().loja.nome, 'Loja nova')
+
+    def test_plano_ativado_pelo_stripe_nao_fica_velho(self):
+        self.assertEqual(self._request().usuario.plano, self.basico)
+        # ativar_plano_da_sessao usa update(), que não dispara signals
+        ativar_plano_da_sessao({
+            'payment_status': 'paid',
+            'metadata': {'plano_slug': self.pro.slug, 'usuario_id': str(self.usuario.id)},
+        })
+        self.assertEqual(self._request().usuario.plano, self.pro)
+
+
+class BenchmarkTests(TestCase):
+    """O benchmark (comando 'benchmark') roda de ponta a ponta com poucos dados."""
+
+    def test_relatorio_json(self):
+        criados = semear(produtos=30, usuarios=10, pedidos=20, itens_por_pedido=2, log=lambda *a: None)
+        self.assertEqual(criados['Produto'], 30)
+        self.assertEqual(criados['PedidoProduto'], 40)
+
+        relatorio = executar(repeticoes=2, log=lambda *a: None)
+        json.dumps(relatorio)  # precisa ser serializável
+
+        self.assertEqual(set(relatorio['resultados']), {rota[0] for rota in ROTAS})
+        for nome, resultado in relatorio['resultados'].items():
+            with self.subTest(rota=nome):
+                self.assertEqual(resultado['status'], 200)
+                self.assertGreater(resultado['latencia_ms']['mediana'], 0)
+
+
+class CamadaCacheTests(TestCase):
+    """freepigeon/cache.py: versão por namespace e um único recálculo por vez."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_invalidar_troca_a_versao(self):
+        valores = iter([1, 2])
+        self.assertEqual(camada.buscar('teste', ('a',), lambda: next(valores), 60), 1)
+        self.assertEqual(camada.buscar('teste', ('a',), lambda: next(valores), 60), 1)
+        camada.invalidar('teste')
+        self.assertEqual(camada.buscar('teste', ('a',), lambda: next(valores), 60), 2)
+
+    def test_valor_vencido_servido_enquanto_outro_recalcula(self):
+        leitura = camada.ler('teste', ('b',))
+        self.assertTrue(leitura.recalcular)
+        camada.gravar(leitura, 'antigo', ttl=-1)
+
+        recalculando = camada.ler('teste', ('b',))  # pega a trava
+        self.assertTrue(recalculando.recalcular)
+        outro = camada.ler('teste', ('b',))
+        self.assertEqual((outro.valor, outro.recalcular), ('antigo', False))
+
+        camada.gravar(recalculando, 'novo', ttl=60)
+        self.assertEqual(camada.ler('teste', ('b',)).valor, 'novo')
+
+    def test_planos_invalidados_ao_salvar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            plano = Plano.objects.create(nome='Turbo', slug='turbo-teste', preco_mensal=Decimal('99.90'))
+        self.assertIn(plano, planos_ativos())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            plano.ativo = False
+            plano.save()
+        self.assertNotIn(plano, planos_ativos())
+        with self.assertNumQueries(0):
+            planos_ativos()
+
+
+class _CorreiosFalso(BaseHTTPRequestHandler):
+    """CalcPrecoPrazo local: responde o XML dos Correios (ou 'status' de erro)."""
+
+    def do_GET(self):
+        servidor = self.server
+        servico = parse_qs(urlparse(self.path).query)['nCdServico'][0]
+        servidor.consultas.append(servico)
+        try:
+            # PAC e SEDEX precisam chegar juntos: em sequência a barreira estoura
+            servidor.barreira.wait()
+        except threading.BrokenBarrierError:
+            servidor.barreira.reset()
+            self.send_error(504)
+            return
+        if servidor.status != 200:
+            self.send_error(servidor.status)
+            return
+        valor = '25,90' if servico == '04510' else '39,90'
+        corpo = (
+            f"<Servicos><cServico><Codigo>{servico}</Codigo><Valor>{valor}</Valor>"
+            f"<PrazoEntrega>5</PrazoEntrega><Erro>0</Erro><MsgErro></MsgErro></cServico></Servicos>"
+        ).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+class FreteCorreiosTests(TestCase):
+    """utils_frete.acotar_frete contra um servidor HTTP local no lugar dos Correios."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.servidor = ThreadingHTTPServer(('127.0.0.1', 0), _CorreiosFalso)
+        threading.Thread(target=cls.servidor.serve_forever, daemon=True).start()
+        cls.addClassCleanup(cls.servidor.server_close)
+        cls.addClassCleanup(cls.servidor.shutdown)
+        url = f"http://127.0.0.1:{cls.servidor.server_port}/CalcPrecoPrazo"
+        cls.enterClassContext(override_settings(CORREIOS_URL=url, CORREIOS_TIMEOUT=5, FRETE_CIRCUITO_FALHAS=3))
+
+    def setUp(self):
+        cache.clear()
+        self.servidor.consultas = []
+        self.servidor.status = 200
+        self.servidor.barreira = threading.Barrier(2, timeout=2)
+
+    def _cotar(self, cep, peso):
+        return async_to_sync(acotar_frete)('01311923', cep, Decimal(peso))
+
+    def test_pac_e_sedex_juntos_e_cache_por_faixa(self):
+        opcoes = self._cotar('04567000', '0.7')
+        self.assertEqual([(o['codigo'], o['valor']) for o in opcoes], [('PAC', 25.9), ('SEDEX', 39.9)])
+        self.assertEqual(sorted(self.servidor.consultas), ['04014', '04510'])
+
+        # mesmo prefixo de CEP e mesma faixa de peso (até 1kg): sai do cache
+        self.assertEqual(self._cotar('04567999', '0.9'), opcoes)
+        self.assertEqual(len(self.servidor.consultas), 2)
+
+        # outra faixa de peso consulta de novo
+        self._cotar('04567000', '1.2')
+        self.assertEqual(len(self.servidor.consultas), 4)
+
+    def test_falhas_abrem_o_circuito(self):
+        self.servidor.status = 500
+        for _ in range(3):
+            opcoes = self._cotar('04567000', '0.7')
+            self.assertEqual(opcoes[0]['nome'], 'PAC - (simulado)')
+        self.assertTrue(circuito_aberto())
+        self.assertEqual(len(self.servidor.consultas), 6)
+
+        # circuito aberto: nem chega a consultar, mesmo com os Correios de volta
+        self.servidor.status = 200
+        self.assertEqual(self._cotar('01000000', '0.7')[0]['nome'], 'PAC - (simulado)')
+        self.assertEqual(len(self.servidor.consultas), 6)
+
+
+class BuscaTests(TestCase):
+    """busca.py (backend em memória, o do SQLite): prefixo, acentos, relevância e reindexação."""
+
+    def setUp(self):
+        # índice novo a cada teste: o do processo guardaria produtos de outros testes
+        patcher = mock.patch.object(busca, '_backend', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.categoria = Categoria.objects.create(nome='Eletrônicos')
+
+    def _produto(self, nome, descricao='', categoria=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Produto.objects.create(
+                nome=nome, descricao=descricao, valor=10, q_estoque=1, categoria=categoria or self.categoria,
+            )
+
+    def _ids(self, texto):
+        return list(busca.buscar(Produto.objects.all(), texto).values_list('id', flat=True))
+
+    def test_prefixo_em_todos_os_termos(self):
+        samsung = self._produto('Celular Samsung')
+        motorola = self._produto('Celular Motorola')
+        self._produto('Capa para notebook')
+        self.assertEqual(self._ids('cel sam'), [samsung.id])
+        self.assertEqual(sorted(self._ids('cel')), sorted([samsung.id, motorola.id]))
+        self.assertEqual(self._ids('celulares'), [])
+        self.assertEqual(self._ids('  !! '), [])
+
+    def test_acentos_e_maiusculas(self):
+        fogao = self._produto('Fogão Elétrico')
+        self.assertEqual(self._ids('FOGAO eletrico'), [fogao.id])
+        self.assertEqual(self._ids('fogão'), [fogao.id])
+        self.assertEqual(self._ids('eletronicos'), [fogao.id])  # categoria
+
+    def test_relevancia_pelo_campo(self):
+        na_descricao = self._produto('Cabo', descricao='compatível com fone bluetooth')
+        no_nome = self._produto('Fone bluetooth')
+        na_categoria = self._produto('Caixa', categoria=Categoria.objects.create(nome='Fones'))
+        self.assertEqual(self._ids('fone'), [no_nome.id, na_categoria.id, na_descricao.id])
+
+    def test_reindexa_pelos_signals(self):
+        produto = self._produto('Ventilador')
+        self.assertEqual(self._ids('ventilador'), [produto.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            produto.nome = 'Circulador de ar'
+            produto.save()
+        self.assertEqual(self._ids('ventilador'), [])
+        self.assertEqual(self._ids('circulador'), [produto.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ProdutoAtributo.objects.create(
+                produto=produto, atributo=Atributo.objects.create(nome='Tensão'), valor='220V',
+            )
+        self.assertEqual(self._ids('tensao 220'), [produto.id])
+
+        self.categoria.nome = 'Climatização'
+        self.categoria.save()
+        self.assertEqual(self._ids('climatizacao'), [produto.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            produto.delete()
+        self.assertEqual(self._ids('circulador'), [])
+        self.assertEqual(busca.get_backend()._termos, sorted(busca.get_backend()._indice))
+
+
+class PaginacaoTests(TestCase):
+    """paginar(): o cursor não pula nem repete linhas empatadas."""
+
+    def _todas(self, queryset, ordenacao, por_pagina=3):
+        fabrica = RequestFactory()
+        ids, cursor = [], None
+        while True:
+            pagina = paginar(fabrica.get('/', {'cursor': cursor} if cursor else {}), queryset,
+                             ordenacao=ordenacao, por_pagina=por_pagina)
+            ids += [obj.id for obj in pagina.itens]
+            if not pagina.tem_proxima:
+                return ids, pagina
+            cursor = pagina.cursor_proximo
+
+    def test_empate_no_mesmo_milissegundo(self):
+        usuario = Usuario.objects.create(nome='U', email='u@teste.com', senha='x')
+        pedidos = [Pedido.objects.create(usuario=usuario) for _ in range(10)]
+        base = timezone.now().replace(microsecond=123000)
+        for i, pedido in enumerate(pedidos):
+            Pedido.objects.filter(id=pedido.id).update(data_efetuado=base + timedelta(microseconds=i * 10))
+
+        esperado = [p.id for p in reversed(pedidos)]
+        ids, ultima = self._todas(Pedido.objects.all(), ('-data_efetuado', '-id'))
+        self.assertEqual(ids, esperado)
+
+        # e voltando a partir da última página
+        anterior = paginar(RequestFactory().get('/', {'cursor': ultima.cursor_anterior}), Pedido.objects.all(),
+                           ordenacao=('-data_efetuado', '-id'), por_pagina=3)
+        self.assertEqual([p.id for p in anterior.itens], esperado[6:9])
+
+    @mock.patch.object(busca, '_backend', None)
+    def test_busca_com_relevancia_empatada(self):
+        categoria = Categoria.objects.create(nome='Som')
+        with self.captureOnCommitCallbacks(execute=True):
+            produtos = [Produto.objects.create(nome='Fone Bluetooth', valor=10, q_estoque=1, categoria=categoria)
+                        for _ in range(7)]
+        ids, _ = self._todas(busca.buscar(Produto.objects.all(), 'fone'), ('-relevancia', '-id'))
+        self.assertEqual(ids, sorted((p.id for p in produtos), reverse=True))
+
+    def test_cursor_invalido(self):
+        self.assertEqual(decodificar_cursor('lixo'), (None, None))
+        valores, direcao = decodificar_cursor(codificar_cursor([timezone.now(), Decimal('1.50'), 7], 'n'))
+        self.assertEqual((type(valores[0]), valores[1:], direcao), (type(timezone.now()), [Decimal('1.50'), 7], 'n'))
+
+
+@override_settings(TAREFAS_SINCRONAS=False)
+class FecharPedidoTests(TestCase):
+    """pedidos.fechar_pedido: tudo ou nada, com um único UPDATE de estoque."""
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create(nome='C', email='c@x.com', senha='x')
+        categoria = Categoria.objects.create(nome='Casa')
+        self.produtos = [
+            Produto.objects.create(nome=f'P{i}', valor=Decimal('10'), q_estoque=estoque, categoria=categoria)
+            for i, estoque in enumerate([5, 3, 1])
+        ]
+
+    def _estoques(self):
+        return list(Produto.objects.order_by('id').values_list('q_estoque', flat=True))
+
+    def test_estoque_insuficiente_nao_grava_nada(self):
+        a, b, c = self.produtos
+        with self.assertRaises(EstoqueInsuficiente) as erro:
+            fechar_pedido(self.usuario, [(a.id, 2), (b.id, 1), (c.id, 2)])
+        self.assertEqual(erro.exception.faltando, {c.id: (2, 1)})
+        self.assertEqual(self._estoques(), [5, 3, 1])
+        self.assertFalse(Pedido.objects.exists())
+        self.assertFalse(PedidoProduto.objects.exists())
+        self.assertFalse(Tarefa.objects.exists())
+
+    def test_baixa_varios_produtos_em_um_update(self):
+        a, b, c = self.produtos
+        with CaptureQueriesContext(connection) as consultas:
+            pedido = fechar_pedido(self.usuario, [(a.id, 2), (b.id, 3), (a.id, 1), (c.id, 1)])
+        updates = [q['sql'] for q in consultas.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('CASE', updates[0])
+
+        self.assertEqual(self._estoques(), [2, 0, 0])
+        self.assertEqual(
+            dict(pedido.itens.values_list('produto_id', 'quantidade')), {a.id: 3, b.id: 3, c.id: 1},
+        )
+        self.assertEqual(list(pedido.itens.values_list('preco_unitario', flat=True).distinct()), [Decimal('10')])
+
+
+class ReservasTests(TestCase):
+    """Reserva de estoque do checkout (reservas.py)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create(nome='U', email='u@teste.com', senha='x')
+        cls.outro = Usuario.objects.create(nome='V', email='v@teste.com', senha='x')
+        categoria = Categoria.objects.create(nome='Casa')
+        cls.a = Produto.objects.create(nome='A', valor=10, q_estoque=5, categoria=categoria)
+        cls.b = Produto.objects.create(nome='B', valor=10, q_estoque=2, categoria=categoria)
+
+    def _reservado(self):
+        return dict(Produto.objects.filter(id__in=[self.a.id, self.b.id]).values_list('id', 'q_reservado'))
+
+    def test_nao_reserva_alem_do_estoque(self):
+        reservar_itens(self.usuario, [(self.a.id, 3), (self.b.id, 2)])
+        with self.assertRaises(EstoqueInsuficiente) as erro:
+            reservar_itens(self.outro, [(self.a.id, 2), (self.b.id, 1)])
+        self.assertEqual(erro.exception.faltando, {self.b.id: (1, 0)})
+        # tudo ou nada: o UPDATE do produto A também foi desfeito
+        self.assertEqual(self._reservado(), {self.a.id: 3, self.b.id: 2})
+        self.assertEqual(Reserva.objects.filter(usuario=self.outro).count(), 0)
+
+        # reabrir o checkout troca a reserva anterior do usuário, não soma
+        reservar_itens(self.usuario, [(self.a.id, 1)])
+        self.assertEqual(self._reservado(), {self.a.id: 1, self.b.id: 0})
+
+    def test_converter_e_liberar_lote(self):
+        lote, _ = reservar_itens(self.usuario, [(self.a.id, 2), (self.a.id, 1), (self.b.id, 1)])
+        reservado = converter_lote(lote)
+        self.assertEqual(reservado, {self.a.id: 3, self.b.id: 1})
+        fechar_pedido(self.usuario, [(self.a.id, 3), (self.b.id, 1)], reservado=reservado)
+        self.assertEqual(
+            list(Produto.objects.filter(id__in=[self.a.id, self.b.id]).order_by('id')
+                 .values_list('q_estoque', 'q_reservado')),
+            [(2, 0), (1, 0)],
+        )
+        self.assertEqual(converter_lote(lote), {})  # já convertido
+
+        lote, _ = reservar_itens(self.outro, [(self.a.id, 2)])
+        liberar_lote(lote)
+        liberar_lote(lote)  # de novo: não devolve duas vezes
+        self.assertEqual(self._reservado(), {self.a.id: 0, self.b.id: 0})
+        self.assertFalse(Reserva.objects.exists())
+
+    def test_expirar_reservas(self):
+        _, expira_em = reservar_itens(self.usuario, [(self.a.id, 2)])
+        reservar_itens(self.outro, [(self.b.id, 1)], minutos=60)
+        self.assertEqual(expirar_reservas(agora=expira_em - timedelta(seconds=1)), 0)
+        self.assertEqual(expirar_reservas(agora=expira_em), 2)
+        self.assertEqual(self._reservado(), {self.a.id: 0, self.b.id: 1})
+
+    @override_settings(RESERVA_MINUTOS=30)
+    def test_sessao_do_stripe_dura_mais_de_30_minutos(self):
+        antes = timezone.now()
+        _, expira_em = reservar_itens(self.usuario, [(self.a.id, 1)])
+        self.assertGreaterEqual(expira_em - antes, timedelta(minutes=31))
+
+
+class PrecoFinalTests(TestCase):
+    """Produto.preco_final (coluna gerada) bate com a conta em Python."""
+
+    def test_coluna_igual_ao_calculo_em_python(self):
+        categoria = Categoria.objects.create(nome='Casa')
+        casos = [
+            (Decimal('52.00'), Decimal('10')),      # inteiros: sem divisão inteira no SQLite
+            (Decimal('19.99'), Decimal('15.5')),
+            (Decimal('100.00'), None),
+            (Decimal('100.00'), Decimal('0')),
+        ]
+        for valor, desconto in casos:
+            with self.subTest(valor=valor, desconto=desconto):
+                produto = Produto.objects.create(
+                    nome='P', valor=valor, desconto=desconto, q_estoque=1, categoria=categoria
+                )
+                esperado = produto.calcular_preco_final()
+                self.assertEqual(produto.preco_final, esperado)
+                produto.refresh_from_db()
+                self.assertEqual(produto.preco_final, esperado)
+
+                # save() mantém o valor em memória igual ao do banco
+                produto.desconto = Decimal('25')
+                produto.save()
+                em_memoria = produto.preco_final
+                produto.refresh_from_db()
+                self.assertEqual(em_memoria, produto.preco_final)
+
+        precos = list(Produto.objects.order_by('preco_final').values_list('preco_final', flat=True))
+        self.assertEqual(precos, sorted(precos))
+
+
+class ResumoCarrinhoTests(TestCase):
+    """carrinho.resumo_carrinho: subtotais e totais numa query, com o desconto."""
+
+    def test_totais_em_uma_query(self):
+        categoria = Categoria.objects.create(nome='Casa')
+        carrinho = Carrinho.objects.create()
+        casos = [(Decimal('19.99'), Decimal('15.5'), 3), (Decimal('52.00'), None, 1), (Decimal('10.00'), Decimal('10'), 2)]
+        for valor, desconto, quantidade in casos:
+            produto = Produto.objects.create(nome='P', valor=valor, desconto=desconto, q_estoque=9, categoria=categoria)
+            CarrinhoProduto.objects.create(carrinho=carrinho, produto=produto, quantidade=quantidade)
+
+        with self.assertNumQueries(1):
+            itens, total_itens, total = resumo_carrinho(carrinho)
+            self.assertEqual([i.subtotal_valor for i in itens], [i.subtotal() for i in itens])
+
+        self.assertEqual(total_itens, 6)
+        self.assertEqual(total, sum(i.produto.calcular_preco_final() * i.quantidade for i in itens))
+        self.assertEqual(total, Decimal('120.67'))  # 16.89 x 3 + 52.00 + 9.00 x 2
+        self.assertEqual(carrinho.total(), total)
+
+    def test_carrinho_vazio(self):
+        carrinho = Carrinho.objects.create()
+        self.assertEqual(resumo_carrinho(carrinho), ([], 0, Decimal('0.00')))
+        self.assertEqual(resumo_carrinho(None).total, Decimal('0.00'))
+        self.assertEqual(carrinho.total(), Decimal('0.00'))
+
+
+class FacetasTests(TestCase):
+    """Filtros e contagens de facetas.py (cada faceta ignora o próprio filtro)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categoria = Categoria.objects.create(nome='Eletro')
+        cls.loja_a = Loja.objects.create(nome='A')
+        cls.loja_b = Loja.objects.create(nome='B')
+        cls.tensao = Atributo.objects.create(nome='Tensão')
+        # (loja, valor, tensão)
+        for loja, valor, tensao in [
+            (cls.loja_a, '40', '110V'), (cls.loja_a, '80', '220V'),
+            (cls.loja_b, '120', '220V'), (cls.loja_b, '600', '220V'),
+        ]:
+            produto = Produto.objects.create(
+                nome='P', valor=Decimal(valor), q_estoque=1, categoria=cls.categoria, loja=loja,
+            )
+            ProdutoAtributo.objects.create(produto=produto, atributo=cls.tensao, valor=tensao)
+        # signals só rodam no commit, que não acontece aqui
+        sincronizar_fichas()
+
+    def setUp(self):
+        cache.clear()
+
+    def _filtros(self, **params):
+        dados = QueryDict(mutable=True)
+        for nome, valor in params.items():
+            dados.setlist(nome, valor if isinstance(valor, list) else [valor])
+        return ler_filtros(dados)
+
+    def test_filtros(self):
+        filtros = self._filtros(preco_max='100', **{f'atributo_{self.tensao.id}': '220V'})
+        self.assertEqual(filtrar(Produto.objects.all(), filtros).count(), 1)
+
+    def test_contagens_ignoram_o_proprio_filtro(self):
+        filtros = self._filtros(loja=str(self.loja_a.id), **{f'atributo_{self.tensao.id}': '220V'})
+        # preço, categorias, lojas, atributos (+1 do atributo selecionado) e os
+        # nomes dos atributos (cache vazio)
+        with self.assertNumQueries(6):
+            resultado = facetas(Produto.objects.all(), filtros)
+
+        lojas = {loja['nome']: loja['total'] for loja in resultado['lojas']}
+        self.assertEqual(lojas, {'A': 1, 'B': 2})  # só 220V, qualquer loja
+        [tensao] = resultado['atributos']
+        valores = {v['valor']: (v['total'], v['selecionado']) for v in tensao['valores']}
+        self.assertEqual(valores, {'110V': (1, False), '220V': (1, True)})  # só loja A
+        self.assertEqual([faixa['total'] for faixa in resultado['precos']], [0, 1, 0, 0, 0, 0])
+
+    def test_ficha_acompanha_produto_atributo(self):
+        produto = Produto.objects.filter(ficha__isnull=False).first()
+        self.assertIn('Tensão', produto.ficha)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tensao.nome = 'Voltagem'
+            self.tensao.save()
+        produto.refresh_from_db()
+        self.assertEqual(list(produto.ficha), ['Voltagem'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            produto.atributos.all().delete()
+        produto.refresh_from_db()
+        self.assertEqual(produto.ficha, {})
+
+
+class MiniaturasTests(TestCase):
+    """Miniaturas WebP/JPEG no upload (imagens.py) e a tag {% imagem_responsiva %}."""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        configuracao = override_settings(MEDIA_ROOT=self.media)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        self.categoria = Categoria.objects.create(nome='Casa')
+
+    def _jpeg(self, largura, altura):
+        saida = io.BytesIO()
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'  # Make
+        Image.new('RGB', (largura, altura), (200, 30, 30)).save(saida, 'JPEG', exif=exif.tobytes())
+        return SimpleUploadedFile('foto.jpg', saida.getvalue(), content_type='image/jpeg')
+
+    def test_gera_larguras_sem_metadados(self):
+        produto = Produto.objects.create(
+            nome='P', valor=Decimal('10'), q_estoque=1, categoria=self.categoria,
+            imagem=self._jpeg(700, 350),
+        )
+        self.assertEqual(gerar_miniaturas(produto), [160, 320, 640, 700])
+        produto.refresh_from_db()
+        self.assertEqual(produto.miniaturas, [160, 320, 640, 700])
+
+        storage = produto.imagem.storage
+        for largura in produto.miniaturas:
+            for extensao in ('webp', 'jpg'):
+                with storage.open(nome_miniatura(produto.imagem.name, largura, extensao)) as arquivo:
+                    miniatura = Image.open(arquivo)
+                    self.assertEqual(miniatura.size, (largura, largura // 2))
+                    self.assertFalse(miniatura.getexif())
+
+        html = Template(
+            '{% load imagens_extras %}{% imagem_responsiva produto alt="Foto" sizes="80px" %}'
+        ).render(Context({'produto': produto}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn('.160w.webp 160w', html)
+        self.assertIn('.700w.jpg 700w', html)
+        self.assertIn('sizes="80px"', html)
+
+        # trocar a imagem apaga as miniaturas da anterior
+        antiga = nome_miniatura(produto.imagem.name, 160, 'webp')
+        trocar_imagem(produto, self._jpeg(100, 100))
+        produto.save()
+        self.assertEqual(gerar_miniaturas(produto), [100])
+        self.assertFalse(storage.exists(antiga))
+
+    def test_sem_imagem_usa_padrao(self):
+        produto = Produto.objects.create(nome='P', valor=Decimal('10'), q_estoque=1, categoria=self.categoria)
+        self.assertEqual(gerar_miniaturas(produto), [])
+        html = Template(
+            '{% load imagens_extras %}{% imagem_responsiva produto padrao="img/placeholder-product.jpg" %}'
+        ).render(Context({'produto': produto}))
+        self.assertIn('img/placeholder-product.jpg', html)
+        self.assertNotIn('<picture', html)
+
+
+# falhas restantes de tarefa_de_teste (TarefasTests)
+_FALHAS = []
+
+
+@tarefa(max_tentativas=2, espera=10)
+def tarefa_de_teste(produto_id):
+    if _FALHAS:
+        _FALHAS.pop()
+        raise RuntimeError('falha de teste')
+    Produto.objects.filter(id=produto_id).update(q_estoque=F('q_estoque') + 1)
+
+
+@override_settings(TAREFAS_SINCRONAS=False)
+class TarefasTests(TestCase):
+    """Fila de tarefas (tarefas.py): execução, chave, novas tentativas e adoção no pedido."""
+
+    def setUp(self):
+        self.produto = Produto.objects.create(
+            nome='P', valor=Decimal('10'), q_estoque=5, categoria=Categoria.objects.create(nome='Casa'),
+        )
+
+    def test_executa_por_prioridade_e_respeita_chave(self):
+        tarefas.enfileirar(tarefa_de_teste, chave='p', produto_id=self.produto.id)
+        self.assertIsNone(tarefas.enfileirar(tarefa_de_teste, chave='p', produto_id=self.produto.id))
+        self.assertEqual(tarefas.processar(), 1)
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.q_estoque, 6)
+        self.assertEqual(Tarefa.objects.get().status, Tarefa.CONCLUIDA)
+        # a chave só bloqueia enquanto houver uma pendente
+        self.assertIsNotNone(tarefas.enfileirar(tarefa_de_teste, chave='p', produto_id=self.produto.id))
+
+    def test_falha_volta_com_espera_e_desiste(self):
+        _FALHAS[:] = [1, 1]
+        item = tarefas.enfileirar(tarefa_de_teste, produto_id=self.produto.id)
+
+        tarefas.processar()
+        item.refresh_from_db()
+        self.assertEqual((item.status, item.tentativas), (Tarefa.PENDENTE, 1))
+        self.assertGreaterEqual(item.executar_em, timezone.now() + timedelta(seconds=9))
+        self.assertIn('falha de teste', item.erro)
+        self.assertEqual(tarefas.processar(), 0)  # ainda esperando
+
+        Tarefa.objects.update(executar_em=timezone.now())
+        tarefas.processar()
+        item.refresh_from_db()
+        self.assertEqual((item.status, item.tentativas), (Tarefa.FALHOU, 2))
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.q_estoque, 5)
+
+    def test_consolidado_de_vendas_pela_fila(self):
+        usuario = Usuario.objects.create(nome='C', email='c@x.com', senha='x')
+        pedido = fechar_pedido(usuario, [(self.produto.id, 2)])
+        self.assertFalse(VendaDiaria.objects.exists())
+
+        tarefas.processar()
+        self.assertEqual(VendaDiaria.objects.get().quantidade, 2)
+
+        # o recálculo já cobre o pedido: a consolidação pendente roda e não soma de novo
+        fechar_pedido(usuario, [(self.produto.id, 1)])
+        reconstruir_vendas_diarias()
+        self.assertEqual(tarefas.processar(), 1)
+        self.assertEqual(VendaDiaria.objects.get().quantidade, 3)
+        self.assertEqual(pedido.itens.count(), 1)
+
+    def test_consolidacao_executando_durante_recalculo(self):
+        usuario = Usuario.objects.create(nome='C', email='c@x.com', senha='x')
+        fechar_pedido(usuario, [(self.produto.id, 2)])
+        # o worker já pegou a tarefa (executando) quando o recálculo começa
+        [executando] = tarefas._reservar(1)
+        reconstruir_vendas_diarias()
+        self.assertEqual(VendaDiaria.objects.get().quantidade, 2)
+
+        self.assertTrue(tarefas.executar(executando))
+        self.assertEqual(VendaDiaria.objects.get().quantidade, 2)
+
+        # repetida (ex: devolvida pelo recuperar_travadas depois de concluir) também não soma
+        executando.refresh_from_db()
+        self.assertTrue(tarefas.executar(executando))
+        self.assertEqual(VendaDiaria.objects.get().quantidade, 2)
+
+        # pedido novo depois do recálculo: a tarefa dele soma normalmente
+        fechar_pedido(usuario, [(self.produto.id, 1)])
+        tarefas.processar()
+        self.assertEqual(VendaDiaria.objects.get().quantidade, 3)
+
+
+@override_settings(TAREFAS_SINCRONAS=False)
+class MetricasDashboardTests(TestCase):
+    """metricas.py: o SELECT único do dashboard bate com as mesmas contas feitas pelo ORM."""
+
+    def test_cards_iguais_ao_orm(self):
+        comprador = Usuario.objects.create(nome='C', email='c@x.com', senha='x')
+        Usuario.objects.create(nome='I', email='i@x.com', senha='x', ativo=False)
+        categoria = Categoria.objects.create(nome='Casa')
+        a = Produto.objects.create(nome='A', valor=Decimal('19.99'), desconto=Decimal('15'), q_estoque=9,
+                                   categoria=categoria)
+        b = Produto.objects.create(nome='B', valor=Decimal('5'), q_estoque=9, categoria=categoria)
+        antigo = fechar_pedido(comprador, [(a.id, 2)])
+        Pedido.objects.filter(id=antigo.id).update(data_efetuado=F('data_efetuado') - timedelta(days=2))
+        fechar_pedido(comprador, [(a.id, 1), (b.id, 3)])
+        sem_itens = Pedido.objects.create(usuario=comprador, status='Estoque insuficiente')
+        tarefas.processar()
+
+        with self.assertNumQueries(1):
+            cards = metricas_dashboard()
+
+        hoje = timezone.localdate()
+        receita = PedidoProduto.objects.aggregate(t=Sum(F('quantidade') * F('preco_unitario')))['t']
+        self.assertEqual(cards, {
+            'receita_total': receita.quantize(Decimal('0.01')),
+            'pedidos_hoje': Pedido.objects.filter(data_efetuado__date=hoje).count(),
+            'usuarios_ativos': Usuario.objects.filter(ativo=True).count(),
+            'produtos_cadastrados': Produto.objects.count(),
+        })
+        self.assertEqual((cards['pedidos_hoje'], cards['usuarios_ativos']), (2, 1))
+
+        recentes = {p.id: p.total_valor for p in ultimos_pedidos()}
+        self.assertEqual(recentes[sem_itens.id], Decimal('0.00'))
+        for pedido in Pedido.objects.exclude(id=sem_itens.id):
+            self.assertEqual(recentes[pedido.id], sum(item.subtotal() for item in pedido.itens.all()))
+
+        # banco vazio (inclusive sem produtos, a tabela base da consulta): zeros, não None
+        Pedido.objects.all().delete()
+        VendaDiaria.objects.all().delete()
+        Produto.objects.all().delete()
+        Usuario.objects.all().delete()
+        self.assertEqual(metricas_dashboard(), {
+            'receita_total': Decimal('0.00'), 'pedidos_hoje': 0, 'usuarios_ativos': 0, 'produtos_cadastrados': 0,
+        })
+
+
+@override_settings(TAREFAS_SINCRONAS=False)
+class VendasDiariasTests(TestCase):
+    """vendas.py: o consolidado incremental (pela fila) bate com a reconstrução completa."""
+
+    def _consolidado(self):
+        return sorted(VendaDiaria.objects.values_list(
+            'data', 'produto_id', 'vendedor_id', 'loja_id', 'quantidade', 'faturamento', 'pedidos',
+        ))
+
+    def test_incremental_igual_a_reconstrucao(self):
+        loja = Loja.objects.create(nome='Loja')
+        vendedor = Usuario.objects.create(nome='V', email='v@x.com', senha='x', loja=loja)
+        comprador = Usuario.objects.create(nome='C', email='c@x.com', senha='x')
+        categoria = Categoria.objects.create(nome='Casa')
+        a, b, c = [
+            Produto.objects.create(nome=n, valor=valor, desconto=desconto, q_estoque=50, categoria=categoria,
+                                   vendedor=vendedor, loja=loja)
+            for n, valor, desconto in [('A', Decimal('19.99'), Decimal('15')), ('B', Decimal('5'), None),
+                                       ('C', Decimal('100'), Decimal('10'))]
+        ]
+        ontem = fechar_pedido(comprador, [(a.id, 2), (b.id, 1)])
+        Pedido.objects.filter(id=ontem.id).update(data_efetuado=F('data_efetuado') - timedelta(days=1))
+        fechar_pedido(comprador, [(a.id, 1), (c.id, 3)])
+        fechar_pedido(comprador, [(a.id, 4), (b.id, 2), (c.id, 1)])
+
+        tarefas.processar()
+        incremental = self._consolidado()
+        self.assertEqual(len(incremental), 5)
+
+        reconstruir_vendas_diarias()
+        self.assertEqual(self._consolidado(), incremental)
+
+        # só a partir de hoje: o dia anterior fica como estava
+        reconstruir_vendas_diarias(desde=timezone.localdate())
+        self.assertEqual(self._consolidado(), incremental)
+
+
+@override_settings(TAREFAS_SINCRONAS=False)
+class WebhookStripeTests(TestCase):
+    """pagamentos.py: um pedido por sessão, venha ele do webhook (repetido ou não) ou da conciliação."""
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create(nome='C', email='c@x.com', senha='x')
+        self.produto = Produto.objects.create(
+            nome='P', valor=Decimal('10'), q_estoque=5, categoria=Categoria.objects.create(nome='Casa'),
+        )
+        CarrinhoProduto.objects.create(
+            carrinho=Carrinho.objects.create(usuario=self.usuario), produto=self.produto, quantidade=2,
+        )
+        lote, _ = reservar_itens(self.usuario, [(self.produto.id, 2)])
+        self.sessao = {
+            'id': 'cs_teste', 'status': 'complete', 'payment_status': 'paid', 'amount_total': 2000,
+            'metadata': {'usuario_id': str(self.usuario.id), 'reserva_lote': lote},
+        }
+
+    def _evento(self, id_evento):
+        return {'id': id_evento, 'type': 'checkout.session.completed', 'data': {'object': self.sessao}}
+
+    def _conferir_um_pedido(self):
+        pedido = Pedido.objects.get()
+        self.assertEqual((pedido.stripe_session_id, pedido.valor_pago), ('cs_teste', Decimal('20')))
+        self.assertEqual(list(pedido.itens.values_list('quantidade', flat=True)), [2])
+        self.produto.refresh_from_db()
+        self.assertEqual((self.produto.q_estoque, self.produto.q_reservado), (3, 0))
+        self.assertFalse(CarrinhoProduto.objects.exists())
+
+    def test_evento_repetido(self):
+        self.assertTrue(processar_evento(self._evento('evt_1')))
+        self.assertFalse(processar_evento(self._evento('evt_1')))
+        # outro evento da mesma sessão (ex: async_payment_succeeded) também não duplica
+        self.assertTrue(processar_evento(self._evento('evt_2')))
+        self._conferir_um_pedido()
+
+    @override_settings(STRIPE_LIVE_MODE=True, STRIPE_LIVE_SECRET_KEY='sk_live_teste')
+    def test_webhook_depois_da_conciliacao(self):
+        with mock.patch('stripe.checkout.Session.retrieve', return_value=self.sessao) as buscar:
+            conciliar_sessao('cs_teste')
+        buscar.assert_called_once_with('cs_teste', api_key='sk_live_teste')
+        self.assertTrue(processar_evento(self._evento('evt_1')))
+        self._conferir_um_pedido()
+
+        # e a conciliação depois do webhook também não cria outro
+        with mock.patch('stripe.checkout.Session.retrieve', return_value=self.sessao):
+            conciliar_sessao('cs_teste')
+        self.assertEqual(Pedido.objects.count(), 1)
+
+
+@override_settings(CONSULTAS_INSTRUMENTAR=False)
+class MidiaTests(TestCase):
+    """Nome pelo conteúdo e entrega dos uploads (midia.py)."""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        configuracao = override_settings(MEDIA_ROOT=self.media)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        self.categoria = Categoria.objects.create(nome='Casa')
+
+    def _produto(self):
+        saida = io.BytesIO()
+        Image.new('RGB', (400, 200), (10, 120, 200)).save(saida, 'JPEG')
+        self.conteudo = saida.getvalue()
+        return Produto.objects.create(
+            nome='P', valor=Decimal('10'), q_estoque=1, categoria=self.categoria,
+            imagem=SimpleUploadedFile('Minha Foto.JPG', self.conteudo, content_type='image/jpeg'),
+        )
+
+    def test_nome_pelo_conteudo_e_cache(self):
+        produto = self._produto()
+        self.assertEqual(produto.imagem.name, f"produtos/{hashlib.sha256(self.conteudo).hexdigest()[:16]}.jpg")
+
+        url = produto.imagem.url
+        resposta = self.client.get(url)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(b''.join(resposta.streaming_content), self.conteudo)
+        self.assertEqual(resposta['Cache-Control'], CACHE_IMUTAVEL)
+        self.assertEqual(resposta['Content-Type'], 'image/jpeg')
+
+        repetida = self.client.get(url, headers={'If-None-Match': resposta['ETag']})
+        self.assertEqual(repetida.status_code, 304)
+        self.assertEqual(repetida['Cache-Control'], CACHE_IMUTAVEL)
+
+        parte = self.client.get(url, headers={'Range': 'bytes=0-9'})
+        self.assertEqual(parte.status_code, 206)
+        self.assertEqual(parte.content, self.conteudo[:10])
+        self.assertEqual(parte['Content-Range'], f'bytes 0-9/{len(self.conteudo)}')
+        fora = self.client.get(url, headers={'Range': f'bytes={len(self.conteudo)}-'})
+        self.assertEqual(fora.status_code, 416)
+
+        # miniaturas herdam o nome com hash
+        gerar_miniaturas(produto)
+        miniatura = self.client.get(produto.imagem.storage.url(nome_miniatura(produto.imagem.name, 160, 'webp')))
+        self.assertEqual(miniatura['Cache-Control'], CACHE_IMUTAVEL)
+        self.assertEqual(miniatura['Content-Type'], 'image/webp')
+
+    def test_nome_antigo_e_caminho_invalido(self):
+        produto = self._produto()
+        produto.imagem.storage.save('produtos/foto-antiga.jpg', SimpleUploadedFile('x', self.conteudo))
+        self.assertEqual(self.client.get('/media/produtos/foto-antiga.jpg')['Cache-Control'], CACHE_CURTO)
+        self.assertEqual(self.client.get('/media/../settings.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/produtos/').status_code, 404)
+        self.assertEqual(self.client.post(produto.imagem.url).status_code, 405)
+
+    @override_settings(STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    })
+    def test_storage_fora_do_disco(self):
+        # outro backend (como seria o S3): nada depende de caminho local
+        produto = self._produto()
+        self.assertEqual(gerar_miniaturas(produto), [160, 320, 400])
+        self.assertEqual(self.client.get(produto.imagem.url).status_code, 200)
+        self.assertFalse(os.listdir(self.media))
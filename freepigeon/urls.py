@@ -46,6 +46,7 @@ urlpatterns = [
     # produtos e categorias
     path('produto/<int:produto_id>/', views.produto_view, name='produto'),
     path('categoria/<int:categoria_id>/', views.categoria_view, name='categoria'),
+    path('api/produtos/', views.api_produtos, name='api_produtos'),
     path('buscar/', views.buscar_produtos, name='buscar'),
 
     # carrinho
@@ -1,10 +1,126 @@
 # freepigeon/utils_frete.py
-import requests
-from decimal import Decimal
+import asyncio
+import time
+import weakref
+import httpx
+from asgiref.sync import sync_to_async
+from decimal import Decimal, ROUND_CEILING
 import xml.etree.ElementTree as ET
 
+from django.conf import settings
+from django.core.cache import cache
 
-def calcular_frete_correios(
+from .cache import gravar, ler, liberar
+
+
+# IMPORTANTE: usar HTTPS
+CORREIOS_URL_PADRAO = "https://ws.correios.com.br/calculador/CalcPrecoPrazo.asmx/CalcPrecoPrazo"
+
+# Códigos sem contrato: 04510 = PAC, 04014 = SEDEX
+SERVICOS = {
+    "04510": "PAC",
+    "04014": "SEDEX",
+}
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+# Cliente HTTP assíncrono (views ASGI). Um por event loop, porque as
+# conexões do pool ficam presas ao loop em que foram abertas.
+_clientes_async = weakref.WeakKeyDictionary()
+
+
+def _cliente_async():
+    loop = asyncio.get_running_loop()
+    cliente = _clientes_async.get(loop)
+    if cliente is None:
+        cliente = httpx.AsyncClient(limits=httpx.Limits(max_connections=16, max_keepalive_connections=8))
+        _clientes_async[loop] = cliente
+    return cliente
+
+
+def _montar_params(codigo_servico, cep_origem, cep_destino, peso_kg, comprimento, altura, largura, diametro):
+    # Correios querem peso em kg, com ponto decimal
+    peso_str = str(peso_kg).replace(",", ".")
+    return {
+        "nCdEmpresa": "",
+        "sDsSenha": "",
+        "nCdServico": codigo_servico,
+        "sCepOrigem": cep_origem,
+        "sCepDestino": cep_destino,
+        "nVlPeso": peso_str,
+        "nCdFormato": 1,                # caixa/pacote
+        "nVlComprimento": comprimento,
+        "nVlAltura": altura,
+        "nVlLargura": largura,
+        "nVlDiametro": diametro,
+        "sCdMaoPropria": "N",
+        "nVlValorDeclarado": "0",
+        "sCdAvisoRecebimento": "N",
+        "StrRetorno": "xml",
+    }
+
+
+async def _aconsultar_servico(url, params, nome_servico, timeout):
+    """
+    Consulta um serviço (PAC ou SEDEX) e devolve a opção de frete,
+    ou None se der qualquer problema na requisição ou parse.
+    """
+    try:
+        resp = await _cliente_async().get(url, params=params, timeout=timeout)
+    except httpx.HTTPError as e:
+        print(f"[CORREIOS] Erro de requisição para {nome_servico}: {e}")
+        return None
+
+    return _ler_resposta(nome_servico, resp.status_code, resp.text)
+
+
+def _ler_resposta(nome_servico, status_code, texto):
+    """Interpreta o XML de resposta dos Correios (None se não der para usar)."""
+    if status_code != 200:
+        print(f"[CORREIOS] Status HTTP {status_code} para {nome_servico}")
+        return None
+
+    try:
+        root = ET.fromstring(texto)
+    except ET.ParseError as e:
+        print(f"[CORREIOS] Erro ao parsear XML ({nome_servico}): {e}")
+        return None
+
+    servico = root.find(".//cServico")
+    if servico is None:
+        print(f"[CORREIOS] XML sem cServico para {nome_servico}")
+        return None
+
+    erro = (servico.findtext("Erro") or "").strip()
+    if erro != "0":
+        msg_erro = servico.findtext("MsgErro") or ""
+        print(f"[CORREIOS] Erro {erro} em {nome_servico}: {msg_erro}")
+        return None
+
+    valor_str = (servico.findtext("Valor") or "0")
+    prazo_str = (servico.findtext("PrazoEntrega") or "0")
+
+    # Corrige formato R$ "25,90" -> "25.90"
+    valor_str = valor_str.replace(".", "").replace(",", ".")
+    try:
+        valor = float(valor_str)
+        prazo = int(prazo_str)
+    except ValueError:
+        print(f"[CORREIOS] Erro ao converter valor/prazo para {nome_servico}: {valor_str} / {prazo_str}")
+        return None
+
+    return {
+        "codigo": nome_servico,
+        "nome": f"{nome_servico} - Correios",
+        "valor": valor,
+        "prazo_dias": prazo,
+    }
+
+
+async def acalcular_frete_correios(
     cep_origem: str,
     cep_destino: str,
     peso_kg: Decimal,
@@ -15,89 +131,186 @@ def calcular_frete_correios(
 ):
     """
     Usa o webservice oficial dos Correios (CalcPrecoPrazo) sem contrato.
-    Retorna lista de opções de frete (PAC / SEDEX).
+    Retorna lista de opções de frete (PAC / SEDEX), consultadas ao mesmo
+    tempo (asyncio.gather).
 
-    Se der qualquer problema na requisição ou parse, retorna [].
+    Se der qualquer problema na requisição ou parse, o serviço fica de fora
+    (e se todos falharem, retorna []).
     """
+    url = _config("CORREIOS_URL", CORREIOS_URL_PADRAO)
+    timeout = _config("CORREIOS_TIMEOUT", 5)
 
-    # IMPORTANTE: usar HTTPS
-    url = "https://ws.correios.com.br/calculador/CalcPrecoPrazo.asmx/CalcPrecoPrazo"
+    consultas = [
+        _aconsultar_servico(
+            url,
+            _montar_params(
+                codigo_servico, cep_origem, cep_destino, peso_kg,
+                comprimento, altura, largura, diametro,
+            ),
+            nome_servico,
+            timeout,
+        )
+        for codigo_servico, nome_servico in SERVICOS.items()
+    ]
+    return [opcao for opcao in await asyncio.gather(*consultas) if opcao]
 
-    # Correios querem peso em kg, com ponto decimal
-    peso_str = str(peso_kg).replace(",", ".")
 
-    # Códigos sem contrato: 04510 = PAC, 04014 = SEDEX
-    servicos = {
-        "04510": "PAC",
-        "04014": "SEDEX",
-    }
+def frete_simulado(peso_total: Decimal, cep_destino: str):
+    """
+    Fallback para TCC: se os Correios falharem, gera valores plausíveis.
+    """
+    peso_float = float(peso_total or Decimal('0.3'))
+
+    base_pac = 15.0 + (peso_float * 5)      # ex: 0.3kg -> ~16.5
+    base_sedex = base_pac + 10.0           # sedex um pouco mais caro
+
+    return [
+        {
+            "codigo": "PAC",
+            "nome": "PAC - (simulado)",
+            "valor": round(base_pac, 2),
+            "prazo_dias": 8,
+        },
+        {
+            "codigo": "SEDEX",
+            "nome": "SEDEX - (simulado)",
+            "valor": round(base_sedex, 2),
+            "prazo_dias": 3,
+        },
+    ]
+
+
+# ============================================================
+# COTAÇÃO COM CACHE + CIRCUIT BREAKER
+# ============================================================
+
+_CHAVE_FALHAS = "frete:correios:falhas"
+_CHAVE_ABERTO = "frete:correios:circuito_aberto"
+
+
+def faixa_de_peso(peso_kg, passo=Decimal("0.5")):
+    """
+    Arredonda o peso PARA CIMA na faixa (0.5kg por padrão).
+    A cotação é feita com o peso da faixa, então o valor em cache vale
+    para qualquer pedido que caia nela.
+    """
+    peso = Decimal(str(peso_kg or "0.3"))
+    faixas = (peso / passo).to_integral_value(rounding=ROUND_CEILING)
+    return max(faixas, 1) * passo
+
+
+def circuito_aberto():
+    """True se os Correios falharam demais recentemente (vai direto ao simulado)."""
+    return bool(cache.get(_CHAVE_ABERTO))
+
+
+def _registrar_falha():
+    janela = _config("FRETE_CIRCUITO_JANELA", 60)
+    limite = _config("FRETE_CIRCUITO_FALHAS", 3)
+
+    cache.add(_CHAVE_FALHAS, 0, janela)
+    try:
+        falhas = cache.incr(_CHAVE_FALHAS)
+    except ValueError:
+        # chave expirou entre o add e o incr
+        cache.set(_CHAVE_FALHAS, 1, janela)
+        falhas = 1
+
+    if falhas >= limite:
+        print(f"[FRETE] {falhas} falhas seguidas nos Correios: circuito aberto.")
+        cache.set(_CHAVE_ABERTO, True, _config("FRETE_CIRCUITO_ESPERA", 120))
+        cache.delete(_CHAVE_FALHAS)
+
+
+def _registrar_sucesso():
+    cache.delete(_CHAVE_FALHAS)
+
+
+def _preparar_cotacao(cep_origem, cep_destino, peso_kg, dimensoes):
+    """
+    Retorna (leitura, peso_faixa, opcoes). Se 'opcoes' não for None, a cotação
+    já está resolvida (cache ou circuito aberto) e não precisa ir aos Correios.
+
+    Cache por (CEP origem, prefixo do CEP destino, faixa de peso, dimensões):
+    o prefixo de 5 dígitos (setor/subsetor) já define a praça de entrega.
+    Quando a cotação vence, só um processo consulta os Correios (ver cache.ler).
+    """
+    peso_faixa = faixa_de_peso(peso_kg)
+    leitura = ler("frete", (cep_origem, cep_destino[:5], peso_faixa, *dimensoes))
+
+    if not leitura.recalcular:
+        return leitura, peso_faixa, leitura.valor
+
+    if circuito_aberto():
+        liberar(leitura)
+        # cotação vencida ainda é melhor que a simulada
+        opcoes = leitura.valor if leitura.encontrado else frete_simulado(peso_kg, cep_destino)
+        return leitura, peso_faixa, opcoes
+
+    return leitura, peso_faixa, None
+
+
+def _concluir_cotacao(leitura, opcoes, peso_kg, cep_destino, custo=0.0):
+    """Guarda a resposta dos Correios no cache ou registra a falha e usa a antiga/simulada."""
+    if not opcoes:
+        _registrar_falha()
+        liberar(leitura)
+        if leitura.encontrado:
+            print('[FRETE] Correios falharam: usando a cotação anterior.')
+            return leitura.valor
+        print('[FRETE] Usando valores simulados de frete.')
+        return frete_simulado(peso_kg, cep_destino)
+
+    _registrar_sucesso()
+    gravar(leitura, opcoes, _config("FRETE_CACHE_TTL", 60 * 60 * 6), custo)
+    return opcoes
+
+
+async def acotar_frete(
+    cep_origem: str,
+    cep_destino: str,
+    peso_kg: Decimal,
+    comprimento: int = 20,
+    altura: int = 5,
+    largura: int = 15,
+    diametro: int = 0,
+):
+    """
+    Cotação usada pelas views (ASGI: a espera pelos Correios não ocupa thread):
+      1. cache por (CEP origem, prefixo do CEP destino, faixa de peso, dimensões),
+         compartilhado entre os workers;
+      2. se o circuito estiver aberto, vai direto ao frete simulado;
+      3. senão consulta os Correios (PAC e SEDEX ao mesmo tempo) e guarda no cache.
+    Sempre retorna uma lista de opções.
+
+    O cache é acessado via sync_to_async porque o backend configurado pode
+    ser síncrono (ex: banco).
+    """
+    dimensoes = (comprimento, altura, largura, diametro)
+    # thread_sensitive=False: cache.ler pode esperar (time.sleep, até
+    # ESPERA_MAX) por outro processo que está cotando; na thread única das
+    # chamadas síncronas isso pararia o ORM de todas as requisições do worker.
+    leitura, peso_faixa, opcoes = await sync_to_async(_preparar_cotacao, thread_sensitive=False)(
+        cep_origem, cep_destino, peso_kg, dimensoes
+    )
+    if opcoes is not None:
+        return opcoes
+
+    inicio = time.perf_counter()
+    try:
+        opcoes = await acalcular_frete_correios(
+            cep_origem=cep_origem,
+            cep_destino=cep_destino,
+            peso_kg=peso_faixa,
+            comprimento=comprimento,
+            altura=altura,
+            largura=largura,
+            diametro=diametro,
+        )
+    except Exception as e:
+        print('[FRETE] Exceção chamando Correios:', e)
+        opcoes = []
 
-    resultados = []
-
-    for codigo_servico, nome_servico in servicos.items():
-        params = {
-            "nCdEmpresa": "",
-            "sDsSenha": "",
-            "nCdServico": codigo_servico,
-            "sCepOrigem": cep_origem,
-            "sCepDestino": cep_destino,
-            "nVlPeso": peso_str,
-            "nCdFormato": 1,                # caixa/pacote
-            "nVlComprimento": comprimento,
-            "nVlAltura": altura,
-            "nVlLargura": largura,
-            "nVlDiametro": diametro,
-            "sCdMaoPropria": "N",
-            "nVlValorDeclarado": "0",
-            "sCdAvisoRecebimento": "N",
-            "StrRetorno": "xml",
-        }
-
-        try:
-            resp = requests.get(url, params=params, timeout=10)
-        except requests.RequestException as e:
-            # problema de rede/DNS/SSL
-            print(f"[CORREIOS] Erro de requisição para {nome_servico}: {e}")
-            continue
-
-        if resp.status_code != 200:
-            print(f"[CORREIOS] Status HTTP {resp.status_code} para {nome_servico}")
-            continue
-
-        try:
-            root = ET.fromstring(resp.text)
-        except ET.ParseError as e:
-            print(f"[CORREIOS] Erro ao parsear XML ({nome_servico}): {e}")
-            continue
-
-        servico = root.find(".//cServico")
-        if servico is None:
-            print(f"[CORREIOS] XML sem cServico para {nome_servico}")
-            continue
-
-        erro = (servico.findtext("Erro") or "").strip()
-        if erro != "0":
-            msg_erro = servico.findtext("MsgErro") or ""
-            print(f"[CORREIOS] Erro {erro} em {nome_servico}: {msg_erro}")
-            continue
-
-        valor_str = (servico.findtext("Valor") or "0")
-        prazo_str = (servico.findtext("PrazoEntrega") or "0")
-
-        # Corrige formato R$ "25,90" -> "25.90"
-        valor_str = valor_str.replace(".", "").replace(",", ".")
-        try:
-            valor = float(valor_str)
-            prazo = int(prazo_str)
-        except ValueError:
-            print(f"[CORREIOS] Erro ao converter valor/prazo para {nome_servico}: {valor_str} / {prazo_str}")
-            continue
-
-        resultados.append({
-            "codigo": nome_servico,
-            "nome": f"{nome_servico} - Correios",
-            "valor": valor,
-            "prazo_dias": prazo,
-        })
-
-    return resultados
+    return await sync_to_async(_concluir_cotacao)(
+        leitura, opcoes, peso_kg, cep_destino, time.perf_counter() - inicio
+    )
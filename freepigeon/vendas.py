@@ -0,0 +1,304 @@
+# freepigeon/vendas.py
+"""
+Consolidado diário de vendas (tabela VendaDiaria).
+
+- registrar_pedido(pedido): soma os itens de um pedido recém-pago no
+  consolidado do dia (incremental, número fixo de queries por pedido).
+  Roda no worker (tarefa consolidar_pedido, ver tarefas.py), não no webhook.
+- reconstruir_vendas_diarias(desde=None): recalcula tudo (ou a partir de
+  uma data) direto de PedidoProduto. Usado pelo comando de mesmo nome.
+
+Cada pedido entra no consolidado uma vez só: quem o soma (a tarefa ou o
+recálculo) marca Pedido.consolidado na mesma transação. A tarefa marca com
+um UPDATE condicional e desiste se o pedido já estava marcado; o recálculo
+marca os pedidos antes de ler os itens, o que espera as tarefas que estão
+rodando (a trava da linha do pedido) e só conta os pedidos que marcou.
+- resumo_vendedor / serie_vendedor / ultimos_pedidos_vendedor: números da
+  tela "Resumo das vendas", cada um numa única consulta.
+
+Os relatórios (dashboard, detalhe do produto, resumo do vendedor) leem
+daqui, então o custo cresce com o número de dias, não de itens vendidos.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, Q, Sum, When
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .metricas import agregado, sem_agrupar, soma_dinheiro
+from .models import Pedido, PedidoProduto, VendaDiaria
+from .tarefas import PRIORIDADE_BAIXA, enfileirar, tarefa
+
+
+VALOR_ITEM = F('quantidade') * F('preco_unitario')
+
+
+def _linhas_por_produto(itens):
+    """Agrupa itens de pedido por produto (com vendedor/loja atuais do produto)."""
+    return (
+        itens
+        .order_by()
+        .values('produto_id', 'produto__vendedor_id', 'produto__loja_id')
+        .annotate(
+            qtd=Sum('quantidade'),
+            valor=Sum(VALOR_ITEM),
+            n_pedidos=Count('pedido', distinct=True),
+        )
+    )
+
+
+# campo de VendaDiaria -> chave da linha agrupada (_linhas_por_produto)
+CAMPOS_SOMADOS = {
+    'quantidade': 'qtd',
+    'faturamento': 'valor',
+    'pedidos': 'n_pedidos',
+}
+
+
+def _incremento(linha):
+    return {campo: F(campo) + linha[chave] for campo, chave in CAMPOS_SOMADOS.items()}
+
+
+def _nova_linha(dia, linha):
+    return VendaDiaria(
+        data=dia,
+        produto_id=linha['produto_id'],
+        vendedor_id=linha['produto__vendedor_id'],
+        loja_id=linha['produto__loja_id'],
+        quantidade=linha['qtd'],
+        faturamento=linha['valor'],
+        pedidos=linha['n_pedidos'],
+    )
+
+
+def _somar_existentes(dia, linhas):
+    """Um único UPDATE (CASE por produto) para as linhas que já existem no dia."""
+    atualizacao = {
+        campo: Case(
+            *[When(produto_id=linha['produto_id'], then=F(campo) + linha[chave]) for linha in linhas],
+            default=F(campo),
+            output_field=VendaDiaria._meta.get_field(campo),
+        )
+        for campo, chave in CAMPOS_SOMADOS.items()
+    }
+    produto_ids = [linha['produto_id'] for linha in linhas]
+    VendaDiaria.objects.filter(data=dia, produto_id__in=produto_ids).update(**atualizacao)
+
+
+def _registrar_linha(dia, linha):
+    """Caminho linha a linha, usado quando outro pedido criou a mesma linha junto."""
+    filtro = VendaDiaria.objects.filter(data=dia, produto_id=linha['produto_id'])
+    if filtro.update(**_incremento(linha)):
+        return
+    try:
+        with transaction.atomic():
+            _nova_linha(dia, linha).save(force_insert=True)
+    except IntegrityError:
+        filtro.update(**_incremento(linha))
+
+
+def registrar_pedido(pedido):
+    """
+    Soma os itens do pedido no consolidado do dia em que ele foi feito.
+    Número fixo de queries: agrupa os itens, descobre quais linhas do dia já
+    existem, incrementa todas num UPDATE e cria as que faltam num INSERT.
+    """
+    # já somado (tarefa repetida ou pedido coberto pelo recálculo): nada a fazer
+    if not Pedido.objects.filter(id=pedido.id, consolidado=False).update(consolidado=True):
+        return
+
+    dia = timezone.localdate(pedido.data_efetuado)
+
+    linhas = list(_linhas_por_produto(PedidoProduto.objects.filter(pedido=pedido)))
+    if not linhas:
+        return
+
+    existentes = set(
+        VendaDiaria.objects
+        .filter(data=dia, produto_id__in=[linha['produto_id'] for linha in linhas])
+        .values_list('produto_id', flat=True)
+    )
+    atualizar = [linha for linha in linhas if linha['produto_id'] in existentes]
+    criar = [linha for linha in linhas if linha['produto_id'] not in existentes]
+
+    if atualizar:
+        _somar_existentes(dia, atualizar)
+    if criar:
+        try:
+            # savepoint: se outro pedido criou alguma linha ao mesmo tempo, incrementa
+            with transaction.atomic():
+                VendaDiaria.objects.bulk_create([_nova_linha(dia, linha) for linha in criar])
+        except IntegrityError:
+            for linha in criar:
+                _registrar_linha(dia, linha)
+
+
+@tarefa(prioridade=PRIORIDADE_BAIXA)
+def consolidar_pedido(pedido_id):
+    pedido = Pedido.objects.filter(id=pedido_id).first()
+    if pedido:
+        registrar_pedido(pedido)
+
+
+def agendar_consolidacao(pedido):
+    """Põe o pedido na fila do consolidado (na transação de quem criou o pedido)."""
+    enfileirar(consolidar_pedido, pedido_id=pedido.id)
+
+
+def _marcar_consolidados(desde=None):
+    """
+    Marca os pedidos que o recálculo vai contar. O UPDATE espera as
+    consolidações que estão rodando (elas já marcaram o pedido e seguram a
+    linha); as que vierem depois veem o pedido marcado e não somam de novo.
+    """
+    pedidos = Pedido.objects.filter(consolidado=False)
+    if desde:
+        pedidos = pedidos.filter(data_efetuado__date__gte=desde)
+    pedidos.update(consolidado=True)
+
+
+def consolidar(PedidoProdutoModel, VendaDiariaModel, desde=None, lote=2000):
+    """
+    Recria as linhas de VendaDiaria a partir dos itens de pedido (com o
+    vendedor/loja atuais de cada produto, ver VendaDiaria).
+    Retorna quantas linhas foram gravadas.
+    """
+    # só pedidos já marcados: um pedido criado durante o recálculo fica para a tarefa dele
+    itens = PedidoProdutoModel.objects.filter(pedido__consolidado=True)
+    consolidado = VendaDiariaModel.objects.all()
+    if desde:
+        itens = itens.filter(pedido__data_efetuado__date__gte=desde)
+        consolidado = consolidado.filter(data__gte=desde)
+
+    linhas = (
+        itens
+        .annotate(dia=TruncDate('pedido__data_efetuado'))
+        .order_by()
+        .values('dia', 'produto_id', 'produto__vendedor_id', 'produto__loja_id')
+        .annotate(
+            qtd=Sum('quantidade'),
+            valor=Sum(VALOR_ITEM),
+            n_pedidos=Count('pedido', distinct=True),
+        )
+    )
+
+    total = 0
+    with transaction.atomic():
+        consolidado.delete()
+        buffer = []
+        for linha in linhas.iterator(chunk_size=lote):
+            buffer.append(VendaDiariaModel(
+                data=linha['dia'],
+                produto_id=linha['produto_id'],
+                vendedor_id=linha['produto__vendedor_id'],
+                loja_id=linha['produto__loja_id'],
+                quantidade=linha['qtd'],
+                faturamento=linha['valor'],
+                pedidos=linha['n_pedidos'],
+            ))
+            if len(buffer) >= lote:
+                VendaDiariaModel.objects.bulk_create(buffer)
+                total += len(buffer)
+                buffer = []
+        if buffer:
+            VendaDiariaModel.objects.bulk_create(buffer)
+            total += len(buffer)
+    return total
+
+
+def reconstruir_vendas_diarias(desde=None, lote=2000):
+    with transaction.atomic():
+        _marcar_consolidados(desde)
+        return consolidar(PedidoProduto, VendaDiaria, desde=desde, lote=lote)
+
+
+# ============================================================
+# ANALYTICS DO VENDEDOR
+# ============================================================
+
+def filtro_vendedor(usuario, prefixo=''):
+    """
+    Q dos produtos do usuário: vendidos por ele ou pela loja dele.
+    'prefixo' permite usar a partir de outro modelo (ex: 'itens__produto__').
+    """
+    filtro = Q(**{f'{prefixo}vendedor_id': usuario.id})
+    if usuario.loja_id:
+        filtro |= Q(**{f'{prefixo}loja_id': usuario.loja_id})
+    return filtro
+
+
+def resumo_vendedor(usuario):
+    """
+    Totais de vendas do usuário (pedidos, itens vendidos e faturamento)
+    numa única ida ao banco.
+    """
+    consolidado = VendaDiaria.objects.filter(filtro_vendedor(usuario))
+    pedidos = Pedido.objects.filter(
+        id__in=PedidoProduto.objects.filter(filtro_vendedor(usuario, 'produto__')).values('pedido_id')
+    )
+
+    return (
+        sem_agrupar(consolidado)
+        .annotate(
+            total_itens=Coalesce(Sum('quantidade'), 0),
+            faturamento=soma_dinheiro('faturamento'),
+            # um pedido pode ter vários produtos do vendedor: conta pedidos distintos
+            total_pedidos=agregado(pedidos, Count('id')),
+        )
+        .values('total_pedidos', 'total_itens', 'faturamento')
+        .get()
+    )
+
+
+def serie_vendedor(usuario, dias=30, hoje=None):
+    """
+    Vendas por dia nos últimos 'dias' dias (inclusive hoje), para gráficos.
+    Dias sem venda entram zerados. 'percentual' é relativo ao melhor dia.
+    """
+    hoje = hoje or timezone.localdate()
+    inicio = hoje - timedelta(days=dias - 1)
+
+    por_dia = {
+        linha['data']: linha
+        for linha in (
+            VendaDiaria.objects
+            .filter(filtro_vendedor(usuario), data__gte=inicio, data__lte=hoje)
+            .order_by()
+            .values('data')
+            .annotate(qtd=Sum('quantidade'), valor=soma_dinheiro('faturamento'))
+        )
+    }
+
+    serie = []
+    for i in range(dias):
+        dia = inicio + timedelta(days=i)
+        linha = por_dia.get(dia, {})
+        serie.append({
+            'data': dia,
+            'quantidade': linha.get('qtd') or 0,
+            'faturamento': linha.get('valor', Decimal('0.00')),
+        })
+
+    maior = max((ponto['faturamento'] for ponto in serie), default=0)
+    for ponto in serie:
+        ponto['percentual'] = int(ponto['faturamento'] * 100 / maior) if maior else 0
+    return serie
+
+
+def ultimos_pedidos_vendedor(usuario, limite=5):
+    """
+    Últimos pedidos com produtos do usuário, com quantidade (qtd_itens) e
+    total (total_valor) só dos itens dele.
+    """
+    return list(
+        Pedido.objects
+        # filter antes do annotate: as somas usam o mesmo JOIN filtrado
+        .filter(filtro_vendedor(usuario, 'itens__produto__'))
+        .annotate(
+            qtd_itens=Sum('itens__quantidade'),
+            total_valor=Sum(F('itens__quantidade') * F('itens__preco_unitario')),
+        )
+        .order_by('-data_efetuado', '-id')[:limite]
+    )
@@ -4,7 +4,18 @@
 import stripe
 import re
 from functools import wraps
-from .utils_frete import calcular_frete_correios
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from .utils_frete import acotar_frete
+from . import busca, facetas, imagens
+from .carrinho import aresumo_carrinho, resumo_carrinho
+from .catalogo import planos_ativos, plano_padrao, ttl_catalogo, versao_catalogo
+from .paginacao import paginar
+from .metricas import metricas_dashboard, ultimos_pedidos
+from .pagamentos import agendar_conciliacao, chave_secreta, ler_evento, processar_evento
+from .pedidos import EstoqueInsuficiente
+from .reservas import liberar_lote, reservar_itens
+from .sessao import invalidar_usuarios
+from .vendas import resumo_vendedor, serie_vendedor, ultimos_pedidos_vendedor
 from decimal import Decimal
 from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
@@ -29,23 +40,49 @@ from .models import (
     Usuario, Loja, Categoria, Produto,
     Carrinho, CarrinhoProduto,
     Pedido, PedidoProduto,
-    Endereco, Plano, AdminUser
+    Endereco, Plano, AdminUser, VendaDiaria
 )
 
 def usuario_login_required(view_func):
     """
-    Verifica se existe 'usuario_id' na sessão.
+    Verifica se há usuário logado (request.usuario, ver sessao.py).
     Se não tiver, manda pra tela de login, com ?next=<url>.
+    Funciona tanto em views normais quanto em views async.
     """
+    def _redirect_login(request):
+        login_url = reverse('login')
+        next_param = request.path
+        return redirect(f"{login_url}?next={next_param}")
+
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def _wrapped_async(request, *args, **kwargs):
+            if not await request.ausuario():
+                return _redirect_login(request)
+            return await view_func(request, *args, **kwargs)
+        return _wrapped_async
+
     @wraps(view_func)
     def _wrapped(request, *args, **kwargs):
-        if not request.session.get('usuario_id'):
-            login_url = reverse('login')
-            next_param = request.path
-            return redirect(f"{login_url}?next={next_param}")
+        if not request.usuario:
+            return _redirect_login(request)
         return view_func(request, *args, **kwargs)
     return _wrapped
 
+
+# ============================================================
+# STRIPE (views async)
+# ============================================================
+# O SDK do Stripe (4.x) só tem cliente síncrono. Nas views async as chamadas
+# rodam num thread à parte (thread_sensitive=False), sem travar o event loop
+# nem a thread das queries enquanto esperam a resposta do Stripe.
+async def stripe_criar_sessao(**kwargs):
+    return await sync_to_async(stripe.checkout.Session.create, thread_sensitive=False)(**kwargs)
+
+
+async def stripe_buscar_sessao(session_id):
+    return await sync_to_async(stripe.checkout.Session.retrieve, thread_sensitive=False)(session_id)
+
 # ============================================================
 # PLANOS
 # ============================================================
@@ -54,18 +91,15 @@ def get_default_plan():
     Retorna o plano default (marcado como is_default=True).
     Se não tiver, pega o mais barato ativo.
     Se não tiver nada, retorna None.
+    (em cache, ver catalogo.plano_padrao)
     """
-    plano = Plano.objects.filter(ativo=True, is_default=True).order_by('preco_mensal').first()
-    if plano:
-        return plano
-    return Plano.objects.filter(ativo=True).order_by('preco_mensal').first()
+    return plano_padrao()
 
 @usuario_login_required
 def planos(request):
-    usuario_id = request.session.get('usuario_id')
-    usuario = get_object_or_404(Usuario, id=usuario_id)
+    usuario = request.usuario
 
-    planos = Plano.objects.filter(ativo=True).order_by('preco_mensal')
+    planos = planos_ativos()
 
     # escolhe a public key do Stripe como você já faz
     if settings.STRIPE_LIVE_MODE:
@@ -123,8 +157,7 @@ def criar_checkout_plano(usuario, plano, origem='upgrade'):
 @require_POST
 def create_plan_checkout_session(request):
     """Cria uma Checkout Session para upgrade de plano (página /planos)."""
-    usuario_id = request.session.get('usuario_id')
-    usuario = get_object_or_404(Usuario, id=usuario_id)
+    usuario = request.usuario
 
     plano_slug = request.POST.get('plano_slug')
     plano = get_object_or_404(Plano, slug=plano_slug)
@@ -169,7 +202,7 @@ def create_plan_checkout_session(request):
     return JsonResponse({'sessionId': checkout_session.id})
 
 
-def plan_success(request):
+async def plan_success(request):
     """Confirma pagamento do plano e ativa no usuário, garantindo login."""
     session_id = request.GET.get('session_id')
 
@@ -177,7 +210,7 @@ def plan_success(request):
         return redirect('planos')
 
     try:
-        session = stripe.checkout.Session.retrieve(session_id)
+        session = await stripe_buscar_sessao(session_id)
 
         if session.payment_status == 'paid':
             # Pega infos da sessão do Stripe
@@ -190,16 +223,16 @@ def plan_success(request):
                 messages.error(request, 'Não foi possível identificar o plano ou usuário.')
                 return redirect('planos')
 
-            plano = Plano.objects.get(slug=plano_slug)
-            usuario = Usuario.objects.get(id=usuario_id_meta)
+            plano = await Plano.objects.aget(slug=plano_slug)
+            usuario = await Usuario.objects.aget(id=usuario_id_meta)
 
             # Atualiza plano do usuário
             usuario.plano = plano
-            usuario.save()
+            await usuario.asave()
 
             # 🔑 Garante que o usuário esteja logado na sua sessão manual
-            request.session['usuario_id'] = usuario.id
-            request.session['usuario_nome'] = usuario.nome
+            await request.session.aset('usuario_id', usuario.id)
+            await request.session.aset('usuario_nome', usuario.nome)
 
             messages.success(request, f'Seu plano {plano.nome} foi ativado com sucesso!')
 
@@ -245,13 +278,12 @@ def cadastrar_usuario(request):
 
         # Segurança: se não veio plano, usa o default
         if not plano_escolhido:
-            plano_escolhido = Plano.objects.filter(is_default=True).first()
+            plano_escolhido = get_default_plan()
 
         # (opcional) se ainda não tiver plano, evita quebrar
         if not plano_escolhido:
             messages.error(request, 'Nenhum plano disponível no momento. Tente novamente mais tarde.')
-            planos = Plano.objects.filter(ativo=True)
-            return render(request, "cadastro.html", {"planos": planos})
+            return render(request, "cadastro.html", {"planos": planos_ativos()})
 
         # 🔐 gera hash da senha (pra login_view com check_password funcionar)
         senha_hash = make_password(senha)
@@ -320,8 +352,7 @@ def cadastrar_usuario(request):
         return redirect('home')
 
     # GET
-    planos = Plano.objects.filter(ativo=True)
-    return render(request, "cadastro.html", { "planos": planos })
+    return render(request, "cadastro.html", { "planos": planos_ativos() })
 
 
 
@@ -411,8 +442,7 @@ def auth_view(request):
 
 @usuario_login_required
 def perfil(request):
-    usuario_id = request.session.get('usuario_id')
-    usuario = get_object_or_404(Usuario, id=usuario_id)
+    usuario = request.usuario
 
     produtos_pessoais = Produto.objects.filter(vendedor=usuario, loja__isnull=True).count()
     produtos_loja = 0
@@ -438,8 +468,7 @@ def perfil(request):
 
 @usuario_login_required
 def editar_perfil(request):
-    usuario_id = request.session.get('usuario_id')
-    usuario = get_object_or_404(Usuario, id=usuario_id)
+    usuario = request.usuario
 
     if request.method == 'POST':
         nome = (request.POST.get('nome') or '').strip()
@@ -465,8 +494,7 @@ def editar_perfil(request):
 
 @usuario_login_required
 def alterar_senha(request):
-    usuario_id = request.session.get('usuario_id')
-    usuario = get_object_or_404(Usuario, id=usuario_id)
+    usuario = request.usuario
 
     if request.method == 'POST':
         senha_atual = request.POST.get('senha_atual') or ''
@@ -497,8 +525,7 @@ def alterar_senha(request):
 
 @usuario_login_required
 def enderecos(request):
-    usuario_id = request.session.get('usuario_id')
-    usuario = get_object_or_404(Usuario, id=usuario_id)
+    usuario = request.usuario
 
     if request.method == 'POST':
         apelido = (request.POST.get('apelido') or '').strip()
@@ -541,8 +568,7 @@ def enderecos(request):
 
 @usuario_login_required
 def editar_endereco(request, endereco_id):
-    usuario_id = request.session.get('usuario_id')
-    usuario = get_object_or_404(Usuario, id=usuario_id)
+    usuario = request.usuario
     endereco = get_object_or_404(Endereco, id=endereco_id, usuario=usuario)
 
     if request.method == 'POST':
@@ -584,8 +610,7 @@ def editar_endereco(request, endereco_id):
 
 @usuario_login_required
 def excluir_endereco(request, endereco_id):
-    usuario_id = request.session.get('usuario_id')
-    usuario = get_object_or_404(Usuario, id=usuario_id)
+    usuario = request.usuario
     endereco = get_object_or_404(Endereco, id=endereco_id, usuario=usuario)
 
     if request.method == 'POST':
@@ -601,8 +626,7 @@ def excluir_endereco(request, endereco_id):
 
 @usuario_login_required
 def definir_endereco_principal(request, endereco_id):
-    usuario_id = request.session.get('usuario_id')
-    usuario = get_object_or_404(Usuario, id=usuario_id)
+    usuario = request.usuario
     endereco = get_object_or_404(Endereco, id=endereco_id, usuario=usuario)
 
     usuario.enderecos.update(principal=False)
@@ -614,8 +638,7 @@ def definir_endereco_principal(request, endereco_id):
 
 @usuario_login_required
 def vender(request):
-    usuario_id = request.session.get('usuario_id')
-    usuario = get_object_or_404(Usuario, id=usuario_id)
+    usuario = request.usuario
     return render(request, 'vender.html', {
         'usuario': usuario,
         'usuario_nome': usuario.nome,
@@ -637,11 +660,10 @@ def _get_produto_do_usuario(usuario, produto_id):
 
 @usuario_login_required
 def anuncios(request):
-    usuario_id = request.session.get('usuario_id')
-    if not usuario_id:
+    usuario = request.usuario
+    if not usuario:
         return redirect('login')
 
-    usuario = get_object_or_404(Usuario, id=usuario_id)
 
     # produtos do usuário como vendedor
     filtros = Q(vendedor=usuario)
@@ -650,20 +672,22 @@ def anuncios(request):
     if usuario.loja:
         filtros |= Q(loja=usuario.loja)
 
-    produtos = Produto.objects.filter(filtros)
+    produtos_qs = Produto.objects.filter(filtros)
+    pagina = paginar(request, produtos_qs, ordenacao=('-id',))
 
     return render(request, 'anuncios.html', {
         'usuario': usuario,
         'usuario_nome': usuario.nome,
-        'produtos': produtos,
+        'produtos': pagina.itens,
+        'total_anuncios': produtos_qs.count(),
+        'pagina': pagina,
     })
 
 from django.contrib.auth.decorators import login_required
 
 @usuario_login_required
 def editar_anuncio(request, produto_id):
-    usuario_id = request.session.get('usuario_id')
-    usuario = get_object_or_404(Usuario, id=usuario_id)
+    usuario = request.usuario
 
     produto = _get_produto_do_usuario(usuario, produto_id)
     categorias = Categoria.objects.all()
@@ -732,9 +756,11 @@ def editar_anuncio(request, produto_id):
         produto.ativo = ativo_flag
 
         if imagem:
-            produto.imagem = imagem
+            imagens.trocar_imagem(produto, imagem)
 
         produto.save()
+        if imagem:
+            imagens.agendar_miniaturas(produto)
 
         messages.success(request, 'Anúncio atualizado com sucesso!')
         return redirect('anuncios')
@@ -749,8 +775,7 @@ def editar_anuncio(request, produto_id):
 
 @usuario_login_required
 def excluir_anuncio(request, produto_id):
-    usuario_id = request.session.get('usuario_id')
-    usuario = get_object_or_404(Usuario, id=usuario_id)
+    usuario = request.usuario
 
     produto = _get_produto_do_usuario(usuario, produto_id)
 
@@ -772,8 +797,7 @@ def toggle_status_anuncio(request, produto_id):
     if request.method != 'POST':
         return redirect('anuncios')
 
-    usuario_id = request.session.get('usuario_id')
-    usuario = get_object_or_404(Usuario, id=usuario_id)
+    usuario = request.usuario
 
     produto = _get_produto_do_usuario(usuario, produto_id)
 
@@ -790,28 +814,21 @@ def toggle_status_anuncio(request, produto_id):
 
 @usuario_login_required
 def resumo(request):
-    usuario_id = request.session.get('usuario_id')
-    usuario = get_object_or_404(Usuario, id=usuario_id)
+    usuario = request.usuario
 
-    # Exemplo simples de cálculo – ajuste conforme precisar
-    pedidos = Pedido.objects.filter(usuario=usuario)
-    total_pedidos = pedidos.count()
-
-    total_itens = 0
-    faturamento = 0
-    for pedido in pedidos:
-        for item in pedido.itens.all():
-            total_itens += item.quantidade
-        faturamento += pedido.total()
-
-    ultimos_pedidos = pedidos.order_by('-data_efetuado')[:5]
+    # Vendas dos produtos do usuário (como vendedor ou pela loja dele).
+    # Tudo agregado no banco, com número fixo de consultas (ver vendas.py).
+    totais = resumo_vendedor(usuario)
+    serie = serie_vendedor(usuario, dias=30)
+    ultimos_pedidos = ultimos_pedidos_vendedor(usuario, limite=5)
 
     return render(request, 'resumo.html', {
         'usuario': usuario,
         'usuario_nome': usuario.nome,
-        'total_pedidos': total_pedidos,
-        'total_itens_vendidos': total_itens,
-        'faturamento_total': f"{faturamento:.2f}",
+        'total_pedidos': totais['total_pedidos'],
+        'total_itens_vendidos': totais['total_itens'],
+        'faturamento_total': f"{totais['faturamento']:.2f}",
+        'serie_vendas': serie,
         'ultimos_pedidos': ultimos_pedidos,
     })
 
@@ -820,8 +837,7 @@ def resumo(request):
 
 @usuario_login_required
 def criar_loja(request):
-    usuario_id = request.session.get('usuario_id')
-    usuario = get_object_or_404(Usuario, id=usuario_id)
+    usuario = request.usuario
 
     plano_usuario = usuario.plano or get_default_plan()
 
@@ -855,8 +871,7 @@ def criar_loja(request):
 
 @usuario_login_required
 def cadastrar_produto(request):
-    usuario_id = request.session.get('usuario_id')
-    usuario = get_object_or_404(Usuario, id=usuario_id)
+    usuario = request.usuario
     categorias = Categoria.objects.all()
 
     plano_usuario = usuario.plano or get_default_plan()
@@ -902,6 +917,8 @@ def cadastrar_produto(request):
                 loja=usuario.loja if (usuario.loja and vincular_loja) else None,
                 imagem=imagem
             )
+            if imagem:
+                imagens.agendar_miniaturas(produto)
 
             messages.success(request, 'Produto cadastrado com sucesso!')
             return redirect('anuncios')
@@ -920,6 +937,8 @@ def cadastrar_produto(request):
 def home_view(request):
     usuario_nome = request.session.get('usuario_nome')
 
+    # Querysets preguiçosos: só vão ao banco se o fragmento não estiver no
+    # cache (ver catalogo.py e o {% cache %} em home.html)
     categorias = Categoria.objects.all()
 
     # Só produtos ativos na home
@@ -928,10 +947,20 @@ def home_view(request):
     return render(request, 'home.html', {
         'usuario_nome': usuario_nome,
         'categorias': categorias,
-        'produtos': produtos
+        'produtos': produtos,
+        'versao_catalogo': versao_catalogo(),
+        'cache_ttl': ttl_catalogo(),
     })
 
 
+# ?ordem= da listagem de produtos -> ordenação (terminando em campo único, ver paginacao.py)
+ORDENS_PRODUTOS = {
+    'recentes': ('-id',),
+    'menor_preco': ('preco_final', 'id'),
+    'maior_preco': ('-preco_final', '-id'),
+}
+
+
 def categoria_view(request, categoria_id):
     categoria = get_object_or_404(Categoria, id=categoria_id)
 
@@ -940,26 +969,69 @@ def categoria_view(request, categoria_id):
         categoria=categoria,
         ativo=True
     )
+    ordem = request.GET.get('ordem')
+    if ordem not in ORDENS_PRODUTOS:
+        ordem = 'recentes'
+    pagina = paginar(request, produtos, ordenacao=ORDENS_PRODUTOS[ordem])
 
     usuario_nome = request.session.get('usuario_nome')
 
     return render(request, 'categoria.html', {
         'categoria': categoria,
-        'produtos': produtos,
+        'produtos': pagina.itens,
+        'pagina': pagina,
+        'ordem': ordem,
         'usuario_nome': usuario_nome
     })
 
 
 
+def api_produtos(request):
+    """
+    Navegação facetada (JSON): produtos ativos com os filtros de
+    facetas.ler_filtros, ordenados por ?ordem= (ORDENS_PRODUTOS) e paginados
+    por cursor, mais as contagens de cada faceta.
+    """
+    filtros = facetas.ler_filtros(request.GET)
+    ativos = Produto.objects.filter(ativo=True)
+
+    ordem = request.GET.get('ordem')
+    if ordem not in ORDENS_PRODUTOS:
+        ordem = 'recentes'
+    pagina = paginar(request, facetas.filtrar(ativos, filtros), ordenacao=ORDENS_PRODUTOS[ordem])
+
+    produtos = [
+        {
+            'id': produto.id,
+            'nome': produto.nome,
+            'valor': produto.valor,
+            'desconto': produto.desconto,
+            'preco_final': produto.preco_final,
+            'disponivel': produto.disponivel,
+            'categoria_id': produto.categoria_id,
+            'loja_id': produto.loja_id,
+            'imagem': produto.imagem.url if produto.imagem else None,
+            'url': reverse('produto', args=[produto.id]),
+        }
+        for produto in pagina.itens
+    ]
+    return JsonResponse({
+        'produtos': produtos,
+        'proxima': pagina.url_proxima or None,
+        'anterior': pagina.url_anterior or None,
+        'facetas': facetas.facetas(ativos, filtros),
+    })
+
+
 def buscar_produtos(request):
     query = request.GET.get('q', '')
 
+    pagina = None
     if query:
-        # Busca só em produtos ativos
-        produtos = Produto.objects.filter(
-            nome__icontains=query,
-            ativo=True
-        )
+        # Busca só em produtos ativos, ordenada por relevância (ver busca.py)
+        resultados = busca.buscar(Produto.objects.filter(ativo=True), query)
+        pagina = paginar(request, resultados, ordenacao=('-relevancia', '-id'))
+        produtos = pagina.itens
     else:
         produtos = []
 
@@ -968,6 +1040,7 @@ def buscar_produtos(request):
     return render(request, 'buscar.html', {
         'query': query,
         'produtos': produtos,
+        'pagina': pagina,
         'usuario_nome': usuario_nome
     })
 
@@ -988,17 +1061,14 @@ def produto_view(request, produto_id):
 # ============================================================
 
 def ver_carrinho(request):
-    usuario_id = request.session.get('usuario_id')
-    if not usuario_id:
+    usuario = request.usuario
+    if not usuario:
         return redirect('login')
 
-    usuario = get_object_or_404(Usuario, id=usuario_id)
     carrinho, _ = Carrinho.objects.get_or_create(usuario=usuario)
 
-    itens = carrinho.itens.select_related('produto', 'produto__categoria')
-
-    subtotal = sum(item.subtotal() for item in itens) if itens else Decimal('0.00')
-    total_itens = sum(item.quantidade for item in itens) if itens else 0
+    # itens, subtotais e totais numa query só (carrinho.py)
+    itens, total_itens, subtotal = resumo_carrinho(carrinho)
     frete = Decimal('0.00')  # calculado no checkout
     total = subtotal + frete
 
@@ -1013,27 +1083,40 @@ def ver_carrinho(request):
 
 
 def adicionar_ao_carrinho(request, produto_id):
-    usuario_id = request.session.get('usuario_id')
-    if not usuario_id:
+    usuario = request.usuario
+    if not usuario:
         return redirect('login')
 
-    usuario = Usuario.objects.get(id=usuario_id)
     carrinho, _ = Carrinho.objects.get_or_create(usuario=usuario)
     produto = get_object_or_404(Produto, id=produto_id)
-    item, created = CarrinhoProduto.objects.get_or_create(carrinho=carrinho, produto=produto)
-    if not created:
-        item.quantidade += 1
+
+    try:
+        quantidade = max(int(request.POST.get('quantidade') or 1), 1)
+    except ValueError:
+        quantidade = 1
+
+    item, created = CarrinhoProduto.objects.get_or_create(
+        carrinho=carrinho, produto=produto, defaults={'quantidade': 0}
+    )
+
+    # Estoque livre vem pronto do produto (q_estoque - q_reservado)
+    if item.quantidade + quantidade > produto.disponivel:
+        if created:
+            item.delete()
+        messages.error(request, f'Só há {produto.disponivel} unidade(s) disponível(is) de {produto.nome}.')
+        return redirect('produto', produto_id=produto.id)
+
+    item.quantidade += quantidade
     item.save()
 
     return redirect('ver_carrinho')
 
 
 def remover_do_carrinho(request, produto_id):
-    usuario_id = request.session.get('usuario_id')
-    if not usuario_id:
+    usuario = request.usuario
+    if not usuario:
         return redirect('login')
 
-    usuario = Usuario.objects.get(id=usuario_id)
     carrinho = Carrinho.objects.filter(usuario=usuario).first()
     if carrinho:
         CarrinhoProduto.objects.filter(carrinho=carrinho, produto_id=produto_id).delete()
@@ -1045,17 +1128,15 @@ def remover_do_carrinho(request, produto_id):
 # ============================================================
 
 def checkout_view(request):
-    usuario_id = request.session.get('usuario_id')
-    if not usuario_id:
+    usuario = request.usuario
+    if not usuario:
         return redirect('login')
 
-    usuario = Usuario.objects.get(id=usuario_id)
     carrinho = Carrinho.objects.filter(usuario=usuario).first()
     if not carrinho:
         return redirect('ver_carrinho')
 
-    itens = CarrinhoProduto.objects.filter(carrinho=carrinho)
-    total = sum(item.subtotal() for item in itens)
+    itens, _, total = resumo_carrinho(carrinho)
 
     # PEGAR ENDEREÇOS DO USUÁRIO
     enderecos_qs = Endereco.objects.filter(usuario=usuario)
@@ -1087,40 +1168,41 @@ def checkout_view(request):
 # ============================================================
 
 def meus_pedidos(request):
-    usuario_id = request.session.get('usuario_id')
-    if not usuario_id:
+    usuario = request.usuario
+    if not usuario:
         return redirect('login')
 
-    usuario = Usuario.objects.get(id=usuario_id)
-    pedidos = Pedido.objects.filter(usuario=usuario).order_by('-data_efetuado')
 
-    # Calcula o total de cada pedido
-    for pedido in pedidos:
-        for item in pedido.itens.all():  # usa o related_name
-            item.subtotal_valor = item.subtotal()
-        pedido.total_valor = pedido.total()
+    # Totais somados no banco e itens pré-carregados (sem N+1 por pedido)
+    pedidos_qs = (
+        Pedido.objects
+        .filter(usuario=usuario)
+        .select_related('endereco')
+        .com_totais()
+        .com_itens()
+    )
+    pagina = paginar(request, pedidos_qs, ordenacao=('-data_efetuado', '-id'), por_pagina=20)
 
     return render(request, 'meus_pedidos.html', {
-        'pedidos': pedidos,
+        'pedidos': pagina.itens,
+        'pagina': pagina,
         'usuario_nome': usuario.nome
     })
 
 
 # Configurar Stripe
-stripe.api_key = settings.STRIPE_TEST_SECRET_KEY
+stripe.api_key = chave_secreta()
 
 #@login_required  # Comentar por enquanto para testar
 def checkout_page(request):
     """Renderiza a página de checkout"""
-    usuario_id = request.session.get('usuario_id')
+    usuario = request.usuario
     usuario_nome = request.session.get('usuario_nome')
 
-    if usuario_id:
+    if usuario:
         try:
-            usuario = Usuario.objects.get(id=usuario_id)
             carrinho, created = Carrinho.objects.get_or_create(usuario=usuario)
-            itens = carrinho.itens.all()
-            total = carrinho.total()
+            itens, total_itens, total = resumo_carrinho(carrinho)
             endereco = (
                 usuario.enderecos.filter(principal=True).first()
                 or usuario.enderecos.first()
@@ -1128,12 +1210,9 @@ def checkout_page(request):
 
 
             print(f"✓ Usuário: {usuario.nome}")
-            print(f"✓ Itens no carrinho: {itens.count()}")
+            print(f"✓ Itens no carrinho: {total_itens}")
             print(f"✓ Total: R$ {total}")
 
-        except Usuario.DoesNotExist:
-            print("✗ Usuário não encontrado")
-            return redirect('login')
         except Exception as e:
             print(f"✗ Erro: {e}")
             itens = []
@@ -1157,16 +1236,14 @@ def checkout_page(request):
 #@login_required
 
 @require_POST
-def create_checkout_session(request):
+async def create_checkout_session(request):
     """Cria uma Checkout Session no Stripe com suporte a PIX, frete e endereços do usuário."""
     try:
-        usuario_id = request.session.get('usuario_id')
+        usuario = await request.ausuario()
 
-        if not usuario_id:
+        if not usuario:
             return JsonResponse({'error': 'Usuário não autenticado'}, status=401)
 
-        usuario = Usuario.objects.get(id=usuario_id)
-
         # Pegar dados do formulário
         cep = request.POST.get('cep')
         rua = request.POST.get('rua')
@@ -1193,7 +1270,7 @@ def create_checkout_session(request):
 
         if endereco_id:
             # Usuário escolheu um endereço salvo
-            endereco = Endereco.objects.filter(id=endereco_id, usuario=usuario).first()
+            endereco = await Endereco.objects.filter(id=endereco_id, usuario=usuario).afirst()
             if endereco:
                 # Atualiza com o que veio do form, se quiser manter sempre em dia
                 endereco.cep = cep
@@ -1203,10 +1280,11 @@ def create_checkout_session(request):
                 endereco.cidade = cidade
                 endereco.estado = estado
                 endereco.complemento = complemento or None
-                endereco.save()
+                await endereco.asave()
         else:
             # Nenhum endereço escolhido – criar um novo (não necessariamente principal)
-            endereco = Endereco.objects.create(
+            tem_enderecos = await usuario.enderecos.aexists()
+            endereco = await Endereco.objects.acreate(
                 usuario=usuario,
                 apelido=None,
                 cep=cep,
@@ -1216,12 +1294,12 @@ def create_checkout_session(request):
                 cidade=cidade,
                 estado=estado,
                 complemento=complemento or None,
-                principal=False if usuario.enderecos.exists() else True,
+                principal=False if tem_enderecos else True,
             )
 
         # Buscar itens do carrinho
-        carrinho = Carrinho.objects.get(usuario=usuario)
-        itens = carrinho.itens.all()
+        carrinho = await Carrinho.objects.aget(usuario=usuario)
+        itens, _, _ = await aresumo_carrinho(carrinho)
 
         if not itens:
             return JsonResponse({'error': 'Carrinho vazio'}, status=400)
@@ -1229,7 +1307,7 @@ def create_checkout_session(request):
         # Criar line_items (produtos)
         line_items = []
         for item in itens:
-            preco_centavos = int(float(item.produto.preco_final()) * 100)
+            preco_centavos = int(item.produto.preco_final * 100)
 
             product_data = {'name': item.produto.nome}
             if item.produto.descricao and item.produto.descricao.strip():
@@ -1270,167 +1348,104 @@ def create_checkout_session(request):
         # Definir métodos de pagamento baseado na escolha
         payment_method_types = ['pix'] if metodo_pagamento == 'pix' else ['card']
 
+        # Reserva o estoque enquanto a sessão do Stripe estiver aberta
+        try:
+            reserva_lote, reserva_expira = await sync_to_async(reservar_itens)(
+                usuario, [(item.produto_id, item.quantidade) for item in itens]
+            )
+        except EstoqueInsuficiente as e:
+            nomes = ', '.join(item.produto.nome for item in itens if item.produto_id in e.faltando)
+            return JsonResponse({'error': f'Estoque insuficiente para: {nomes}'}, status=409)
+
         # URLs
         domain_url = request.build_absolute_uri('/')[:-1]
         success_url = domain_url + '/pagamento/sucesso/?session_id={CHECKOUT_SESSION_ID}'
         cancel_url = domain_url + '/checkout/'
 
-        # Criar sessão Stripe
-        checkout_session = stripe.checkout.Session.create(
-            payment_method_types=payment_method_types,
-            line_items=line_items,
-            mode='payment',
-            success_url=success_url,
-            cancel_url=cancel_url,
-            client_reference_id=str(usuario.id),
-            customer_email=usuario.email,
-            metadata={
-                'usuario_id': usuario.id,
-                'metodo_pagamento': metodo_pagamento,
-                'cep': cep,
-                'rua': rua,
-                'numero': numero,
-                'bairro': bairro,
-                'cidade': cidade,
-                'estado': estado,
-                'complemento': complemento,
-                'endereco_id': str(endereco.id) if endereco else '',
-                # 🔹 manter o frete salvo na sessão para uso no Pedido / debug
-                'frete_codigo': frete_codigo,
-                'frete_valor': frete_valor_str,
-            },
-        )
+        # Criar sessão Stripe (expira junto com a reserva)
+        try:
+            checkout_session = await stripe_criar_sessao(
+                payment_method_types=payment_method_types,
+                line_items=line_items,
+                mode='payment',
+                success_url=success_url,
+                cancel_url=cancel_url,
+                client_reference_id=str(usuario.id),
+                customer_email=usuario.email,
+                expires_at=int(reserva_expira.timestamp()),
+                metadata={
+                    # o webhook usa usuario_id/endereco_id/reserva_lote para montar o pedido
+                    'usuario_id': usuario.id,
+                    'reserva_lote': reserva_lote,
+                    'metodo_pagamento': metodo_pagamento,
+                    'cep': cep,
+                    'rua': rua,
+                    'numero': numero,
+                    'bairro': bairro,
+                    'cidade': cidade,
+                    'estado': estado,
+                    'complemento': complemento,
+                    'endereco_id': str(endereco.id) if endereco else '',
+                    # 🔹 manter o frete salvo na sessão para uso no Pedido / debug
+                    'frete_codigo': frete_codigo,
+                    'frete_valor': frete_valor_str,
+                },
+            )
+        except Exception:
+            # sessão não foi criada: devolve o estoque reservado
+            await sync_to_async(liberar_lote)(reserva_lote)
+            raise
+
+        # se o webhook se perder, a fila confere a sessão no Stripe quando ela vencer
+        await sync_to_async(agendar_conciliacao)(checkout_session.id, reserva_expira)
 
         return JsonResponse({'sessionId': checkout_session.id})
 
-    except Usuario.DoesNotExist:
-        return JsonResponse({'error': 'Usuário não encontrado'}, status=404)
     except Exception as e:
         print(f"Erro: {str(e)}")
         return JsonResponse({'error': str(e)}, status=400)
 
 
-def payment_success(request):
-    """Página de sucesso após pagamento"""
-    session_id = request.GET.get('session_id')
-    usuario_nome = request.session.get('usuario_nome')
-
-    if session_id:
-        try:
-            usuario_id = request.session.get('usuario_id')
-
-            if not usuario_id:
-                return redirect('login')
-
-            usuario = Usuario.objects.get(id=usuario_id)
-
-            # Recuperar sessão do Stripe
-            session = stripe.checkout.Session.retrieve(session_id)
-
-            # Verificar se o pagamento foi concluído
-            if session.payment_status == 'paid':
-                # Buscar carrinho
-                carrinho = Carrinho.objects.get(usuario=usuario)
-                itens_carrinho = carrinho.itens.all()
-
-                # Verificar se o pagamento foi concluído
-                if session.payment_status == 'paid':
-                    # Descobrir endereço usado no checkout
-                    meta = session.get('metadata', {}) or {}
-                    endereco_id = meta.get('endereco_id')
-
-                    endereco = None
-                    if endereco_id:
-                        endereco = Endereco.objects.filter(id=endereco_id, usuario=usuario).first()
-                    if not endereco:
-                        # fallback: principal ou primeiro endereço do usuário
-                        endereco = (
-                            Endereco.objects.filter(usuario=usuario, principal=True).first()
-                            or Endereco.objects.filter(usuario=usuario).first()
-                        )
-
-                    # Buscar carrinho
-                    carrinho = Carrinho.objects.get(usuario=usuario)
-                    itens_carrinho = carrinho.itens.all()
-
-                    # Criar pedido
-                    pedido = Pedido.objects.create(
-                        usuario=usuario,
-                        endereco=endereco,
-                        status='Pago'
-                    )
-
-
-                # Adicionar produtos ao pedido
-                for item in itens_carrinho:
-                    PedidoProduto.objects.create(
-                        pedido=pedido,
-                        produto=item.produto,
-                        quantidade=item.quantidade,
-                        preco_unitario=item.produto.preco_final()
-                    )
-
-                    # Atualizar estoque
-                    item.produto.q_estoque -= item.quantidade
-                    item.produto.save()
-
-                # Limpar carrinho
-                carrinho.itens.all().delete()
-
-                context = {
-                    'success': True,
-                    'pedido': pedido,
-                    'session_id': session_id,
-                    'total': session.amount_total / 100,
-                    'usuario_nome': usuario_nome,
-                }
-                return render(request, 'payment_success.html', context)
-            else:
-                context = {
-                    'success': False,
-                    'error': 'Pagamento ainda não foi concluído',
-                    'usuario_nome': usuario_nome,
-                }
-                return render(request, 'payment_success.html', context)
-
-        except Exception as e:
-            context = {
-                'success': False,
-                'error': str(e),
-                'usuario_nome': usuario_nome,
-            }
-            return render(request, 'payment_success.html', context)
-
-    return redirect('home')
-
-def _frete_simulado(peso_total: Decimal, cep_destino: str):
+async def payment_success(request):
     """
-    Fallback para TCC: se os Correios falharem, gera valores plausíveis.
+    Página de retorno do Stripe. Só consulta o pedido: quem cria o pedido é
+    o webhook (ver pagamentos.py). Se o webhook ainda não chegou, mostra
+    "confirmando pagamento" e a página se recarrega sozinha.
     """
-    peso_float = float(peso_total or Decimal('0.3'))
+    session_id = request.GET.get('session_id')
+    usuario_nome = await request.session.aget('usuario_nome')
 
-    base_pac = 15.0 + (peso_float * 5)      # ex: 0.3kg -> ~16.5
-    base_sedex = base_pac + 10.0           # sedex um pouco mais caro
+    if not session_id:
+        return redirect('home')
 
-    return [
-        {
-            "codigo": "PAC",
-            "nome": "PAC - (simulado)",
-            "valor": round(base_pac, 2),
-            "prazo_dias": 8,
-        },
-        {
-            "codigo": "SEDEX",
-            "nome": "SEDEX - (simulado)",
-            "valor": round(base_sedex, 2),
-            "prazo_dias": 3,
-        },
-    ]
+    usuario_id = await request.session.aget('usuario_id')
+    if not usuario_id:
+        return redirect('login')
 
+    pedido = await Pedido.objects.filter(
+        stripe_session_id=session_id, usuario_id=usuario_id
+    ).afirst()
+
+    if pedido:
+        context = {
+            'success': True,
+            'pedido': pedido,
+            'session_id': session_id,
+            'total': pedido.valor_pago,
+            'usuario_nome': usuario_nome,
+        }
+    else:
+        context = {
+            'success': False,
+            'pendente': True,
+            'session_id': session_id,
+            'usuario_nome': usuario_nome,
+        }
+    return render(request, 'payment_success.html', context)
 
 @usuario_login_required
 @require_POST
-def calcular_frete(request):
+async def calcular_frete(request):
     """
     Calcula frete usando:
       - CEP informado no POST (campo 'cep'), OU
@@ -1441,15 +1456,10 @@ def calcular_frete(request):
       - Se carrinho estiver vazio, mas vier 'produto_id' => usa peso do produto * quantidade
       - Senão => peso padrão 0.3kg
     """
-    usuario_id = request.session.get('usuario_id')
-    if not usuario_id:
+    usuario = await request.ausuario()
+    if not usuario:
         return JsonResponse({'error': 'Usuário não autenticado'}, status=401)
 
-    try:
-        usuario = Usuario.objects.get(id=usuario_id)
-    except Usuario.DoesNotExist:
-        return JsonResponse({'error': 'Usuário não encontrado'}, status=404)
-
     # ========= CEP DESTINO =========
     cep_param = (request.POST.get('cep') or '').strip()
 
@@ -1458,8 +1468,8 @@ def calcular_frete(request):
     else:
         # Tentar CEP do endereço principal do usuário
         endereco = (
-            usuario.enderecos.filter(principal=True).first()
-            or usuario.enderecos.first()
+            await usuario.enderecos.filter(principal=True).afirst()
+            or await usuario.enderecos.afirst()
         )
 
         if not endereco or not endereco.cep:
@@ -1479,9 +1489,9 @@ def calcular_frete(request):
     peso_total = None
 
     # 1) Primeiro tenta pelo carrinho
-    carrinho = Carrinho.objects.filter(usuario=usuario).first()
+    carrinho = await Carrinho.objects.filter(usuario=usuario).afirst()
     if carrinho:
-        itens = list(carrinho.itens.all())
+        itens = [item async for item in carrinho.itens.select_related('produto')]
         if itens:
             peso_total = Decimal('0.0')
             for item in itens:
@@ -1503,7 +1513,7 @@ def calcular_frete(request):
 
         if produto_id:
             try:
-                produto = Produto.objects.get(id=produto_id)
+                produto = await Produto.objects.aget(id=produto_id)
                 peso = getattr(produto, 'peso_kg', None)
                 if not peso:
                     peso = Decimal('0.3')
@@ -1515,28 +1525,33 @@ def calcular_frete(request):
     if peso_total is None:
         peso_total = Decimal('0.3')
 
-    # ========= CHAMAR CORREIOS / FALLBACK =========
-    opcoes = []
-
-    try:
-        opcoes = calcular_frete_correios(
-            cep_origem=cep_origem,
-            cep_destino=cep_destino,
-            peso_kg=peso_total
-        )
-    except Exception as e:
-        print('[FRETE] Exceção chamando Correios:', e)
-
-    if not opcoes:
-        print('[FRETE] Usando valores simulados de frete.')
-        opcoes = _frete_simulado(peso_total, cep_destino)
+    # ========= CORREIOS (com cache) / FALLBACK =========
+    # acotar_frete usa cache por faixa de peso e, se os Correios estiverem
+    # falhando, vai direto para o frete simulado (ver utils_frete.py)
+    opcoes = await acotar_frete(
+        cep_origem=cep_origem,
+        cep_destino=cep_destino,
+        peso_kg=peso_total
+    )
 
     return JsonResponse({'success': True, 'opcoes': opcoes})
 
 @csrf_exempt
+@require_POST
 def stripe_webhook(request):
-    # Por enquanto só responde 200 pra não quebrar nada.
-    # Depois a gente coloca a lógica do Stripe aqui.
+    """
+    Endpoint de webhooks do Stripe. Valida a assinatura e processa o evento
+    (criação do pedido, ativação de plano) uma única vez por evento.
+    """
+    assinatura = request.META.get('HTTP_STRIPE_SIGNATURE', '')
+    try:
+        evento = ler_evento(request.body, assinatura)
+    except (ValueError, stripe.error.SignatureVerificationError) as e:
+        print('[STRIPE] Webhook inválido:', e)
+        return HttpResponse(status=400)
+
+    if not processar_evento(evento):
+        print('[STRIPE] Evento repetido, ignorado:', evento['id'])
     return HttpResponse(status=200)
 
 #============================================================
@@ -1600,26 +1615,16 @@ def admin_dashboard(request):
     admin_id = request.session.get("admin_id")
     admin_user = AdminUser.objects.filter(id=admin_id).first()
 
-    usuarios = Usuario.objects.all()
-    produtos = Produto.objects.all()
-    pedidos = Pedido.objects.select_related('usuario').prefetch_related('itens__produto').order_by('-data_efetuado')
-
-    receita_total = sum(p.total() for p in pedidos) if pedidos else 0
-    usuarios_ativos = usuarios.count()
-    produtos_cadastrados = produtos.count()
-    hoje = now().date()
-    pedidos_hoje = pedidos.filter(data_efetuado__date=hoje).count()
-
-    for p in pedidos:
-        p.total_valor = p.total()
+    # Cards calculados no banco (ver metricas.py) + só os 5 últimos pedidos
+    metricas = metricas_dashboard()
 
     context = {
         'admin_username': admin_user.username if admin_user else 'Admin',
-        'dash_receita_total': receita_total,
-        'dash_usuarios_ativos': usuarios_ativos,
-        'dash_produtos_cadastrados': produtos_cadastrados,
-        'dash_pedidos_hoje': pedidos_hoje,
-        'ultimas_transacoes': pedidos[:5],
+        'dash_receita_total': metricas['receita_total'],
+        'dash_usuarios_ativos': metricas['usuarios_ativos'],
+        'dash_produtos_cadastrados': metricas['produtos_cadastrados'],
+        'dash_pedidos_hoje': metricas['pedidos_hoje'],
+        'ultimas_transacoes': ultimos_pedidos(5),
     }
     return render(request, 'admin/adm.html', context)
 
@@ -1817,8 +1822,10 @@ def admin_toggle_plano_ativo(request, plano_id):
             )
             return redirect("admin_planos")
 
-        # move usuários para o plano padrão
-        qtd = Usuario.objects.filter(plano=plano).update(plano=plano_default)
+        # move usuários para o plano padrão (update() não dispara signals)
+        movidos = list(Usuario.objects.filter(plano=plano).values_list('id', flat=True))
+        qtd = Usuario.objects.filter(id__in=movidos).update(plano=plano_default)
+        invalidar_usuarios(movidos)
 
         plano.ativo = False
         plano.save()
@@ -1859,10 +1866,12 @@ def admin_criar_categoria(request):
             messages.error(request, 'O nome da categoria é obrigatório.')
             return redirect('admin_categorias')
 
-        Categoria.objects.create(
+        categoria = Categoria.objects.create(
             nome=nome,
             imagem=imagem
         )
+        if imagem:
+            imagens.agendar_miniaturas(categoria)
 
         messages.success(request, 'Categoria criada com sucesso.')
         return redirect('admin_categorias')
@@ -1889,8 +1898,10 @@ def admin_editar_categoria(request, categoria_id):
 
         categoria.nome = nome
         if imagem:
-            categoria.imagem = imagem
+            imagens.trocar_imagem(categoria, imagem)
         categoria.save()
+        if imagem:
+            imagens.agendar_miniaturas(categoria)
 
         messages.success(request, 'Categoria atualizada com sucesso.')
         return redirect('admin_categorias')
@@ -1940,11 +1951,12 @@ def admin_usuarios(request):
     elif status == "inativo":
         usuarios_qs = usuarios_qs.filter(ativo=False)
 
-    usuarios_qs = usuarios_qs.order_by("nome")
+    pagina = paginar(request, usuarios_qs, ordenacao=("nome", "id"), por_pagina=50)
 
     context = {
         "admin_username": _get_admin_username(request),
-        "usuarios": usuarios_qs,
+        "usuarios": pagina.itens,
+        "pagina": pagina,
         "filtro_q": q,
         "filtro_status": status,
     }
@@ -1997,27 +2009,15 @@ def admin_usuario_detalhe(request, usuario_id):
         Q(loja=usuario.loja)
     ).select_related("categoria", "loja")
 
-    # Pedidos do usuário
+    # Pedidos do usuário (total_valor somado no banco, itens pré-carregados)
     pedidos = (
         Pedido.objects
         .filter(usuario=usuario)
-        .prefetch_related("itens__produto")
-        .order_by("-data_efetuado")
+        .com_totais()
+        .com_itens()
+        .order_by("-data_efetuado", "-id")
     )
 
-    # enriquecer pedidos com total e resumo
-    for p in pedidos:
-        p.total_valor = p.total()
-        itens = list(p.itens.all())
-        if itens:
-            nomes = [f"{item.produto.nome} (x{item.quantidade})" for item in itens]
-            if len(nomes) > 2:
-                p.produtos_resumo = ", ".join(nomes[:2]) + f" + {len(nomes) - 2} itens"
-            else:
-                p.produtos_resumo = ", ".join(nomes)
-        else:
-            p.produtos_resumo = "-"
-
     context = {
         "admin_username": _get_admin_username(request),
         "usuario_alvo": usuario,
@@ -2066,11 +2066,12 @@ def admin_produtos(request):
     elif status == "inativo":
         produtos_qs = produtos_qs.filter(ativo=False)
 
-    produtos_qs = produtos_qs.order_by("-id")
+    pagina = paginar(request, produtos_qs, ordenacao=("-id",), por_pagina=50)
 
     context = {
         "admin_username": _get_admin_username(request),
-        "produtos": produtos_qs,
+        "produtos": pagina.itens,
+        "pagina": pagina,
         "filtro_q": q,
         "filtro_status": status,
     }
@@ -2113,8 +2114,8 @@ def admin_produto_detalhe(request, produto_id):
         id=produto_id
     )
 
-    # Atributos dinâmicos
-    atributos = produto.atributos.select_related("atributo").all()
+    # Atributos dinâmicos (ficha técnica, sem join)
+    atributos = sorted(produto.ficha.items())
 
     # Pedidos em que este produto aparece
     itens_pedido = (
@@ -2124,10 +2125,10 @@ def admin_produto_detalhe(request, produto_id):
         .order_by("-pedido__data_efetuado")
     )
 
-    # Resumo de vendas desse produto
-    resumo = itens_pedido.aggregate(
+    # Resumo de vendas desse produto (lido do consolidado diário)
+    resumo = VendaDiaria.objects.filter(produto=produto).aggregate(
         total_quantidade=Sum("quantidade"),
-        total_faturado=Sum(F("quantidade") * F("preco_unitario")),
+        total_faturado=Sum("faturamento"),
     )
 
     total_quantidade = resumo["total_quantidade"] or 0
@@ -2145,39 +2146,26 @@ def admin_produto_detalhe(request, produto_id):
 
 @admin_required
 def admin_transacoes(request):
-    # Carrega pedidos com usuário e itens/produtos
-    pedidos = (
+    # Carrega pedidos com usuário, totais e itens/produtos (só a página atual)
+    pedidos_qs = (
         Pedido.objects
         .select_related('usuario')
-        .prefetch_related('itens__produto')
-        .order_by('-data_efetuado')
+        .com_totais()
+        .com_itens()
     )
+    pagina = paginar(request, pedidos_qs, ordenacao=('-data_efetuado', '-id'), por_pagina=50)
+    pedidos = pagina.itens
 
     # Total de transações (quantidade)
-    total_transacoes = pedidos.count()
-
-    # Total em dinheiro (somando Pedido.total())
-    total_valor = Decimal('0.00')
-    for p in pedidos:
-        total_valor += p.total()
+    total_transacoes = Pedido.objects.count()
 
-    # Enriquecer cada pedido com total_valor e um resumo de produtos
-    for p in pedidos:
-        p.total_valor = p.total()
-
-        itens = list(p.itens.all())
-        if itens:
-            nomes = [f"{item.produto.nome} (x{item.quantidade})" for item in itens]
-            if len(nomes) > 2:
-                p.produtos_resumo = ", ".join(nomes[:2]) + f" + {len(nomes) - 2} itens"
-            else:
-                p.produtos_resumo = ", ".join(nomes)
-        else:
-            p.produtos_resumo = "-"
+    # Total em dinheiro, lido do consolidado diário de vendas
+    total_valor = VendaDiaria.objects.aggregate(total=Sum('faturamento'))['total'] or Decimal('0.00')
 
     context = {
         "admin_username": _get_admin_username(request),
         "pedidos": pedidos,
+        "pagina": pagina,
         "total_transacoes": total_transacoes,
         "total_valor": total_valor,
     }
@@ -0,0 +1,27 @@
+# gunicorn.conf.py
+# Produção: gunicorn gerenciando workers uvicorn (ASGI).
+# As views async (frete, checkout Stripe) esperam a rede sem ocupar o worker.
+#
+# Uso (na raiz do projeto, o gunicorn lê este arquivo sozinho):
+#   gunicorn
+import multiprocessing
+import os
+
+wsgi_app = 'projeto.asgi:application'
+worker_class = 'uvicorn_worker.UvicornWorker'
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# cada worker tem seu pool de até DB_POOL_MAX conexões (settings_prod.py):
+# WEB_CONCURRENCY x DB_POOL_MAX precisa caber no limite de conexões do Postgres
+
+# Correios/Stripe lentos não devem derrubar o worker antes do timeout deles
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = 30
+keepalive = 5
+
+# Recicla workers de tempos em tempos (evita crescimento de memória)
+max_requests = 1000
+max_requests_jitter = 100
+
+accesslog = '-'
@@ -48,11 +48,13 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'freepigeon.middleware.ConsultasMiddleware',  # queries por requisição / N+1 (só com DEBUG)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'freepigeon.middleware.UsuarioMiddleware',  # request.usuario (login por sessão)
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -78,6 +80,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'projeto.wsgi.application'
+ASGI_APPLICATION = 'projeto.asgi.application'
 
 
 # Database
@@ -91,6 +94,9 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
         'PORT': os.getenv('DB_PORT'),
+        # runserver é WSGI: conexão persistente, testada antes de reutilizar
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
@@ -152,6 +158,36 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'    # onde o collectstatic junta tudo (dep
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Onde ficam os uploads (freepigeon/midia.py):
+#   MEDIA_STORAGE=local: disco (MEDIA_ROOT), servidos por freepigeon.midia.servir_midia
+#     com cache longo, ETag e Range;
+#   MEDIA_STORAGE=s3: bucket S3 ou compatível (MinIO, R2...) via django-storages
+#     (pip install django-storages[s3]); o bucket/CDN entrega, com o Cache-Control
+#     gravado em cada objeto. MEDIA_S3_ENDPOINT aponta para o MinIO local, por exemplo.
+MEDIA_STORAGE = os.getenv('MEDIA_STORAGE', 'local')
+if MEDIA_STORAGE == 's3':
+    ARMAZENAMENTO_MIDIA = {
+        'BACKEND': 'storages.backends.s3.S3Storage',
+        'OPTIONS': {
+            'bucket_name': os.getenv('MEDIA_S3_BUCKET', ''),
+            'endpoint_url': os.getenv('MEDIA_S3_ENDPOINT') or None,
+            'custom_domain': os.getenv('MEDIA_S3_DOMINIO') or None,  # CDN na frente do bucket
+            'access_key': os.getenv('MEDIA_S3_ACCESS_KEY', ''),
+            'secret_key': os.getenv('MEDIA_S3_SECRET_KEY', ''),
+            'region_name': os.getenv('MEDIA_S3_REGIAO') or None,
+            'querystring_auth': False,   # imagens públicas: URL estável, cacheável
+            'file_overwrite': False,     # como no disco: nome repetido ganha sufixo
+            'object_parameters': {'CacheControl': 'public, max-age=31536000, immutable'},
+        },
+    }
+else:
+    ARMAZENAMENTO_MIDIA = {'BACKEND': 'django.core.files.storage.FileSystemStorage'}
+
+STORAGES = {
+    'default': ARMAZENAMENTO_MIDIA,
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
 # Configurações do Stripe
 STRIPE_LIVE_PUBLIC_KEY = os.getenv('STRIPE_LIVE_PUBLIC_KEY', default='')
 STRIPE_LIVE_SECRET_KEY = os.getenv('STRIPE_LIVE_SECRET_KEY', default='')
@@ -159,6 +195,14 @@ STRIPE_TEST_PUBLIC_KEY = os.getenv('STRIPE_TEST_PUBLIC_KEY', default='')
 STRIPE_TEST_SECRET_KEY = os.getenv('STRIPE_TEST_SECRET_KEY', default='')
 STRIPE_LIVE_MODE = os.getenv('STRIPE_LIVE_MODE', 'False') == 'True'
 
+# Segredo de assinatura do endpoint /webhook/ (whsec_...)
+STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET', default='')
+
+# Minutos que o estoque fica reservado durante o checkout (a sessão do
+# Stripe expira junto; ele exige no mínimo 30 a partir da criação, então
+# valores abaixo de 31 viram 31). Vencidas: manage.py expirar_reservas
+RESERVA_MINUTOS = 31
+
 # Configurações adicionais do dj-stripe
 DJSTRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET', default='')
 DJSTRIPE_FOREIGN_KEY_TO_FIELD = 'id'
@@ -185,7 +229,62 @@ LOGIN_REDIRECT_URL = 'google_login_redirect'
 LOGIN_URL = 'login'
 LOGOUT_REDIRECT_URL = 'home'
 
+# Cache compartilhado entre processos (ver freepigeon/cache.py).
+# CACHE_URL=redis://localhost:6379/1 ou memcached://localhost:11211 para
+# testar como em produção; sem ela, LocMem (um cache por processo).
+CACHE_URL = os.getenv('CACHE_URL', '')
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_URL,
+        'KEY_PREFIX': 'freepigeon-dev',
+    }}
+elif CACHE_URL.startswith('memcached://'):
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': CACHE_URL.removeprefix('memcached://'),
+        'KEY_PREFIX': 'freepigeon-dev',
+    }}
+else:
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'freepigeon',
+    }}
+
+# Cache do usuário logado (request.usuario), em segundos. 0 desliga.
+USUARIO_CACHE_TTL = 60
+
+# Fragmentos da vitrine (home), em segundos. Invalidados pela versão do catálogo.
+CATALOGO_CACHE_TTL = 60 * 60
+
+# Contagem de queries por requisição (headers X-Consultas-* e log [CONSULTAS]).
+# A mesma query repetida CONSULTAS_N_MAIS_1 vezes é marcada como suspeita de N+1.
+CONSULTAS_INSTRUMENTAR = DEBUG
+CONSULTAS_N_MAIS_1 = 3
+
+# Fila de tarefas em segundo plano (freepigeon/tarefas.py): miniaturas,
+# consolidado de vendas, conciliação do Stripe. Quem executa é o worker
+# 'manage.py processar_tarefas'. TAREFAS_SINCRONAS=True roda cada tarefa logo
+# após o commit, no próprio processo (padrão aqui, para o runserver bastar;
+# tarefas com atraso, como a conciliação, ainda esperam um worker).
+TAREFAS_SINCRONAS = os.getenv('TAREFAS_SINCRONAS', 'True') == 'True'
+# 'executando' há mais que isso (segundos): o worker morreu, volta para a fila
+TAREFAS_TIMEOUT = 15 * 60
+# Concluídas são apagadas depois de tantos dias (as que falharam ficam)
+TAREFAS_MANTER_DIAS = 7
+
 # Correios
 
 CORREIOS_CEP_ORIGEM = '01311923'  # CEP de origem padrão para cálculo de frete
 
+# Webservice e timeout (segundos) por serviço. A URL pode apontar para um stub local em testes.
+CORREIOS_URL = os.getenv('CORREIOS_URL', 'https://ws.correios.com.br/calculador/CalcPrecoPrazo.asmx/CalcPrecoPrazo')
+CORREIOS_TIMEOUT = int(os.getenv('CORREIOS_TIMEOUT', '5'))
+
+# Cache de cotações (segundos) e circuit breaker: após N falhas dentro da
+# janela, usa o frete simulado direto durante a espera.
+FRETE_CACHE_TTL = 60 * 60 * 6
+FRETE_CIRCUITO_FALHAS = 3
+FRETE_CIRCUITO_JANELA = 60
+FRETE_CIRCUITO_ESPERA = 120
+
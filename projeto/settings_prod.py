@@ -40,11 +40,13 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # <--- importante em produção
+    'freepigeon.middleware.ConsultasMiddleware',  # queries por requisição / N+1 (staging)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'freepigeon.middleware.UsuarioMiddleware',  # request.usuario (login por sessão)
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -69,14 +71,56 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'projeto.wsgi.application'
+ASGI_APPLICATION = 'projeto.asgi.application'
 
 # ==========================
 # DATABASE (Render)
 # ==========================
 
+# Abrir conexão com o Postgres do Render (TLS) custa dezenas de ms; não
+# fazer isso a cada requisição. Modos, via variáveis de ambiente:
+#
+#   DB_POOL=True (padrão): pool do psycopg 3 em cada worker (Django 5.1+).
+#     É o indicado para ASGI (gunicorn + uvicorn), onde conexões
+#     persistentes (CONN_MAX_AGE) não são reaproveitadas entre requisições.
+#     DB_POOL_MIN / DB_POOL_MAX conexões por worker e DB_POOL_TIMEOUT
+#     (segundos esperando uma conexão livre). Total no Postgres: até
+#     WEB_CONCURRENCY x DB_POOL_MAX.
+#   DB_PGBOUNCER=True: o pool fica no PgBouncer (modo transaction). Desliga
+#     o pool daqui e os cursores do lado do servidor, que não funcionam
+#     através dele (prepared statements o Django já deixa desligados).
+#   DB_POOL=False: conexão persistente por DB_CONN_MAX_AGE segundos (WSGI).
+#
+# DB_CONN_HEALTH_CHECKS=True (padrão): testa a conexão antes de reutilizar
+# (no pool, ao entregar a conexão), para não falhar a requisição quando o
+# Postgres ou o PgBouncer derrubou a conexão parada.
+DB_POOL = os.getenv('DB_POOL', 'True') == 'True'
+DB_PGBOUNCER = os.getenv('DB_PGBOUNCER', 'False') == 'True'
+DB_CONN_HEALTH_CHECKS = os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+
+if DB_PGBOUNCER or DB_POOL:
+    # pool (daqui ou do PgBouncer) não combina com conexão persistente
+    DB_CONN_MAX_AGE = 0
+else:
+    DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', '600'))
+
 DATABASES = {
-    'default': dj_database_url.config(default=os.getenv('DATABASE_URL'))
+    'default': dj_database_url.config(
+        default=os.getenv('DATABASE_URL'),
+        conn_max_age=DB_CONN_MAX_AGE,
+        conn_health_checks=DB_CONN_HEALTH_CHECKS,
+    )
 }
+DATABASES['default'].setdefault('OPTIONS', {})
+
+if DB_PGBOUNCER:
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+elif DB_POOL:
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.getenv('DB_POOL_MIN', '1')),
+        'max_size': int(os.getenv('DB_POOL_MAX', '4')),
+        'timeout': int(os.getenv('DB_POOL_TIMEOUT', '10')),
+    }
 
 # ==========================
 # SENHAS
@@ -120,10 +164,38 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Onde ficam os uploads (freepigeon/midia.py):
+#   MEDIA_STORAGE=local: disco (MEDIA_ROOT), servidos por freepigeon.midia.servir_midia
+#     com cache longo, ETag e Range;
+#   MEDIA_STORAGE=s3: bucket S3 ou compatível (MinIO, R2...) via django-storages
+#     (pip install django-storages[s3]); o bucket/CDN entrega, com o Cache-Control
+#     gravado em cada objeto. MEDIA_S3_ENDPOINT aponta para o MinIO local, por exemplo.
+MEDIA_STORAGE = os.getenv('MEDIA_STORAGE', 'local')
+if MEDIA_STORAGE == 's3':
+    ARMAZENAMENTO_MIDIA = {
+        'BACKEND': 'storages.backends.s3.S3Storage',
+        'OPTIONS': {
+            'bucket_name': os.getenv('MEDIA_S3_BUCKET', ''),
+            'endpoint_url': os.getenv('MEDIA_S3_ENDPOINT') or None,
+            'custom_domain': os.getenv('MEDIA_S3_DOMINIO') or None,  # CDN na frente do bucket
+            'access_key': os.getenv('MEDIA_S3_ACCESS_KEY', ''),
+            'secret_key': os.getenv('MEDIA_S3_SECRET_KEY', ''),
+            'region_name': os.getenv('MEDIA_S3_REGIAO') or None,
+            'querystring_auth': False,   # imagens públicas: URL estável, cacheável
+            'file_overwrite': False,     # como no disco: nome repetido ganha sufixo
+            'object_parameters': {'CacheControl': 'public, max-age=31536000, immutable'},
+        },
+    }
+else:
+    ARMAZENAMENTO_MIDIA = {'BACKEND': 'django.core.files.storage.FileSystemStorage'}
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-# Whitenoise para arquivos estáticos em produção
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+STORAGES = {
+    'default': ARMAZENAMENTO_MIDIA,
+    # Whitenoise para arquivos estáticos em produção
+    'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'},
+}
 
 # ==========================
 # STRIPE
@@ -135,6 +207,14 @@ STRIPE_TEST_PUBLIC_KEY = os.getenv('STRIPE_TEST_PUBLIC_KEY', default='')
 STRIPE_TEST_SECRET_KEY = os.getenv('STRIPE_TEST_SECRET_KEY', default='')
 STRIPE_LIVE_MODE = os.getenv('STRIPE_LIVE_MODE', 'False') == 'True'
 
+# Segredo de assinatura do endpoint /webhook/ (whsec_...)
+STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET', default='')
+
+# Minutos que o estoque fica reservado durante o checkout (a sessão do
+# Stripe expira junto; ele exige no mínimo 30 a partir da criação, então
+# valores abaixo de 31 viram 31). Vencidas: manage.py expirar_reservas
+RESERVA_MINUTOS = 31
+
 DJSTRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET', default='')
 DJSTRIPE_FOREIGN_KEY_TO_FIELD = 'id'
 
@@ -156,8 +236,72 @@ LOGIN_REDIRECT_URL = 'google_login_redirect'
 LOGIN_URL = 'login'
 LOGOUT_REDIRECT_URL = 'home'
 
+# ==========================
+# CACHE
+# ==========================
+
+# Um cache só para todos os workers (ver freepigeon/cache.py):
+#   CACHE_URL=redis://host:6379/0 (ou rediss://) -> Redis
+#   CACHE_URL=memcached://host:11211            -> Memcached (pymemcache)
+# Sem CACHE_URL: LocMem, um cache por processo. A trava de recálculo de
+# cache.buscar (cache.add) e o invalidar() só valem dentro do processo:
+# com vários workers do gunicorn cada um recalcula a sua cópia e vê a
+# invalidação dos outros só quando o ttl vence. Use Redis em produção.
+# (FileBasedCache não serve: o add() dele não é atômico entre processos.)
+CACHE_URL = os.getenv('CACHE_URL', '')
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_URL,
+        'KEY_PREFIX': 'freepigeon',
+    }}
+elif CACHE_URL.startswith('memcached://'):
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': CACHE_URL.removeprefix('memcached://'),
+        'KEY_PREFIX': 'freepigeon',
+    }}
+else:
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'freepigeon',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }}
+
+# Cache do usuário logado (request.usuario), em segundos. 0 desliga.
+USUARIO_CACHE_TTL = 60
+
+# Fragmentos da vitrine (home), em segundos. Invalidados pela versão do catálogo.
+CATALOGO_CACHE_TTL = 60 * 60
+
+# Contagem de queries por requisição (headers X-Consultas-* e log [CONSULTAS]).
+# Desligado em produção; ligar no staging com CONSULTAS_INSTRUMENTAR=True.
+CONSULTAS_INSTRUMENTAR = os.getenv('CONSULTAS_INSTRUMENTAR', 'False') == 'True'
+CONSULTAS_N_MAIS_1 = 3
+
+# Fila de tarefas em segundo plano (freepigeon/tarefas.py): miniaturas,
+# consolidado de vendas, conciliação do Stripe. Quem executa é o worker
+# 'manage.py processar_tarefas'. TAREFAS_SINCRONAS=True roda cada tarefa logo
+# após o commit, no próprio processo (para usar sem worker).
+TAREFAS_SINCRONAS = os.getenv('TAREFAS_SINCRONAS', 'False') == 'True'
+# 'executando' há mais que isso (segundos): o worker morreu, volta para a fila
+TAREFAS_TIMEOUT = 15 * 60
+# Concluídas são apagadas depois de tantos dias (as que falharam ficam)
+TAREFAS_MANTER_DIAS = 7
+
 # ==========================
 # CORREIOS
 # ==========================
 
 CORREIOS_CEP_ORIGEM = '01311923'
+
+# Webservice e timeout (segundos) por serviço. A URL pode apontar para um stub local em testes.
+CORREIOS_URL = os.getenv('CORREIOS_URL', 'https://ws.correios.com.br/calculador/CalcPrecoPrazo.asmx/CalcPrecoPrazo')
+CORREIOS_TIMEOUT = int(os.getenv('CORREIOS_TIMEOUT', '5'))
+
+# Cache de cotações (segundos) e circuit breaker: após N falhas dentro da
+# janela, usa o frete simulado direto durante a espera.
+FRETE_CACHE_TTL = 60 * 60 * 6
+FRETE_CIRCUITO_FALHAS = 3
+FRETE_CIRCUITO_JANELA = 60
+FRETE_CIRCUITO_ESPERA = 120
@@ -14,14 +14,22 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
 from django.conf import settings
-from django.conf.urls.static import static
-from django.urls import path, include
+from django.urls import path, include, re_path
+
+from freepigeon.midia import servir_midia
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('freepigeon.urls')),
 ]
 
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Uploads no disco: servidos com cache longo/ETag/Range (também fora do DEBUG).
+# No S3 quem entrega é o bucket/CDN.
+if getattr(settings, 'MEDIA_STORAGE', 'local') == 'local':
+    urlpatterns += [
+        re_path(rf'^{re.escape(settings.MEDIA_URL.lstrip("/"))}(?P<caminho>.+)$', servir_midia, name='midia'),
+    ]